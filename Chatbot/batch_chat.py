@@ -0,0 +1,90 @@
+# Bulk answers to opening chat messages through the OpenAI Batch API
+import argparse
+import csv
+import json
+import sys
+
+import repo_path  # noqa: F401 (puts the repo root on sys.path for `shared`)
+
+from chat import DEFAULT_MAX_TOKENS, DEFAULT_MODEL, DEFAULT_TEMPERATURE, opening_request
+from shared import metrics
+from shared.batch import add_arguments, completion_text, custom_id, pipeline_from_args
+
+NAMESPACE = "chat"
+
+
+def read_prompts(path):
+    """Prompt rows from a CSV or JSONL with a prompt column (and optionally id), or a text file with one per line"""
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.lower().endswith((".jsonl", ".ndjson")):
+            rows = [json.loads(line) for line in f if line.strip()]
+        elif path.lower().endswith(".csv"):
+            rows = list(csv.DictReader(f))
+        else:
+            rows = [{"prompt": line.strip()} for line in f if line.strip()]
+    prompts = []
+    for index, row in enumerate(rows, 1):
+        prompt = (row.get("prompt") or "").strip()
+        if not prompt:
+            print(f"Skipping row {index}: no prompt", file=sys.stderr)
+            continue
+        prompts.append({"id": str(row.get("id") or f"row-{index}"), "prompt": prompt})
+    return prompts
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Answer opening chat messages in bulk with the OpenAI Batch API; the chatbot reuses the answers"
+    )
+    parser.add_argument("prompts", help="CSV or JSONL with a prompt column (and optionally id), or a text file with one prompt per line")
+    parser.add_argument("-o", "--output", default="chat_replies.jsonl", help="Replies as JSONL (default: chat_replies.jsonl)")
+    parser.add_argument("--model", default=DEFAULT_MODEL)
+    parser.add_argument("--temperature", type=float, default=DEFAULT_TEMPERATURE, help="Match the app's slider to reuse answers there")
+    parser.add_argument("--max-tokens", type=int, default=DEFAULT_MAX_TOKENS, help="Match the app's slider to reuse answers there")
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    targets = {}
+    requests = []
+    for row in read_prompts(args.prompts):
+        # Exactly the request the chatbot sends for this first message, so it's answered from the store
+        body = opening_request(row["prompt"], model=args.model, temperature=args.temperature, max_tokens=args.max_tokens)
+        targets.setdefault(custom_id(NAMESPACE, body), []).append(row)
+        requests.append((NAMESPACE, body))
+
+    metrics.set_app("chatbot_batch")
+    pipeline = pipeline_from_args(args)
+    answered = 0
+    failures = 0
+    written = set()
+    with open(args.output, "w", encoding="utf-8") as output:
+        def write(key, body):
+            nonlocal answered
+            if key in written:
+                return
+            written.add(key)
+            for row in targets.get(key, []):
+                output.write(json.dumps({**row, "reply": completion_text(body)}, ensure_ascii=False) + "\n")
+                answered += 1
+            output.flush()
+
+        for key, body in pipeline.store.bodies(targets).items():
+            write(key, body)
+        for key, body, error in pipeline.run(requests, prefix=NAMESPACE, wait=not args.no_wait):
+            if key not in targets:
+                continue
+            if error is None:
+                write(key, body)
+            else:
+                failures += 1
+                print(f"Failed: {', '.join(row['id'] for row in targets[key])}: {error}", file=sys.stderr)
+
+    total = sum(len(rows) for rows in targets.values())
+    print(f"{answered}/{total} replies written to {args.output}, {failures} request(s) failed")
+    if answered < total:
+        print("Run the same command again to collect outstanding batches and retry failures.")
+    sys.exit(0 if answered == total else 1)
+
+
+if __name__ == "__main__":
+    main()
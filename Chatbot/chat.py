@@ -0,0 +1,135 @@
+# Chat requests, built the same way for the UI and for offline batches
+import re
+
+DEFAULT_MODEL = "gpt-3.5-turbo"
+DEFAULT_TEMPERATURE = 0.7
+DEFAULT_MAX_TOKENS = 150
+
+SYSTEM_MESSAGE = {"role": "system", "content": "You are a helpful assistant that remembers facts given during the conversation. When you learn new information about the user, acknowledge it and use it in future responses."}
+
+
+def extract_facts_from_text(text):
+    """Extract various types of facts from user input"""
+    facts = {}
+    text_lower = text.lower()
+    
+    # Name extraction (multiple patterns)
+    name_patterns = [
+        r"my name is (\w+)",
+        r"i'm (\w+)",
+        r"i am (\w+)",
+        r"call me (\w+)"
+    ]
+    
+    for pattern in name_patterns:
+        match = re.search(pattern, text_lower)
+        if match:
+            facts["name"] = match.group(1).capitalize()
+            break
+    
+    # Interest extraction
+    interest_patterns = [
+        r"i'm interested in (.+?)(?:\.|$)",
+        r"i like (.+?)(?:\.|$)",
+        r"i love (.+?)(?:\.|$)",
+        r"my hobby is (.+?)(?:\.|$)",
+        r"i enjoy (.+?)(?:\.|$)"
+    ]
+    
+    for pattern in interest_patterns:
+        match = re.search(pattern, text_lower)
+        if match:
+            interest = match.group(1).strip()
+            if "interests" not in facts:
+                facts["interests"] = []
+            if interest not in facts["interests"]:
+                facts["interests"] = facts.get("interests", []) + [interest]
+            break
+    
+    # Age extraction
+    age_match = re.search(r"i am (\d+) years old|i'm (\d+)", text_lower)
+    if age_match:
+        age = age_match.group(1) or age_match.group(2)
+        facts["age"] = age
+    
+    # Location extraction
+    location_patterns = [
+        r"i live in (.+?)(?:\.|$)",
+        r"i'm from (.+?)(?:\.|$)",
+        r"i am from (.+?)(?:\.|$)"
+    ]
+    
+    for pattern in location_patterns:
+        match = re.search(pattern, text_lower)
+        if match:
+            facts["location"] = match.group(1).strip().title()
+            break
+    
+    # Job/Profession extraction
+    job_patterns = [
+        r"i work as (.+?)(?:\.|$)",
+        r"i'm a (.+?)(?:\.|$)",
+        r"i am a (.+?)(?:\.|$)",
+        r"my job is (.+?)(?:\.|$)"
+    ]
+    
+    for pattern in job_patterns:
+        match = re.search(pattern, text_lower)
+        if match:
+            facts["profession"] = match.group(1).strip()
+            break
+    
+    return facts
+
+
+def remember(memory, new_facts):
+    """Merge newly extracted facts into the memory dict in place"""
+    for key, value in new_facts.items():
+        if key == "interests" and key in memory:
+            # Merge interests lists
+            existing_interests = memory[key] if isinstance(memory[key], list) else [memory[key]]
+            combined_interests = list(set(existing_interests + value))
+            memory[key] = combined_interests
+        else:
+            memory[key] = value
+    return memory
+
+
+def api_messages(messages, memory):
+    """The conversation as sent to the API, with what we know about the user injected after the system prompt"""
+    memory_context = ""
+    if memory:
+        memory_items = []
+        for k, v in memory.items():
+            if isinstance(v, list):
+                memory_items.append(f"{k}: {', '.join(v)}")
+            else:
+                memory_items.append(f"{k}: {v}")
+        memory_context = "What you know about the user:\n" + "\n".join(memory_items)
+
+    result = [messages[0]]
+    if memory_context:
+        result.append({"role": "system", "content": memory_context})
+    result.extend(messages[1:])
+    return result
+
+
+def chat_request(messages, memory, model=DEFAULT_MODEL, temperature=DEFAULT_TEMPERATURE, max_tokens=DEFAULT_MAX_TOKENS):
+    """Chat completion body for the next reply; its canonical hash identifies the result"""
+    return {"model": model, "messages": api_messages(messages, memory), "temperature": temperature, "max_tokens": max_tokens}
+
+
+def shareable(request):
+    """Whether identical concurrent requests may share one reply
+
+    Only deterministic requests (temperature 0) and opening messages, which batch_chat.py
+    answers once for everyone anyway; other sampled replies are each user's own.
+    """
+    user_turns = sum(1 for message in request["messages"] if message["role"] != "system")
+    return request.get("temperature") == 0 or user_turns == 1
+
+
+def opening_request(prompt, **options):
+    """The request a new conversation sends for its first message, as the UI builds it"""
+    memory = remember({}, extract_facts_from_text(prompt))
+    return chat_request([SYSTEM_MESSAGE, {"role": "user", "content": prompt}], memory, **options)
@@ -1,25 +1,35 @@
 # Import necessary libraries for building the chatbot app
 import streamlit as st
-import openai
-import os
-import re
 import json
 from datetime import datetime
-from dotenv import load_dotenv
 
-# Load API key from .env file and set it for OpenAI
-load_dotenv()
-openai.api_key = os.getenv("OPENAI_API_KEY")
+import repo_path  # noqa: F401 (puts the repo root on sys.path for `shared`)
+
+from chat import DEFAULT_MODEL, SYSTEM_MESSAGE, chat_request, extract_facts_from_text, remember, shareable
+from shared import metrics
+from shared.batch import cached_result, completion_text
+from shared.openai_client import get_client
+from shared.router import get_router
+from shared.scheduler import INTERACTIVE
+from shared.session_store import persist_session_state, save_session_state
+from shared.singleflight import get_singleflight
+from shared.startup import start_app
+
+# Label this rerun's metrics; once per process, load .env, expose /metrics (METRICS_PORT, by default per app)
+# and warm up the OpenAI client in the background
+start_app("chatbot", __file__)
 
 # Configure the Streamlit app
 st.set_page_config(page_title="Enhanced Chatbot with Memory", layout="centered", page_icon="🧠")
 st.title("🧠 Enhanced Chatbot with Memory")
 
+# Keep the conversation in the shared session store (SESSION_STORE_URL), so a page reload, a server
+# restart or another replica picks it up where it was left
+persist_session_state("chatbot", ("messages", "memory", "conversation_started"))
+
 # Initialize session state for chat messages and memory if not already present
 if "messages" not in st.session_state:
-    st.session_state.messages = [
-        {"role": "system", "content": "You are a helpful assistant that remembers facts given during the conversation. When you learn new information about the user, acknowledge it and use it in future responses."}
-    ]
+    st.session_state.messages = [SYSTEM_MESSAGE]
 
 if "memory" not in st.session_state:
     st.session_state.memory = {}
@@ -27,80 +37,6 @@ if "memory" not in st.session_state:
 if "conversation_started" not in st.session_state:
     st.session_state.conversation_started = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
-# Enhanced memory extraction function
-def extract_facts_from_text(text):
-    """Extract various types of facts from user input"""
-    facts = {}
-    text_lower = text.lower()
-    
-    # Name extraction (multiple patterns)
-    name_patterns = [
-        r"my name is (\w+)",
-        r"i'm (\w+)",
-        r"i am (\w+)",
-        r"call me (\w+)"
-    ]
-    
-    for pattern in name_patterns:
-        match = re.search(pattern, text_lower)
-        if match:
-            facts["name"] = match.group(1).capitalize()
-            break
-    
-    # Interest extraction
-    interest_patterns = [
-        r"i'm interested in (.+?)(?:\.|$)",
-        r"i like (.+?)(?:\.|$)",
-        r"i love (.+?)(?:\.|$)",
-        r"my hobby is (.+?)(?:\.|$)",
-        r"i enjoy (.+?)(?:\.|$)"
-    ]
-    
-    for pattern in interest_patterns:
-        match = re.search(pattern, text_lower)
-        if match:
-            interest = match.group(1).strip()
-            if "interests" not in facts:
-                facts["interests"] = []
-            if interest not in facts["interests"]:
-                facts["interests"] = facts.get("interests", []) + [interest]
-            break
-    
-    # Age extraction
-    age_match = re.search(r"i am (\d+) years old|i'm (\d+)", text_lower)
-    if age_match:
-        age = age_match.group(1) or age_match.group(2)
-        facts["age"] = age
-    
-    # Location extraction
-    location_patterns = [
-        r"i live in (.+?)(?:\.|$)",
-        r"i'm from (.+?)(?:\.|$)",
-        r"i am from (.+?)(?:\.|$)"
-    ]
-    
-    for pattern in location_patterns:
-        match = re.search(pattern, text_lower)
-        if match:
-            facts["location"] = match.group(1).strip().title()
-            break
-    
-    # Job/Profession extraction
-    job_patterns = [
-        r"i work as (.+?)(?:\.|$)",
-        r"i'm a (.+?)(?:\.|$)",
-        r"i am a (.+?)(?:\.|$)",
-        r"my job is (.+?)(?:\.|$)"
-    ]
-    
-    for pattern in job_patterns:
-        match = re.search(pattern, text_lower)
-        if match:
-            facts["profession"] = match.group(1).strip()
-            break
-    
-    return facts
-
 # Display the chatbot's memory in an enhanced expandable section
 with st.expander("📌 Memory Bank (what I remember about you)", expanded=False):
     if st.session_state.memory:
@@ -152,60 +88,60 @@ with st.sidebar:
     st.header("⚙️ Settings")
     temperature = st.slider("Response Creativity", 0.0, 1.0, 0.7, 0.1)
     max_tokens = st.slider("Max Response Length", 50, 500, 150)
+    # Per-message model choice from shared/router.py (ROUTER_CONFIG); not kept in the session store
+    if "last_model" in st.session_state:
+        st.caption(f"🧭 Last reply: {st.session_state.last_model}")
 
 # Main chat interface
 st.markdown("### 💬 Chat with me!")
 
-# User input for chat
-user_input = st.text_input("💬 You:", key="input", placeholder="Tell me about yourself or ask me anything...")
+# User input for chat: move each submission out of the widget so it's handled exactly once
+# (otherwise the st.rerun() after a reply would resend the same message forever)
+def submit_input():
+    st.session_state.pending_input = st.session_state.input
+    st.session_state.input = ""
+
+st.text_input("💬 You:", key="input", placeholder="Tell me about yourself or ask me anything...", on_change=submit_input)
+user_input = st.session_state.pop("pending_input", "")
 
 if user_input:
     # Add user message to the conversation history
     st.session_state.messages.append({"role": "user", "content": user_input})
     
     # Extract and store facts from user input for memory
-    new_facts = extract_facts_from_text(user_input)
+    with metrics.span("extract_facts"):
+        new_facts = extract_facts_from_text(user_input)
     
     # Update memory with new facts
-    for key, value in new_facts.items():
-        if key == "interests" and key in st.session_state.memory:
-            # Merge interests lists
-            existing_interests = st.session_state.memory[key] if isinstance(st.session_state.memory[key], list) else [st.session_state.memory[key]]
-            combined_interests = list(set(existing_interests + value))
-            st.session_state.memory[key] = combined_interests
-        else:
-            st.session_state.memory[key] = value
-    
-    # Create enhanced memory context for the AI
-    memory_context = ""
-    if st.session_state.memory:
-        memory_items = []
-        for k, v in st.session_state.memory.items():
-            if isinstance(v, list):
-                memory_items.append(f"{k}: {', '.join(v)}")
-            else:
-                memory_items.append(f"{k}: {v}")
-        memory_context = "What you know about the user:\n" + "\n".join(memory_items)
-    
-    memory_injection = {"role": "system", "content": memory_context} if memory_context else None
+    remember(st.session_state.memory, new_facts)
     
-    # Prepare messages for API call
-    api_messages = [st.session_state.messages[0]]
-    if memory_injection:
-        api_messages.append(memory_injection)
-    api_messages.extend(st.session_state.messages[1:])
+    # The conversation with the memory context injected, as sent to the API; the router picks the
+    # model from its length and the models' recent latency once we know the API is needed
+    router = get_router()
+    request = chat_request(st.session_state.messages, st.session_state.memory, DEFAULT_MODEL, temperature, max_tokens)
     
     # Get assistant's reply from OpenAI API with error handling
     try:
-        with st.spinner("🤔 Thinking..."):
-            response = openai.ChatCompletion.create(
-                model="gpt-3.5-turbo",
-                messages=api_messages,
-                temperature=temperature,
-                max_tokens=max_tokens
-            )
+        with st.spinner("🤔 Thinking..."), metrics.span("chat_completion", messages=len(request["messages"])):
+            # Opening messages answered ahead of time by batch_chat.py come straight from its results,
+            # whichever of the route's models (or the batch default) answered them
+            cached = cached_result("chat", request, router.candidates("chat") + [DEFAULT_MODEL])
+            if cached:
+                reply = completion_text(cached)
+                st.session_state.last_model = f"{cached.get('model', DEFAULT_MODEL)} (batch)"
+            else:
+                route = router.choose("chat", request["messages"], max_tokens)
+                create = get_client().chat.completions.create
+                if shareable(request):
+                    # Identical in-flight requests (e.g. the same opening question) share one API call,
+                    # whichever model each of them would have been routed to
+                    response = get_singleflight().do("chat", request, router.call, create, route, priority=INTERACTIVE, **request)
+                else:
+                    # A sampled reply mid-conversation is this user's own
+                    response = router.call(create, route, priority=INTERACTIVE, **request)
+                reply = response.choices[0].message.content
+                st.session_state.last_model = response.model
         
-        reply = response.choices[0].message.content
         st.session_state.messages.append({"role": "assistant", "content": reply})
         
         # Show success message if new facts were learned
@@ -236,31 +172,40 @@ if len(st.session_state.messages) > 1:
     st.markdown("---")
     col1, col2, col3 = st.columns(3)
     
-    with col1:
-        # Download chat as text
-        full_chat = f"Chatbot Conversation - {st.session_state.conversation_started}\n"
+    # Exports are only built when a download button is clicked, not on every rerun
+    messages = st.session_state.messages[1:]
+    conversation_started = st.session_state.conversation_started
+    memory = st.session_state.memory
+
+    def chat_as_text():
+        full_chat = f"Chatbot Conversation - {conversation_started}\n"
         full_chat += "=" * 50 + "\n\n"
-        for msg in st.session_state.messages[1:]:
+        for msg in messages:
             role = "You" if msg["role"] == "user" else "Bot"
             full_chat += f"{role}: {msg['content']}\n\n"
-        
+        return full_chat
+
+    def chat_as_json():
+        chat_data = {
+            "conversation_started": conversation_started,
+            "messages": messages,
+            "memory": memory
+        }
+        return json.dumps(chat_data, indent=2)
+
+    with col1:
+        # Download chat as text
         st.download_button(
             "⬇️ Download Chat",
-            full_chat,
+            chat_as_text,
             file_name=f"chat_history_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
         )
     
     with col2:
         # Download as JSON
-        chat_data = {
-            "conversation_started": st.session_state.conversation_started,
-            "messages": st.session_state.messages[1:],
-            "memory": st.session_state.memory
-        }
-        
         st.download_button(
             "📊 Download JSON",
-            json.dumps(chat_data, indent=2),
+            chat_as_json,
             file_name=f"chat_data_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
             mime="application/json"
         )
@@ -284,3 +229,6 @@ st.markdown(
     """,
     unsafe_allow_html=True
 )
+
+# Queue what this run changed for the session store
+save_session_state("chatbot")
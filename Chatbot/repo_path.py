@@ -0,0 +1,8 @@
+# Puts the repository root on sys.path, so this app's scripts, pages and command-line tools can
+# import the shared package: `import repo_path` before any `from shared import ...`
+import sys
+from pathlib import Path
+
+REPO_ROOT = str(Path(__file__).resolve().parent.parent)
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
@@ -0,0 +1,181 @@
+# Headless bulk image generation from a CSV or JSONL prompt file
+import argparse
+import csv
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+from dotenv import load_dotenv
+
+import repo_path  # noqa: F401 (puts the repo root on sys.path for `shared`)
+
+from generator import DEFAULT_MODEL, download_image_to, request_images
+from shared import metrics
+from shared.openai_client import configure
+from shared.scheduler import BATCH, get_scheduler
+
+
+def default_id(row):
+    """Id for a row without one, from what it generates, so it survives edits elsewhere in the file"""
+    settings = json.dumps([row["prompt"], row["size"], row["quality"], row["style"]], ensure_ascii=False)
+    return "p-" + hashlib.sha256(settings.encode()).hexdigest()[:16]
+
+
+def read_prompts(path, defaults):
+    """Load prompt rows from CSV or JSONL, filling missing settings from the defaults
+
+    Raises ValueError when two rows share an id, since they would overwrite each other's files.
+    """
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.lower().endswith((".jsonl", ".ndjson")):
+            rows = [json.loads(line) for line in f if line.strip()]
+        else:
+            rows = list(csv.DictReader(f))
+
+    prompts = []
+    seen = {}
+    for index, row in enumerate(rows, 1):
+        prompt = row.get("prompt") if isinstance(row, dict) else None
+        if prompt is not None and not isinstance(prompt, str):
+            print(f"Skipping row {index}: prompt must be a string, not {type(prompt).__name__}", file=sys.stderr)
+            continue
+        prompt = (prompt or "").strip()
+        if not prompt:
+            print(f"Skipping row {index}: no prompt", file=sys.stderr)
+            continue
+        entry = {
+            "prompt": prompt,
+            "size": row.get("size") or defaults["size"],
+            "quality": row.get("quality") or defaults["quality"],
+            "style": row.get("style") or defaults["style"]
+        }
+        if row.get("id") not in (None, ""):
+            entry["id"] = str(row["id"])
+        else:
+            entry["id"] = default_id(entry)
+            if entry["id"] in seen:
+                # The same prompt and settings again: one generation covers both
+                print(f"Skipping row {index}: same prompt and settings as row {seen[entry['id']]}", file=sys.stderr)
+                continue
+        if entry["id"] in seen:
+            raise ValueError(f"Rows {seen[entry['id']]} and {index} both have id {entry['id']!r}")
+        seen[entry["id"]] = index
+        prompts.append({"id": entry.pop("id"), **entry})
+    return prompts
+
+
+def load_manifest(path):
+    """Return the ids already completed according to an existing manifest"""
+    done = set()
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # A line cut short by an interrupted run
+                if entry.get("status") == "done":
+                    done.add(entry["id"])
+    return done
+
+
+def safe_filename(row_id):
+    return re.sub(r"[^A-Za-z0-9_.-]", "_", row_id)
+
+
+def generate_row(row, output_dir, model):
+    """Generate one prompt row and stream its image(s) to disk"""
+    started = time.perf_counter()
+    files, revised_prompts = [], []
+    with metrics.span("batch_row", row=row["id"]):
+        records = request_images(
+            row["prompt"], size=row["size"], quality=row["quality"], style=row["style"], model=model, priority=BATCH
+        )
+        for i, image_data in enumerate(records):
+            suffix = f"_{i+1}" if len(records) > 1 else ""
+            path = os.path.join(output_dir, f"{safe_filename(row['id'])}{suffix}.png")
+            download_image_to(image_data.url, path)
+            files.append(path)
+            revised_prompts.append(getattr(image_data, "revised_prompt", None) or row["prompt"])
+    return {"files": files, "revised_prompts": revised_prompts, "elapsed": round(time.perf_counter() - started, 3)}
+
+
+def run_batch(prompts, output_dir, manifest_path, concurrency=4, requests_per_minute=0, model=DEFAULT_MODEL):
+    """Generate every pending row, appending one manifest line per finished row"""
+    os.makedirs(output_dir, exist_ok=True)
+    done = load_manifest(manifest_path)
+    pending = [row for row in prompts if row["id"] not in done]
+    print(f"{len(prompts)} prompts, {len(prompts) - len(pending)} already done, {len(pending)} to generate")
+
+    # The shared scheduler enforces the rate limit and retries 429s/transient errors
+    if requests_per_minute:
+        get_scheduler().set_limits(model, rpm=requests_per_minute)
+    manifest_lock = threading.Lock()
+    failures = 0
+
+    with open(manifest_path, "a", encoding="utf-8") as manifest, ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = {pool.submit(generate_row, row, output_dir, model): row for row in pending}
+        for completed, future in enumerate(as_completed(futures), 1):
+            row = futures[future]
+            entry = {**row, "finished_at": datetime.now().isoformat(timespec="seconds")}
+            try:
+                entry.update(status="done", **future.result())
+            except Exception as e:
+                failures += 1
+                entry.update(status="failed", error=str(e))
+
+            with manifest_lock:
+                manifest.write(json.dumps(entry) + "\n")
+                manifest.flush()
+            print(f"[{completed}/{len(pending)}] {entry['status']}: {row['id']}")
+
+    return len(pending) - failures, failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate images in bulk from a CSV or JSONL prompt file")
+    parser.add_argument("prompts", help="CSV with a header row or JSONL; columns: prompt, and optionally id, size, quality, style")
+    parser.add_argument("-o", "--output-dir", default="generated_images")
+    parser.add_argument("--manifest", help="Progress manifest (JSONL); defaults to <output-dir>/manifest.jsonl")
+    parser.add_argument("-c", "--concurrency", type=int, default=4, help="Number of generations in flight at once")
+    parser.add_argument("--rate-limit", type=float, default=0, help="Maximum requests per minute (0 = unlimited)")
+    parser.add_argument("--model", default=DEFAULT_MODEL)
+    parser.add_argument("--size", default="1024x1024", help="Default size for rows without one")
+    parser.add_argument("--quality", default="standard", help="Default quality for rows without one")
+    parser.add_argument("--style", default=None, help="Default style (vivid/natural) for rows without one")
+    parser.add_argument("--base-url", default=os.getenv("OPENAI_BASE_URL"), help="API base URL, e.g. a local mock such as http://127.0.0.1:8765/v1")
+    parser.add_argument("--metrics-port", type=int, default=None, help="Serve Prometheus metrics on this port while the batch runs")
+    parser.add_argument("--metrics-out", help="Write the final Prometheus metrics snapshot to this file")
+    args = parser.parse_args()
+
+    load_dotenv()
+    api_key = os.getenv("OPENAI_API_KEY") or ("mock" if args.base_url else None)
+    if not api_key:
+        parser.error("OPENAI_API_KEY is not set")
+    # Every worker thread shares one pooled client
+    configure(api_key=api_key, base_url=args.base_url)
+    metrics.set_app("image_batch")
+    if args.metrics_port is not None:
+        metrics.start_metrics_server(args.metrics_port)
+
+    try:
+        prompts = read_prompts(args.prompts, {"size": args.size, "quality": args.quality, "style": args.style})
+    except ValueError as e:
+        parser.error(str(e))
+    manifest_path = args.manifest or os.path.join(args.output_dir, "manifest.jsonl")
+    succeeded, failed = run_batch(prompts, args.output_dir, manifest_path, args.concurrency, args.rate_limit, args.model)
+    print(f"Finished: {succeeded} generated, {failed} failed. Re-run the same command to retry failures.")
+    if args.metrics_out:
+        with open(args.metrics_out, "w", encoding="utf-8") as f:
+            f.write(metrics.REGISTRY.render())
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+# Image generation logic shared by the Streamlit UI, background workers and batch CLI
+import os
+from datetime import datetime
+
+from shared import metrics
+from shared.openai_client import get_client
+from shared.scheduler import INTERACTIVE, get_scheduler
+from shared.singleflight import get_singleflight
+
+# DALL-E 3 gives the best quality but only supports one image per request
+DEFAULT_MODEL = "dall-e-3"
+
+
+def download_image(url, timeout=30):
+    """Fetch the bytes of a generated image from its URL"""
+    # Imported here so the UI's first paint doesn't pay for it
+    import requests
+
+    with metrics.span("download_image"):
+        image_response = requests.get(url, timeout=timeout)
+        image_response.raise_for_status()
+        return image_response.content
+
+
+def download_image_to(url, path, timeout=30, chunk_size=64 * 1024):
+    """Stream a generated image straight to disk without holding it in memory"""
+    import requests
+
+    partial_path = f"{path}.part"
+    with metrics.span("download_image"), requests.get(url, timeout=timeout, stream=True) as image_response:
+        image_response.raise_for_status()
+        with open(partial_path, "wb") as f:
+            for chunk in image_response.iter_content(chunk_size=chunk_size):
+                f.write(chunk)
+    # Only expose complete files under the final name
+    os.replace(partial_path, path)
+    return path
+
+
+def request_images(prompt, size="1024x1024", quality="standard", style=None, model=DEFAULT_MODEL, priority=INTERACTIVE):
+    """Call the image API and return the generated image records (URL + revised prompt)"""
+    params = {}
+    if style:
+        params["style"] = style  # "vivid" or "natural"
+
+    response = get_scheduler().call(
+        get_client().images.generate,
+        model=model,
+        priority=priority,
+        prompt=prompt,
+        size=size,
+        quality=quality,
+        n=1,  # DALL-E 3 only supports n=1
+        # A timed-out generation may still have been made (and billed), so don't repeat it
+        idempotent=False,
+        **params
+    )
+    return response.data
+
+
+def _generate_images(prompt, size, quality, style, model):
+    images = []
+    for image_data in request_images(prompt, size=size, quality=quality, style=style, model=model):
+        image_url = image_data.url
+        revised_prompt = getattr(image_data, 'revised_prompt', None) or prompt
+
+        images.append({
+            'url': image_url,
+            'prompt': prompt,
+            'revised_prompt': revised_prompt,
+            'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            'size': size,
+            'quality': quality,
+            'image_data': download_image(image_url)
+        })
+
+    return images
+
+
+def generate_images(prompt, size="1024x1024", quality="standard", style=None, model=DEFAULT_MODEL, variant=0):
+    """Generate images for a prompt and return gallery entries with the image bytes
+
+    Concurrent identical requests (e.g. two users picking the same example
+    prompt) share one generation. `variant` keeps deliberately repeated
+    requests, such as the 2nd of 4 images for one prompt, from being merged.
+    """
+    images = get_singleflight().do(
+        "image",
+        {"prompt": prompt, "size": size, "quality": quality, "style": style, "model": model, "variant": variant},
+        _generate_images, prompt, size, quality, style, model
+    )
+    # Each caller gets its own entries so sessions never share mutable gallery state
+    return [dict(image_info) for image_info in images]
@@ -0,0 +1,285 @@
+# Background generation job queue backed by a persistent SQLite job table
+import json
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+
+from generator import generate_images
+
+# Job lifecycle: queued -> running -> done | failed
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    session_id TEXT NOT NULL,
+    prompt TEXT NOT NULL,
+    params TEXT NOT NULL,
+    status TEXT NOT NULL,
+    error TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    collected INTEGER NOT NULL DEFAULT 0,
+    owner TEXT,
+    heartbeat REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at);
+CREATE INDEX IF NOT EXISTS jobs_session ON jobs (session_id, created_at);
+CREATE TABLE IF NOT EXISTS job_images (
+    job_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    info TEXT NOT NULL,
+    image_data BLOB NOT NULL,
+    PRIMARY KEY (job_id, position)
+);
+"""
+# Columns added since the first release of the job table
+MIGRATIONS = {"owner": "ALTER TABLE jobs ADD COLUMN owner TEXT", "heartbeat": "ALTER TABLE jobs ADD COLUMN heartbeat REAL"}
+
+
+class JobQueue:
+    """Runs image generation jobs on worker threads so they survive Streamlit reruns
+
+    Several processes can share one job table. A worker leases each job it claims: the row
+    records the owning queue and a heartbeat that queue refreshes every `lease / 3` seconds.
+    A running job is only taken over once its heartbeat is `lease` seconds old, i.e. its
+    process has died, and a worker that lost its lease doesn't write the result.
+    """
+
+    def __init__(self, db_path="image_jobs.db", workers=2, handler=generate_images, poll_interval=1.0,
+                 ttl=86400, purge_interval=600, lease=60.0):
+        self.db_path = db_path
+        self.handler = handler
+        self.poll_interval = poll_interval
+        self.ttl = ttl
+        self.purge_interval = purge_interval
+        self.lease = lease
+        self.owner = uuid.uuid4().hex
+        self._next_purge = 0.0
+        self._purge_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+            for column, statement in MIGRATIONS.items():
+                if column not in columns:
+                    conn.execute(statement)
+            # Jobs left running by a process that has died are picked up by _claim_next once their lease expires
+
+        self._workers = []
+        for i in range(workers):
+            worker = threading.Thread(target=self._work, name=f"image-job-worker-{i}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+        self._heartbeat = threading.Thread(target=self._beat, name="image-job-heartbeat", daemon=True)
+        self._heartbeat.start()
+
+    @contextmanager
+    def _connect(self):
+        """Open a short-lived connection; SQLite connections can't be shared across threads"""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def submit(self, session_id, prompt, **params):
+        """Queue a generation job and return its id"""
+        job_id = uuid.uuid4().hex
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, session_id, prompt, params, status, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, session_id, prompt, json.dumps(params), QUEUED, time.time())
+            )
+        self._wakeup.set()
+        return job_id
+
+    def jobs_for_session(self, session_id, include_collected=False):
+        """Return the status rows of a session's jobs, oldest first"""
+        query = "SELECT id, prompt, params, status, error, created_at, started_at, finished_at FROM jobs WHERE session_id = ?"
+        if not include_collected:
+            query += " AND collected = 0"
+        with self._connect() as conn:
+            rows = conn.execute(query + " ORDER BY created_at", (session_id,)).fetchall()
+        return [dict(row, params=json.loads(row["params"])) for row in rows]
+
+    def outstanding(self, job_ids):
+        """Split job ids into (not collected yet, unknown to this job table)
+
+        Unknown ids count as not collected: they were queued by another host with its own job
+        table, e.g. when a load balancer without sticky sessions sent the rerun elsewhere, and
+        only that host can collect them.
+        """
+        job_ids = list(job_ids)
+        collected = {}
+        if job_ids:
+            with self._connect() as conn:
+                rows = conn.execute(f"SELECT id, collected FROM jobs WHERE id IN ({', '.join('?' * len(job_ids))})", job_ids)
+                collected = {row["id"]: row["collected"] for row in rows}
+        pending = [job_id for job_id in job_ids if not collected.get(job_id)]
+        unknown = [job_id for job_id in job_ids if job_id not in collected]
+        return pending, unknown
+
+    def collect(self, session_id):
+        """Return finished jobs that haven't been shown yet and mark them as collected
+
+        Gallery entries come back as image_info dicts; failures come back as
+        (prompt, error) pairs so the UI can report them once. The images now belong to
+        the session, so they're deleted from the job table.
+        """
+        with self._connect() as conn:
+            finished = conn.execute(
+                "SELECT id, prompt, status, error FROM jobs WHERE session_id = ? AND collected = 0 AND status IN (?, ?) ORDER BY finished_at",
+                (session_id, DONE, FAILED)
+            ).fetchall()
+
+            images, failures = [], []
+            for job in finished:
+                if job["status"] == FAILED:
+                    failures.append((job["prompt"], job["error"]))
+                    continue
+                for row in conn.execute("SELECT info, image_data FROM job_images WHERE job_id = ? ORDER BY position", (job["id"],)):
+                    image_info = json.loads(row["info"])
+                    image_info["image_data"] = bytes(row["image_data"])
+                    images.append(image_info)
+
+            conn.executemany("UPDATE jobs SET collected = 1 WHERE id = ?", [(job["id"],) for job in finished])
+            conn.executemany("DELETE FROM job_images WHERE job_id = ?", [(job["id"],) for job in finished])
+        return images, failures
+
+    def purge(self, ttl=None):
+        """Delete jobs, and their images, that finished or were queued more than `ttl` seconds ago
+
+        Collected jobs only keep their status row; this also drops results nobody came back
+        for and queued jobs whose session is long gone. Returns the number of jobs deleted.
+        """
+        cutoff = time.time() - (self.ttl if ttl is None else ttl)
+        with self._connect() as conn:
+            expired = [row["id"] for row in conn.execute(
+                "SELECT id FROM jobs WHERE (status IN (?, ?) AND finished_at < ?) OR (status = ? AND created_at < ?)",
+                (DONE, FAILED, cutoff, QUEUED, cutoff)
+            )]
+            conn.executemany("DELETE FROM job_images WHERE job_id = ?", [(job_id,) for job_id in expired])
+            conn.executemany("DELETE FROM jobs WHERE id = ?", [(job_id,) for job_id in expired])
+        return len(expired)
+
+    def _maybe_purge(self):
+        """Run purge() every `purge_interval` seconds on whichever worker gets here first"""
+        if time.monotonic() < self._next_purge or not self._purge_lock.acquire(blocking=False):
+            return
+        try:
+            self._next_purge = time.monotonic() + self.purge_interval
+            self.purge()
+        except sqlite3.Error as e:
+            print(f"Image jobs: purge failed: {e}", file=sys.stderr)
+        finally:
+            self._purge_lock.release()
+
+    def stop(self, timeout=None):
+        """Ask the workers to exit once their current job is done"""
+        self._stopping.set()
+        self._wakeup.set()
+        for worker in self._workers:
+            worker.join(timeout)
+        self._heartbeat.join(timeout)
+
+    def _beat(self):
+        """Keep this queue's leases fresh while its workers are busy"""
+        while not self._stopping.wait(self.lease / 3):
+            try:
+                with self._connect() as conn:
+                    conn.execute("UPDATE jobs SET heartbeat = ? WHERE owner = ? AND status = ?", (time.time(), self.owner, RUNNING))
+            except sqlite3.Error as e:
+                print(f"Image jobs: heartbeat failed: {e}", file=sys.stderr)
+
+    def _claim_next(self):
+        """Atomically lease the oldest queued job, or a running one whose owner stopped renewing it, and return it"""
+        now = time.time()
+        claimable = "(status = ? OR (status = ? AND (heartbeat IS NULL OR heartbeat < ?)))"
+        with self._connect() as conn:
+            row = conn.execute(
+                f"SELECT id, owner FROM jobs WHERE {claimable} ORDER BY created_at LIMIT 1",
+                (QUEUED, RUNNING, now - self.lease)
+            ).fetchone()
+            if row is None:
+                return None
+            claimed = conn.execute(
+                f"UPDATE jobs SET status = ?, started_at = ?, owner = ?, heartbeat = ? WHERE id = ? AND {claimable}",
+                (RUNNING, now, self.owner, now, row["id"], QUEUED, RUNNING, now - self.lease)
+            ).rowcount
+            if not claimed:
+                # Another worker got there first
+                return None
+            if row["owner"]:
+                print(f"Image jobs: job {row['id']} took over from a stopped worker", file=sys.stderr)
+            return conn.execute("SELECT id, prompt, params FROM jobs WHERE id = ?", (row["id"],)).fetchone()
+
+    def _finish(self, job_id, images=(), error=None):
+        """Store a job's outcome if we still hold its lease; returns False if another worker took it over"""
+        with self._connect() as conn:
+            owned = conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, finished_at = ?, heartbeat = NULL WHERE id = ? AND owner = ? AND status = ?",
+                (FAILED if error else DONE, error, time.time(), job_id, self.owner, RUNNING)
+            ).rowcount
+            if not owned:
+                return False
+            for position, image_info in enumerate(images):
+                info = {k: v for k, v in image_info.items() if k != "image_data"}
+                conn.execute(
+                    "INSERT OR REPLACE INTO job_images (job_id, position, info, image_data) VALUES (?, ?, ?, ?)",
+                    (job_id, position, json.dumps(info), image_info["image_data"])
+                )
+        return True
+
+    def _work(self):
+        while not self._stopping.is_set():
+            try:
+                self._maybe_purge()
+                job = self._claim_next()
+            except sqlite3.Error as e:
+                print(f"Image jobs: claiming a job failed: {e}", file=sys.stderr)
+                job = None
+            if job is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+
+            try:
+                images, error = self.handler(job["prompt"], **json.loads(job["params"])), None
+            except Exception as e:
+                # The error is kept on the job, which is how the session that queued it hears about it
+                images, error = (), f"{type(e).__name__}: {e}"
+                print(f"Image jobs: job {job['id']} failed: {error}", file=sys.stderr)
+
+            try:
+                if not self._finish(job["id"], images, error):
+                    print(f"Image jobs: job {job['id']} was taken over by another worker; dropping this result", file=sys.stderr)
+            except Exception as e:
+                # Don't let one bad result take the worker down; report it on the job instead
+                print(f"Image jobs: storing job {job['id']} failed: {type(e).__name__}: {e}", file=sys.stderr)
+                try:
+                    self._finish(job["id"], error=f"Storing the result failed: {type(e).__name__}: {e}")
+                except Exception as e:
+                    print(f"Image jobs: marking job {job['id']} failed didn't work either: {e}", file=sys.stderr)
+
+
+def describe_job(job):
+    """Short human-readable status line for a job row"""
+    created = datetime.fromtimestamp(job["created_at"]).strftime("%H:%M:%S")
+    prompt = job["prompt"][:40] + "..." if len(job["prompt"]) > 40 else job["prompt"]
+    if job["status"] == RUNNING and job["started_at"]:
+        return f"{prompt} — running for {time.time() - job['started_at']:.0f}s (queued {created})"
+    return f"{prompt} — {job['status']} (queued {created})"
@@ -1,17 +1,21 @@
 # Enhanced AI Image Generator using OpenAI DALL-E API
 import streamlit as st
-import openai
 import os
-import requests
-import base64
+import time
 from datetime import datetime
-from PIL import Image
-import io
-from dotenv import load_dotenv
 
-# Load environment variables
-load_dotenv()
-openai.api_key = os.getenv("OPENAI_API_KEY")
+import repo_path  # noqa: F401 (puts the repo root on sys.path for `shared`)
+
+from shared import metrics
+from job_queue import QUEUED, RUNNING, describe_job
+from resources import get_image_store, get_job_queue
+from storage import zip_bytes
+from shared.session_store import persist_session_state, save_session_state
+from shared.startup import start_app
+
+# Label this rerun's metrics; once per process, load .env, expose /metrics (METRICS_PORT, by default per app)
+# and warm up the OpenAI client in the background
+start_app("image_gen", __file__)
 
 # Configure Streamlit page
 st.set_page_config(
@@ -21,6 +25,11 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+# Keep the gallery and history in the shared session store (SESSION_STORE_URL), so a page reload, a
+# server restart or another replica picks them up. Images are stored once each, however many lists
+# they appear in
+session_id = persist_session_state("image_gen", ("generated_images", "generation_history", "jobs_outstanding"))
+
 # Custom CSS for better styling
 st.markdown("""
 <style>
@@ -65,6 +74,16 @@ if 'generated_images' not in st.session_state:
     st.session_state.generated_images = []
 if 'generation_history' not in st.session_state:
     st.session_state.generation_history = []
+# The store's session id, so queued jobs are collected by whichever process serves the next rerun
+if 'session_id' not in st.session_state:
+    st.session_state.session_id = session_id
+# [job id, queued at] for this session's jobs that haven't reached the gallery yet (older sessions stored a flag)
+if not isinstance(st.session_state.get('jobs_outstanding'), list):
+    st.session_state.jobs_outstanding = []
+
+# One image store and job queue per process, shared by every session and kept across reruns
+image_store = get_image_store()
+job_queue = get_job_queue()
 
 # Sidebar configuration
 with st.sidebar:
@@ -166,67 +185,99 @@ with col2:
         auto_download = st.checkbox("Auto-download images", value=False)
         show_prompt_in_caption = st.checkbox("Show prompt in caption", value=True)
 
-# Image generation logic
+# Image generation logic: queue one job per image and keep the UI responsive
 if generate_button and user_prompt:
-    if not openai.api_key:
+    if not os.getenv("OPENAI_API_KEY"):
         st.error("❌ OpenAI API key not found! Please set your OPENAI_API_KEY in the .env file.")
     else:
-        try:
-            with st.spinner(f"🎨 Generating {num_images} image(s)... This may take a moment."):
-                # Generate images using DALL-E 3
-                response = openai.images.generate(
-                    model="dall-e-3",  # Using DALL-E 3 for better quality
-                    prompt=user_prompt,
-                    size=image_size,
-                    quality=image_quality,
-                    n=1  # DALL-E 3 only supports n=1
-                )
-                
-                # Process generated images
-                for i, image_data in enumerate(response.data):
-                    image_url = image_data.url
-                    revised_prompt = getattr(image_data, 'revised_prompt', user_prompt)
-                    
-                    # Download image
-                    image_response = requests.get(image_url, timeout=30)
-                    
-                    if image_response.status_code == 200:
-                        # Create image info
-                        image_info = {
-                            'url': image_url,
-                            'prompt': user_prompt,
-                            'revised_prompt': revised_prompt,
-                            'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                            'size': image_size,
-                            'quality': image_quality,
-                            'image_data': image_response.content
-                        }
-                        
-                        # Store in session state
-                        st.session_state.generated_images.append(image_info)
-                        st.session_state.generation_history.append(image_info)
-                        
-                        # Auto-download if enabled
-                        if auto_download:
-                            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S") if add_timestamp else ""
-                            filename = f"ai_generated_image_{timestamp}_{i+1}.png"
-                            with open(filename, "wb") as f:
-                                f.write(image_response.content)
-                
-                st.success(f"✅ Successfully generated {len(response.data)} image(s)!")
-                st.rerun()
-                
-        except Exception as e:
-            st.error(f"❌ Error generating image: {str(e)}")
-            st.info("💡 Tips: Make sure your prompt is descriptive and try again. Check your API key and internet connection.")
+        # Auto-saved images go to this session's own output directory
+        save_dir = image_store.session_dir(st.session_state.session_id) if auto_download else None
+        for variant in range(num_images):
+            job_id = job_queue.submit(
+                st.session_state.session_id,
+                user_prompt,
+                size=image_size,
+                quality=image_quality,
+                save_dir=save_dir,
+                add_timestamp=add_timestamp,
+                variant=variant
+            )
+            st.session_state.jobs_outstanding.append([job_id, time.time()])
+        st.success(f"✅ Queued {num_images} image(s)! You can keep working while they generate.")
 
 elif generate_button and not user_prompt:
     st.warning("⚠️ Please enter a description for your image!")
 
+# Move finished jobs into the gallery, whichever rerun they finish in. Sessions with nothing
+# queued or uncollected skip the job table altogether
+new_images, failed_jobs, outstanding_jobs, elsewhere = [], [], [], []
+if st.session_state.jobs_outstanding:
+    new_images, failed_jobs = job_queue.collect(st.session_state.session_id)
+    outstanding_jobs = job_queue.jobs_for_session(st.session_state.session_id)
+    # The job table is local to each host: jobs it has never seen stay outstanding for the host that
+    # queued them, until that host would have purged them uncollected
+    queued_at = dict(st.session_state.jobs_outstanding)
+    pending, unknown = job_queue.outstanding(queued_at)
+    expired = {job_id for job_id in unknown if time.time() - queued_at[job_id] > job_queue.ttl}
+    elsewhere = [job_id for job_id in unknown if job_id not in expired]
+    st.session_state.jobs_outstanding = [[job_id, queued_at[job_id]] for job_id in pending if job_id not in expired]
+
+for image_info in new_images:
+    st.session_state.generated_images.append(image_info)
+    st.session_state.generation_history.append(image_info)
+
+# Report auto-save failures for this session's folder once
+save_error = image_store.errors.pop(image_store.session_dir(st.session_state.session_id), None)
+if save_error:
+    st.warning(f"⚠️ An image couldn't be auto-saved ({save_error}). It's still in the gallery below.")
+
+if elsewhere:
+    st.info(
+        f"🖥️ {len(elsewhere)} image(s) were queued on another server and will show up once a rerun is served "
+        "there again. Image generation needs sticky sessions behind a load balancer."
+    )
+
+for failed_prompt, error in failed_jobs:
+    st.error(f"❌ Error generating image for \"{failed_prompt}\": {error}")
+    st.info("💡 Tips: Make sure your prompt is descriptive and try again. Check your API key and internet connection.")
+
+# Poll pending jobs without blocking the rest of the page
+def render_job_status():
+    jobs = job_queue.jobs_for_session(st.session_state.session_id)
+    if any(job['status'] not in (QUEUED, RUNNING) for job in jobs):
+        # Something finished: rerun the whole app so it lands in the gallery
+        st.rerun()
+    active = [job for job in jobs if job['status'] in (QUEUED, RUNNING)]
+    if active:
+        st.header(f"⏳ In Progress ({len(active)})")
+        for job in active:
+            st.write(("🎨 " if job['status'] == RUNNING else "🕒 ") + describe_job(job))
+
+# Includes jobs that finished after collect() above, so the fragment reruns the app for them
+if outstanding_jobs:
+    st.fragment(render_job_status, run_every=2)()
+
 # Display generated images
 if st.session_state.generated_images:
     st.header("🖼️ Generated Images")
     
+    # Download everything as one ZIP; it's only built when the button is clicked
+    def export_zip(entries):
+        with metrics.span("zip_export", images=len(entries)):
+            return zip_bytes(entries)
+
+    gallery = [
+        (f"ai_image_{idx+1}_{img_info['timestamp'].replace(' ', '_').replace(':', '')}.png", img_info['image_data'])
+        for idx, img_info in enumerate(st.session_state.generated_images)
+    ]
+    st.download_button(
+        label=f"📦 Download All ({len(gallery)} images)",
+        data=lambda: export_zip(gallery),
+        file_name=f"ai_images_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip",
+        mime="application/zip",
+        key="download_all"
+    )
+    
     # Display images in a grid
     for idx, img_info in enumerate(reversed(st.session_state.generated_images)):
         with st.container():
@@ -312,3 +363,6 @@ if not st.session_state.generated_images:
     - Use the example prompts to get started
     - Experiment with different sizes and quality settings
     """)
+
+# Queue what this run changed for the session store
+save_session_state("image_gen")
@@ -0,0 +1,5 @@
+# Metrics dashboard page for the Image Generator app
+import repo_path  # noqa: F401 (puts the repo root on sys.path for `shared`)
+from shared.dashboard import metrics_page
+
+metrics_page("image_gen")
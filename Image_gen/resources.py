@@ -0,0 +1,38 @@
+# Process-wide resources for the Streamlit UI, defined once at import rather than on every rerun
+import os
+
+import streamlit as st
+
+from generator import generate_images
+from job_queue import JobQueue
+from shared import metrics
+from storage import ImageStore, image_filename
+
+
+@st.cache_resource
+def get_image_store():
+    """Background writer shared by every session"""
+    return ImageStore(root=os.getenv("IMAGE_OUTPUT_DIR", "generated_images"))
+
+
+def generate_and_save(prompt, save_dir=None, add_timestamp=True, **params):
+    """Job handler: generate images and hand them to the background writer when auto-save is on"""
+    with metrics.span("image_job", size=params.get('size'), quality=params.get('quality')):
+        images = generate_images(prompt, **params)
+        if save_dir:
+            image_store = get_image_store()
+            for i, image_info in enumerate(images):
+                image_store.save(save_dir, image_filename(i + 1, add_timestamp), image_info['image_data'])
+        return images
+
+
+@st.cache_resource
+def get_job_queue():
+    """SQLite-backed job queue and its worker threads, shared by every session"""
+    return JobQueue(
+        db_path=os.getenv("IMAGE_JOBS_DB", "image_jobs.db"),
+        workers=int(os.getenv("IMAGE_JOB_WORKERS", "2")),
+        ttl=float(os.getenv("IMAGE_JOB_TTL", "86400")),
+        lease=float(os.getenv("IMAGE_JOB_LEASE", "60")),
+        handler=generate_and_save
+    )
@@ -0,0 +1,108 @@
+# Asynchronous image persistence and ZIP export
+import io
+import os
+import queue
+import re
+import sys
+import threading
+import uuid
+import zipfile
+from datetime import datetime
+
+from shared import metrics
+
+CHUNK_SIZE = 64 * 1024
+
+WRITE_FAILURES = metrics.REGISTRY.counter("image_store_write_failures_total", "Auto-saved images that couldn't be written", ("app",))
+
+
+def image_filename(index, add_timestamp=True):
+    """Build a collision-free PNG filename for a generated image"""
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S") if add_timestamp else ""
+    return f"ai_generated_image_{timestamp}_{uuid.uuid4().hex[:8]}_{index}.png"
+
+
+class ImageStore:
+    """Writes images to per-session output directories on a background thread"""
+
+    def __init__(self, root="generated_images"):
+        self.root = root
+        self._queue = queue.Queue()
+        # Latest write error per directory, so a session can be told its auto-save failed
+        self.errors = {}
+        self._writer = threading.Thread(target=self._write_loop, name="image-store-writer", daemon=True)
+        self._writer.start()
+
+    def session_dir(self, session_id):
+        """Directory holding one session's saved images"""
+        return os.path.join(self.root, re.sub(r"[^A-Za-z0-9_-]", "_", session_id))
+
+    def save(self, directory, filename, data):
+        """Queue image bytes to be written; returns the eventual path immediately"""
+        path = os.path.join(directory, filename)
+        self._queue.put((path, data))
+        return path
+
+    def flush(self):
+        """Block until every queued image has been written"""
+        self._queue.join()
+
+    def _write_loop(self):
+        while True:
+            path, data = self._queue.get()
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                partial_path = f"{path}.part"
+                with open(partial_path, "wb") as f:
+                    f.write(data)
+                os.replace(partial_path, path)
+            except OSError as e:
+                WRITE_FAILURES.inc(app=metrics.get_app())
+                self.errors[os.path.dirname(path)] = f"{os.path.basename(path)}: {e.strerror or e}"
+                print(f"Image store: couldn't save {path}: {e}", file=sys.stderr)
+            finally:
+                self._queue.task_done()
+
+
+class _ChunkSink(io.RawIOBase):
+    """Unseekable write target that hands ZIP output back in chunks"""
+
+    def __init__(self):
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        chunks, self.chunks = self.chunks, []
+        return chunks
+
+
+def iter_zip(entries):
+    """Yield a ZIP archive chunk by chunk from (name, bytes or file path) pairs
+
+    Entries are written one at a time, so only the current image and the
+    pending output chunks are held in memory. PNGs are already compressed,
+    so they're stored rather than deflated.
+    """
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_STORED) as archive:
+        for name, data in entries:
+            with archive.open(name, "w") as member:
+                if isinstance(data, (bytes, bytearray)):
+                    member.write(data)
+                else:
+                    with open(data, "rb") as source:
+                        for chunk in iter(lambda: source.read(CHUNK_SIZE), b""):
+                            member.write(chunk)
+            yield from sink.drain()
+    yield from sink.drain()
+
+
+def zip_bytes(entries):
+    """The whole ZIP archive as bytes, which is what st.download_button needs"""
+    return b"".join(iter_zip(entries))
@@ -1,15 +1,22 @@
 import streamlit as st
-import openai
 import os
-from dotenv import load_dotenv
-import tempfile
 from datetime import datetime
 
-# Load environment variables from .env file
-load_dotenv()
+import repo_path  # noqa: F401 (puts the repo root on sys.path for `shared`)
 
-# Initialize OpenAI client with the new API
-client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+from shared import metrics
+from shared.batch import cached_result, completion_text
+from shared.openai_client import get_client
+from shared.router import get_router
+from shared.scheduler import INTERACTIVE, estimate_tokens, get_scheduler
+from shared.session_store import persist_session_state, save_session_state
+from shared.singleflight import get_singleflight
+from shared.startup import start_app
+from translation import LANGUAGES, translation_request, reply_budget
+
+# Label this rerun's metrics; once per process, load .env, expose /metrics (METRICS_PORT, by default per app)
+# and warm up the OpenAI client in the background
+start_app("stt", __file__)
 
 # Configure the Streamlit app
 st.set_page_config(
@@ -18,6 +25,10 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+# Keep the last transcription and the counters in the shared session store (SESSION_STORE_URL),
+# so a page reload, a server restart or another replica picks them up
+persist_session_state("stt", ("current_transcription", "transcription_count", "translation_count"))
+
 # Custom CSS for better styling
 st.markdown("""
 <style>
@@ -64,15 +75,7 @@ with st.sidebar:
     st.header("⚙️ Settings")
     
     # Language selection with more options
-    language = st.selectbox(
-        "🌍 Translate to:",
-        [
-            "None (Keep English)",
-            "Arabic", "French", "Spanish", "German", "Chinese (Simplified)",
-            "Chinese (Traditional)", "Japanese", "Korean", "Portuguese", "Italian",
-            "Russian", "Dutch", "Hindi", "Turkish", "Polish", "Swedish"
-        ]
-    )
+    language = st.selectbox("🌍 Translate to:", ["None (Keep English)"] + LANGUAGES)
     
     # Advanced options
     st.header("🔧 Advanced Options")
@@ -87,9 +90,9 @@ with st.sidebar:
     # Translation model selection
     translation_model = st.selectbox(
         "Translation Model:",
-        ["gpt-4o-mini", "gpt-3.5-turbo", "gpt-4"],
+        ["auto", "gpt-4o-mini", "gpt-3.5-turbo", "gpt-4"],
         index=0,
-        help="Choose the model for translation. GPT-4o-mini is faster and more cost-effective."
+        help="Auto picks a model per text from its length, the language and current latency, and falls back to another if it fails. GPT-4o-mini is faster and more cost-effective."
     )
     
     # Auto-download options
@@ -110,6 +113,14 @@ if not os.getenv("OPENAI_API_KEY"):
     st.info("Create a .env file with: `OPENAI_API_KEY=your_api_key_here`")
     st.stop()
 
+# Process-wide scheduler: rate limit budgets are shared by every session. The client is fetched
+# at call time so a first paint never waits for openai to import
+scheduler = get_scheduler()
+# Identical requests from concurrent sessions share one upstream call
+singleflight = get_singleflight()
+# Picks the translation model when set to auto
+router = get_router()
+
 # File uploader for audio files
 st.subheader("📤 Upload Your Audio File")
 audio_file = st.file_uploader(
@@ -153,23 +164,24 @@ if audio_file:
     # Transcription section
     if st.button("🎤 Start Transcription", type="primary"):
         try:
-            # Create a temporary file to save the uploaded audio
-            with tempfile.NamedTemporaryFile(delete=False, suffix=f".{audio_file.name.split('.')[-1]}") as tmp_file:
-                tmp_file.write(audio_file.getvalue())
-                tmp_file_path = tmp_file.name
+            # Send the uploaded bytes directly; the extension tells Whisper the format
+            audio_bytes = audio_file.getvalue()
+            audio_name = f"audio.{audio_file.name.split('.')[-1]}"
             
             # Transcribe the uploaded audio file using OpenAI Whisper
             with st.spinner("🔄 Transcribing audio... This may take a moment."):
-                with open(tmp_file_path, "rb") as audio_data:
-                    response = client.audio.transcriptions.create(
+                with metrics.span("transcribe", bytes=len(audio_bytes)):
+                    response = singleflight.do(
+                        "transcription",
+                        {"model": transcription_model, "file": [audio_name, audio_bytes], "response_format": "text"},
+                        scheduler.call,
+                        get_client().audio.transcriptions.create,
                         model=transcription_model,
-                        file=audio_data,
+                        priority=INTERACTIVE,
+                        file=(audio_name, audio_bytes),
                         response_format="text"
                     )
                 
-                # Clean up temporary file
-                os.unlink(tmp_file_path)
-                
                 st.session_state.transcription_count += 1
                 
                 st.markdown('<div class="success-box">✅ Transcription completed successfully!</div>', unsafe_allow_html=True)
@@ -203,23 +215,43 @@ if audio_file:
         
         if st.button("🌍 Translate Text", type="secondary"):
             try:
-                with st.spinner(f"🔄 Translating to {language}..."):
-                    translation_response = client.chat.completions.create(
-                        model=translation_model,
-                        messages=[
-                            {
-                                "role": "system", 
-                                "content": f"You are a professional translator. Translate the given text accurately to {language}. Maintain the original meaning, tone, and context. If the text is already in {language}, indicate that no translation is needed."
-                            },
-                            {
-                                "role": "user", 
-                                "content": f"Translate this text to {language}:\n\n{st.session_state.current_transcription}"
-                            }
-                        ],
-                        temperature=0.3
-                    )
-                    
-                    translated_text = translation_response.choices[0].message.content
+                with st.spinner(f"🔄 Translating to {language}..."), metrics.span("translate", language=language):
+                    text = st.session_state.current_transcription
+                    if translation_model == "auto":
+                        # Any route model's batch result will do; the router only picks one on a miss
+                        candidates = router.candidates("translation")
+                        request = translation_request(text, language, candidates[0])
+                    else:
+                        candidates = ()
+                        request = translation_request(text, language, translation_model)
+                    # Texts translated ahead of time by batch_translate.py come straight from its results
+                    cached = cached_result("translation", request, candidates)
+                    if cached:
+                        translated_text = completion_text(cached)
+                    elif translation_model == "auto":
+                        route = router.choose("translation", request["messages"], reply_budget(text), language)
+                        # Identical requests share one call whichever model each would be routed to
+                        translation_response = singleflight.do(
+                            "translation",
+                            {**request, "model": "auto"},
+                            router.call,
+                            get_client().chat.completions.create,
+                            route,
+                            priority=INTERACTIVE,
+                            **request
+                        )
+                        translated_text = translation_response.choices[0].message.content
+                    else:
+                        translation_response = singleflight.do(
+                            "translation",
+                            request,
+                            scheduler.call,
+                            get_client().chat.completions.create,
+                            tokens=estimate_tokens(request["messages"], max_tokens=reply_budget(text)),
+                            priority=INTERACTIVE,
+                            **request
+                        )
+                        translated_text = translation_response.choices[0].message.content
                     st.session_state.translation_count += 1
                     
                     st.markdown('<div class="success-box">✅ Translation completed successfully!</div>', unsafe_allow_html=True)
@@ -286,3 +318,6 @@ with st.expander("📊 API Usage Information"):
     - GPT-3.5-turbo: ~$0.0015 per 1K tokens
     - GPT-4: ~$0.03 per 1K tokens (more accurate)
     """)
+
+# Queue what this run changed for the session store
+save_session_state("stt")
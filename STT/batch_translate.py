@@ -0,0 +1,98 @@
+# Bulk translation of text files through the OpenAI Batch API
+import argparse
+import json
+import re
+import sys
+from pathlib import Path
+
+import repo_path  # noqa: F401 (puts the repo root on sys.path for `shared`)
+
+from shared import metrics
+from shared.batch import add_arguments, completion_text, custom_id, pipeline_from_args
+from translation import DEFAULT_MODEL, translation_request
+
+NAMESPACE = "translation"
+
+
+def read_texts(paths):
+    """Texts to translate: .txt files (or folders of them) and JSONL rows with id, text and optionally language"""
+    items = []
+    for path in map(Path, paths):
+        files = sorted(path.glob("*.txt")) if path.is_dir() else [path]
+        for file in files:
+            if file.suffix.lower() in (".jsonl", ".ndjson"):
+                with open(file, encoding="utf-8") as f:
+                    for index, line in enumerate(f, 1):
+                        if not line.strip():
+                            continue
+                        row = json.loads(line)
+                        if not (row.get("text") or "").strip():
+                            print(f"Skipping {file.name} row {index}: no text", file=sys.stderr)
+                            continue
+                        items.append({"id": str(row.get("id") or f"{file.stem}-{index}"), "text": row["text"], "language": row.get("language")})
+            else:
+                items.append({"id": file.stem, "text": file.read_text(encoding="utf-8"), "language": None})
+    return items
+
+
+def safe_filename(item_id):
+    return re.sub(r"[^A-Za-z0-9_.-]", "_", item_id)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Translate text files in bulk with the OpenAI Batch API")
+    parser.add_argument("inputs", nargs="+", help=".txt files, folders of them, or JSONL with id, text and optionally language")
+    parser.add_argument("-l", "--language", action="append", default=[],
+                        help="Target language (repeat for several); JSONL rows with a language use their own")
+    parser.add_argument("--model", default=DEFAULT_MODEL)
+    parser.add_argument("-o", "--output-dir", default="translations", help="Writes <id>.<language>.txt here (default: translations)")
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    items = read_texts(args.inputs)
+    # Which outputs each request answers; identical texts share one request
+    targets = {}
+    requests = []
+    for item in items:
+        languages = [item["language"]] if item["language"] else args.language
+        if not languages:
+            parser.error(f"{item['id']} has no language; pass --language")
+        for language in languages:
+            body = translation_request(item["text"], language, args.model)
+            targets.setdefault(custom_id(NAMESPACE, body), []).append((item["id"], language))
+            requests.append((NAMESPACE, body))
+
+    metrics.set_app("stt_batch")
+    pipeline = pipeline_from_args(args)
+    output_dir = Path(args.output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    written = set()
+
+    def write(key, body):
+        for item_id, language in targets.get(key, []):
+            (output_dir / f"{safe_filename(item_id)}.{safe_filename(language)}.txt").write_text(completion_text(body), encoding="utf-8")
+        written.add(key)
+
+    # Translations an earlier batch already produced, then new ones as each batch finishes
+    for key, body in pipeline.store.bodies(targets).items():
+        write(key, body)
+    failures = 0
+    for key, body, error in pipeline.run(requests, prefix=NAMESPACE, wait=not args.no_wait):
+        if key not in targets:
+            continue
+        if error is None:
+            write(key, body)
+        else:
+            failures += 1
+            print(f"Failed: {', '.join(f'{i} ({lang})' for i, lang in targets[key])}: {error}", file=sys.stderr)
+
+    outputs = sum(len(targets[key]) for key in written)
+    total = sum(len(pairs) for pairs in targets.values())
+    print(f"{outputs}/{total} translation(s) in {output_dir}, {failures} request(s) failed")
+    if outputs < total:
+        print("Run the same command again to collect outstanding batches and retry failures.")
+    sys.exit(0 if outputs == total else 1)
+
+
+if __name__ == "__main__":
+    main()
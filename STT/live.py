@@ -0,0 +1,325 @@
+# Live transcription: voice-activity segmentation of streamed audio, one Whisper call per utterance
+import argparse
+import io
+import threading
+import time
+import wave
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait as wait_futures
+
+import numpy as np
+
+import repo_path  # noqa: F401 (puts the repo root on sys.path for `shared`)
+
+from shared import metrics
+from shared.scheduler import INTERACTIVE, get_scheduler
+
+SAMPLE_RATE = 16000
+# Whisper gets this much of the transcript so far as context for each new utterance
+PROMPT_CHARS = 200
+
+SEGMENT_LATENCY = metrics.REGISTRY.histogram(
+    "live_segment_latency_seconds", "Time from the end of an utterance to its transcript", ("app",)
+)
+SEGMENT_SECONDS = metrics.REGISTRY.histogram(
+    "live_segment_audio_seconds", "Length of the utterances sent for transcription", ("app",),
+    buckets=(0.5, 1, 2, 3, 5, 8, 12, 15, 20, 30)
+)
+
+
+def to_mono_float(samples, channels=1):
+    """Float32 mono in [-1, 1] from int or float PCM, interleaved when there are several channels"""
+    samples = np.asarray(samples)
+    if samples.dtype.kind == "i":
+        samples = samples.astype(np.float32) / -np.iinfo(samples.dtype).min
+    elif samples.dtype.kind == "u":
+        # Unsigned PCM (8-bit WAV) is centred on half the range
+        middle = np.iinfo(samples.dtype).max // 2 + 1
+        samples = (samples.astype(np.float32) - middle) / middle
+    samples = samples.astype(np.float32, copy=False).reshape(-1)
+    if channels > 1:
+        samples = samples[:len(samples) - len(samples) % channels].reshape(-1, channels).mean(axis=1)
+    return samples
+
+
+def resample(samples, rate, target=SAMPLE_RATE):
+    """Linear resampling; plenty for speech recognition"""
+    if rate == target or not len(samples):
+        return samples
+    length = int(round(len(samples) * target / rate))
+    return np.interp(np.arange(length) * (rate / target), np.arange(len(samples)), samples).astype(np.float32)
+
+
+def wav_bytes(samples, rate=SAMPLE_RATE):
+    """16-bit mono WAV file contents for float samples"""
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(rate)
+        f.writeframes((np.clip(samples, -1, 1) * 32767).astype("<i2").tobytes())
+    return buffer.getvalue()
+
+
+def read_wav(source):
+    """(samples, sample rate, channels) of a PCM WAV file path or file-like object"""
+    with wave.open(source, "rb") as f:
+        width, rate, channels = f.getsampwidth(), f.getframerate(), f.getnchannels()
+        data = f.readframes(f.getnframes())
+    if width == 3:
+        # 24-bit: widen to 32-bit by padding the low byte
+        raw = np.frombuffer(data, np.uint8).reshape(-1, 3)
+        data = np.pad(raw, ((0, 0), (1, 0))).tobytes()
+        width = 4
+    dtypes = {1: np.uint8, 2: "<i2", 4: "<i4"}
+    if width not in dtypes:
+        raise ValueError(f"Unsupported WAV sample width: {width} bytes")
+    return np.frombuffer(data, dtypes[width]), rate, channels
+
+
+class VoiceActivitySegmenter:
+    """Cuts a 16 kHz mono stream into utterances
+
+    A frame counts as speech when its level is `margin_db` above the tracked noise floor (and
+    above `min_level_db`) and most of its energy is in the voice band, which ignores hum and
+    hiss. An utterance ends after `hangover_ms` without speech, and is dropped if it had less
+    than `min_speech_ms` of speech in it.
+    """
+
+    def __init__(self, sample_rate=SAMPLE_RATE, frame_ms=30, margin_db=10.0, min_level_db=-50.0, voice_ratio=0.6,
+                 min_speech_ms=200, hangover_ms=500, pre_roll_ms=200, max_segment_s=15.0):
+        self.sample_rate = sample_rate
+        self.frame = int(sample_rate * frame_ms / 1000)
+        self.frame_s = self.frame / sample_rate
+        self.margin_db = margin_db
+        self.min_level_db = min_level_db
+        self.voice_ratio = voice_ratio
+        self.min_speech_frames = max(1, round(min_speech_ms / 1000 / self.frame_s))
+        self.hangover_frames = max(1, round(hangover_ms / 1000 / self.frame_s))
+        self.max_segment_frames = int(max_segment_s / self.frame_s)
+        freqs = np.fft.rfftfreq(self.frame, 1 / sample_rate)
+        self._voice_band = (freqs >= 100) & (freqs <= 4000)
+        self._window = np.hanning(self.frame).astype(np.float32)
+        self._buffer = np.zeros(0, np.float32)
+        self._pre_roll = deque(maxlen=max(1, round(pre_roll_ms / 1000 / self.frame_s)))
+        self._noise_db = None
+        self._frames = []
+        self._voiced = 0
+        self._silence = 0
+        self._start = 0.0
+        self._position = 0  # frames seen so far
+
+    def classify(self, frames):
+        """(speech flags, levels in dBFS) for a (n, frame) array"""
+        rms = np.sqrt(np.mean(frames ** 2, axis=1))
+        levels = 20 * np.log10(rms + 1e-10)
+        power = np.abs(np.fft.rfft(frames * self._window, axis=1)) ** 2
+        voice = power[:, self._voice_band].sum(axis=1) / (power.sum(axis=1) + 1e-12)
+        return voice >= self.voice_ratio, levels
+
+    def feed(self, samples):
+        """Add mono float samples at the segmenter's rate; returns the utterances they completed"""
+        self._buffer = np.concatenate((self._buffer, samples))
+        count = len(self._buffer) // self.frame
+        if not count:
+            return []
+        frames = self._buffer[:count * self.frame].reshape(count, self.frame)
+        self._buffer = self._buffer[count * self.frame:]
+        voiced, levels = self.classify(frames)
+
+        segments = []
+        for frame, is_voice, level in zip(frames, voiced, levels):
+            if self._noise_db is None:
+                # Start low, so a stream that opens mid-sentence is still heard; the floor rises to the room's noise
+                self._noise_db = self.min_level_db
+            speech = is_voice and level > max(self._noise_db + self.margin_db, self.min_level_db)
+            if not speech and not self._frames:
+                # Follow the floor down quickly and up slowly, so speech doesn't raise it
+                self._noise_db += (level - self._noise_db) * (0.1 if level < self._noise_db else 0.01)
+            segment = self._step(frame, speech)
+            if segment:
+                segments.append(segment)
+            self._position += 1
+        return segments
+
+    def _step(self, frame, speech):
+        if not self._frames:
+            if not speech:
+                self._pre_roll.append(frame)
+                return None
+            self._frames = list(self._pre_roll)
+            self._pre_roll.clear()
+            self._start = (self._position - len(self._frames)) * self.frame_s
+            self._voiced = self._silence = 0
+        self._frames.append(frame)
+        if speech:
+            self._voiced += 1
+            self._silence = 0
+        else:
+            self._silence += 1
+        if self._silence >= self.hangover_frames or len(self._frames) >= self.max_segment_frames:
+            return self._emit()
+        return None
+
+    def _emit(self):
+        # Keep a little of the trailing silence so the last word isn't clipped
+        keep = len(self._frames) - max(0, self._silence - self._pre_roll.maxlen)
+        frames, voiced = self._frames[:keep], self._voiced
+        self._frames, self._voiced, self._silence = [], 0, 0
+        if voiced < self.min_speech_frames:
+            return None
+        return {"start": self._start, "end": self._start + len(frames) * self.frame_s, "audio": np.concatenate(frames)}
+
+    def flush(self):
+        """End the stream: the utterance in progress, if long enough"""
+        return [segment] if self._frames and (segment := self._emit()) else []
+
+
+def transcribe_segment(wav, prompt=None, model="whisper-1"):
+    """Whisper transcript of one WAV utterance; `prompt` carries the preceding text for context"""
+    from shared.openai_client import get_client
+
+    options = {"prompt": prompt} if prompt else {}
+    return get_scheduler().call(
+        get_client().audio.transcriptions.create,
+        model=model,
+        priority=INTERACTIVE,
+        file=("segment.wav", wav),
+        response_format="text",
+        **options
+    )
+
+
+class LiveTranscriber:
+    """Ingest audio chunks as they arrive; each finished utterance is transcribed in the background
+
+    Entries are {"start", "end", "text", "latency", "error"}, with times in seconds from the start
+    of the stream and latency measured from the end of the utterance to its transcript. Pass
+    live=False for audio fed faster than real time: its latencies are only processing times, so
+    they're kept out of live_segment_latency_seconds.
+    """
+
+    def __init__(self, transcribe=transcribe_segment, workers=2, live=True, **vad_options):
+        self.segmenter = VoiceActivitySegmenter(**vad_options)
+        self.live = live
+        self._transcribe = transcribe
+        self._pool = ThreadPoolExecutor(workers, thread_name_prefix="live-stt")
+        self._lock = threading.Lock()
+        self._entries = []
+        self._futures = []
+        self._drained = 0
+
+    def ingest(self, samples, sample_rate, channels=1):
+        """Add a chunk of PCM audio; returns the number of utterances it completed"""
+        mono = resample(to_mono_float(samples, channels), sample_rate, self.segmenter.sample_rate)
+        segments = self.segmenter.feed(mono)
+        for segment in segments:
+            self._submit(segment)
+        return len(segments)
+
+    def finish(self):
+        """Send off the utterance in progress at the end of the stream"""
+        for segment in self.segmenter.flush():
+            self._submit(segment)
+
+    def _submit(self, segment):
+        entry = {"start": round(segment["start"], 2), "end": round(segment["end"], 2), "text": None, "latency": None, "error": None}
+        with self._lock:
+            self._entries.append(entry)
+        SEGMENT_SECONDS.observe(segment["end"] - segment["start"], app=metrics.get_app())
+        self._futures.append(self._pool.submit(self._run, segment, entry, time.perf_counter(), metrics.get_app()))
+
+    def _run(self, segment, entry, ended, app):
+        metrics.set_app(app)
+        try:
+            with metrics.span("live_segment", seconds=round(segment["end"] - segment["start"], 2)):
+                text = self._transcribe(wav_bytes(segment["audio"], self.segmenter.sample_rate), prompt=self.transcript()[-PROMPT_CHARS:])
+            entry["text"] = text.strip()
+        except Exception as e:
+            entry["error"] = str(e)
+        entry["latency"] = round(time.perf_counter() - ended, 3)
+        if self.live:
+            SEGMENT_LATENCY.observe(entry["latency"], app=app)
+
+    def pending(self):
+        with self._lock:
+            return sum(1 for entry in self._entries if entry["latency"] is None)
+
+    def drain(self):
+        """Entries finished since the last call, in stream order (stopping at the first still running)"""
+        with self._lock:
+            done = []
+            for entry in self._entries[self._drained:]:
+                if entry["latency"] is None:
+                    break
+                done.append(entry)
+            self._drained += len(done)
+        return done
+
+    def transcript(self):
+        with self._lock:
+            return " ".join(entry["text"] for entry in self._entries if entry["text"])
+
+    def wait(self, timeout=None):
+        wait_futures(list(self._futures), timeout=timeout)
+
+    def close(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+def replay(transcriber, samples, rate, channels=1, chunk_ms=20, realtime=False):
+    """Feed a recording through the live ingest path in small chunks, as a microphone would"""
+    step = max(1, int(rate * chunk_ms / 1000)) * channels
+    started = time.perf_counter()
+    for offset in range(0, len(samples), step):
+        if realtime:
+            # Pace the chunks to the audio clock
+            time.sleep(max(0.0, offset / channels / rate - (time.perf_counter() - started)))
+        transcriber.ingest(samples[offset:offset + step], rate, channels)
+    transcriber.finish()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay WAV files through the live transcription path")
+    parser.add_argument("wavs", nargs="+", help="PCM WAV recordings")
+    parser.add_argument("--realtime", action="store_true", help="Feed audio at its real pace instead of as fast as possible")
+    parser.add_argument("--chunk-ms", type=int, default=20, help="Size of each ingested chunk (default: 20)")
+    parser.add_argument("--margin-db", type=float, default=10.0, help="Level above the noise floor that counts as speech (default: 10)")
+    parser.add_argument("--hangover-ms", type=int, default=500, help="Silence that ends an utterance (default: 500)")
+    parser.add_argument("--base-url", help="API base URL, e.g. a local mock such as http://127.0.0.1:8765/v1")
+    args = parser.parse_args()
+
+    import os
+
+    from dotenv import load_dotenv
+
+    from shared.openai_client import configure, get_client
+
+    load_dotenv()
+    api_key = os.getenv("OPENAI_API_KEY") or ("mock" if args.base_url else None)
+    if not api_key:
+        raise SystemExit("OPENAI_API_KEY is not set")
+    configure(api_key=api_key, base_url=args.base_url or os.getenv("OPENAI_BASE_URL"))
+    # Build the client up front so the first segment's latency doesn't include importing openai
+    get_client()
+    metrics.set_app("stt_live")
+
+    latencies = []
+    for path in args.wavs:
+        samples, rate, channels = read_wav(path)
+        transcriber = LiveTranscriber(live=args.realtime, margin_db=args.margin_db, hangover_ms=args.hangover_ms)
+        print(f"{path}: {len(samples) / channels / rate:.1f} s at {rate} Hz")
+        replay(transcriber, samples, rate, channels, args.chunk_ms, args.realtime)
+        transcriber.wait()
+        for entry in transcriber.drain():
+            latencies.append(entry["latency"])
+            print(f"  [{entry['start']:6.2f}-{entry['end']:6.2f}] {entry['latency']:.2f}s  {entry['text'] if entry['error'] is None else 'ERROR: ' + entry['error']}")
+        transcriber.close()
+    if latencies:
+        # Only a --realtime replay measures live latency; otherwise every utterance is sent at once
+        kind = "latency" if args.realtime else "processing time (not live, use --realtime)"
+        print(f"{len(latencies)} segment(s), {kind} p50={np.percentile(latencies, 50):.2f}s p95={np.percentile(latencies, 95):.2f}s")
+
+
+if __name__ == "__main__":
+    main()
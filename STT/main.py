@@ -1,11 +1,16 @@
 import streamlit as st
-import openai
-import os
-from dotenv import load_dotenv
 
-# Load environment variables from .env file and set OpenAI API key
-load_dotenv()
-openai.api_key = os.getenv("OPENAI_API_KEY")
+import repo_path  # noqa: F401 (puts the repo root on sys.path for `shared`)
+
+from shared import metrics
+from shared.openai_client import get_client
+from shared.router import get_router
+from shared.scheduler import get_scheduler
+from shared.startup import start_app
+
+# Label this rerun's metrics; once per process, load .env, expose /metrics (METRICS_PORT, by default per app)
+# and warm up the OpenAI client in the background
+start_app("stt", __file__)
 
 # Configure the Streamlit app
 st.set_page_config(page_title="Transcribe & Translate", layout="centered")
@@ -29,10 +34,11 @@ if audio_file:
   st.audio(audio_file, format="audio/mp3")
 
   # Transcribe the uploaded audio file using OpenAI Whisper
-  with st.spinner("Transcribing..."):
-    response = openai.Audio.transcribe(
+  with st.spinner("Transcribing..."), metrics.span("transcribe"):
+    response = get_scheduler().call(
+      get_client().audio.transcriptions.create,
       model="whisper-1",
-      file=audio_file,
+      file=(audio_file.name, audio_file.getvalue()),
       response_format="text"
     )
     st.success("✅ Transcription completed!")
@@ -46,13 +52,17 @@ if audio_file:
 
   # If a translation language is selected, translate the transcription
   if language != "None (Keep English)":
-    with st.spinner(f"Translating to {language}..."):
-      translation_response = openai.ChatCompletion.create(
-        model="gpt-3.5-turbo",
-        messages=[
-          {"role": "system", "content": "You are a professional translator."},
-          {"role": "user", "content": f"Translate the following text to {language}: {response}"}
-        ]
+    with st.spinner(f"Translating to {language}..."), metrics.span("translate", language=language):
+      translation_messages = [
+        {"role": "system", "content": "You are a professional translator."},
+        {"role": "user", "content": f"Translate the following text to {language}: {response}"}
+      ]
+      # The router picks a model suited to the language and length, falling back if it fails
+      route = get_router().choose("translation", translation_messages, len(response) // 2, language)
+      translation_response = get_router().call(
+        get_client().chat.completions.create,
+        route,
+        messages=translation_messages
       )
       translated_text = translation_response.choices[0].message.content
       st.success("✅ Translation completed!")
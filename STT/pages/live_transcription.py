@@ -0,0 +1,148 @@
+# Live microphone transcription page for the Transcription app
+import queue
+from pathlib import Path
+
+import streamlit as st
+
+import repo_path  # noqa: F401 (puts the repo root on sys.path for `shared`)
+
+from shared import metrics
+from shared.session_store import persist_session_state, save_session_state
+from shared.startup import start_app
+
+start_app("stt", str(Path(repo_path.__file__).with_name("STT.py")))
+
+st.set_page_config(page_title="Live Transcription", page_icon="🎙️", layout="centered")
+st.title("🎙️ Live Transcription")
+st.markdown("Speak into your microphone: each sentence is transcribed as soon as you pause, and added to the transcript below.")
+
+# The transcript survives a reload like the rest of the STT state
+persist_session_state("stt_live", ("live_segments",))
+
+if "live_segments" not in st.session_state:
+    st.session_state.live_segments = []
+
+
+def get_transcriber(live=True):
+    """This session's transcriber; not persisted, since it holds open audio and worker threads"""
+    from live import LiveTranscriber
+
+    if "live_transcriber" not in st.session_state:
+        st.session_state.live_transcriber = LiveTranscriber(live=live)
+    return st.session_state.live_transcriber
+
+
+def release_transcriber():
+    """Drop the transcriber once its capture has ended and everything in it is transcribed"""
+    transcriber = st.session_state.get("live_transcriber")
+    if transcriber is not None and not transcriber.pending():
+        collect()
+        del st.session_state.live_transcriber
+        transcriber.close()
+
+
+def collect():
+    """Move finished segments into the transcript; True if there were any"""
+    transcriber = st.session_state.get("live_transcriber")
+    finished = transcriber.drain() if transcriber is not None else []
+    st.session_state.live_segments.extend(finished)
+    return bool(finished)
+
+
+def render(container, live=True):
+    """Redraw the transcript; without `live`, the timings are processing times and aren't shown as latency"""
+    transcriber = st.session_state.get("live_transcriber")
+    segments = st.session_state.live_segments
+    with container.container():
+        if not segments:
+            st.info("💭 Nothing transcribed yet.")
+        for entry in segments:
+            timing = f"{entry['start']:.1f}–{entry['end']:.1f} s"
+            if live:
+                timing = f"⏱️ {entry['latency']:.2f} s · {timing}"
+            if entry["error"]:
+                st.error(f"❌ {entry['error']} ({timing})")
+            else:
+                st.markdown(f"{entry['text']}  \n<small>{timing}</small>", unsafe_allow_html=True)
+        if transcriber is not None and transcriber.pending():
+            st.caption(f"🔄 Transcribing {transcriber.pending()} segment(s)...")
+        latencies = [entry["latency"] for entry in segments if not entry["error"]]
+        if live and latencies:
+            st.caption(f"📊 {len(latencies)} segment(s), average latency {sum(latencies) / len(latencies):.2f} s")
+
+
+try:
+    from streamlit_webrtc import WebRtcMode, webrtc_streamer
+except ImportError:
+    webrtc_streamer = None
+
+if webrtc_streamer is not None:
+    # Streams the browser microphone to the server as it's captured
+    ctx = webrtc_streamer(
+        key="live-stt",
+        mode=WebRtcMode.SENDONLY,
+        audio_receiver_size=1024,
+        media_stream_constraints={"audio": True, "video": False}
+    )
+    transcript = st.empty()
+    if ctx.state.playing:
+        transcriber = get_transcriber()
+        render(transcript)
+        shown_pending = transcriber.pending()
+        while ctx.state.playing:
+            try:
+                frames = ctx.audio_receiver.get_frames(timeout=1)
+            except queue.Empty:
+                continue
+            for frame in frames:
+                transcriber.ingest(frame.to_ndarray(), frame.sample_rate, len(frame.layout.channels))
+            # Redraw only when a segment finished or started transcribing, not for every batch of frames
+            pending = transcriber.pending()
+            if collect() or pending != shown_pending:
+                shown_pending = pending
+                render(transcript)
+    elif "live_transcriber" in st.session_state:
+        # Stopped: send off the last utterance and collect what's still running
+        transcriber = st.session_state.live_transcriber
+        transcriber.finish()
+        with st.spinner("🔄 Finishing transcription..."):
+            transcriber.wait(timeout=60)
+    collect()
+    render(transcript)
+    if not ctx.state.playing:
+        release_transcriber()
+else:
+    # Without streamlit-webrtc there's no stream: record a clip in the browser and transcribe it
+    # once it's stopped. It goes through the same segmenter, so its utterances are transcribed in
+    # parallel rather than as one long file, but that's batch processing, not live latency
+    st.warning(
+        "⚠️ `streamlit-webrtc` isn't installed, so this page can't stream (`pip install -r requirements.txt`). "
+        "Record a clip instead: it's transcribed after you stop recording, not live."
+    )
+    clip = st.audio_input("🎤 Record a clip (not live)", sample_rate=16000)
+    transcript = st.empty()
+    if clip is not None and st.session_state.get("live_clip") != clip.file_id:
+        from live import read_wav, replay
+
+        st.session_state.live_clip = clip.file_id
+        transcriber = get_transcriber(live=False)
+        with st.spinner("🔄 Transcribing the recording..."), metrics.span("live_clip", bytes=clip.size):
+            samples, rate, channels = read_wav(clip)
+            replay(transcriber, samples, rate, channels)
+            transcriber.wait(timeout=120)
+    collect()
+    render(transcript, live=False)
+    release_transcriber()
+
+if st.session_state.live_segments:
+    text = " ".join(entry["text"] for entry in st.session_state.live_segments if entry["text"])
+    col1, col2 = st.columns(2)
+    with col1:
+        st.download_button("⬇️ Download Transcript", text, file_name="live_transcript.txt", mime="text/plain")
+    with col2:
+        if st.button("🗑️ Clear Transcript"):
+            st.session_state.live_segments = []
+            st.rerun()
+
+# Queue what this run changed for the session store
+save_session_state("stt_live")
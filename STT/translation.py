@@ -0,0 +1,33 @@
+# Translation requests, built the same way for the UI and for offline batches
+DEFAULT_MODEL = "gpt-4o-mini"
+TEMPERATURE = 0.3
+# Target languages offered in the app
+LANGUAGES = [
+    "Arabic", "French", "Spanish", "German", "Chinese (Simplified)",
+    "Chinese (Traditional)", "Japanese", "Korean", "Portuguese", "Italian",
+    "Russian", "Dutch", "Hindi", "Turkish", "Polish", "Swedish"
+]
+
+
+def translation_messages(text, language):
+    """Chat messages asking for `text` to be translated into `language`"""
+    return [
+        {
+            "role": "system",
+            "content": f"You are a professional translator. Translate the given text accurately to {language}. Maintain the original meaning, tone, and context. If the text is already in {language}, indicate that no translation is needed."
+        },
+        {
+            "role": "user",
+            "content": f"Translate this text to {language}:\n\n{text}"
+        }
+    ]
+
+
+def translation_request(text, language, model=DEFAULT_MODEL):
+    """Chat completion body for one translation; its canonical hash identifies the result"""
+    return {"model": model, "messages": translation_messages(text, language), "temperature": TEMPERATURE}
+
+
+def reply_budget(text):
+    """Tokens to budget for the reply: roughly twice the input, as non-Latin scripts need more"""
+    return len(text) // 2
@@ -0,0 +1,326 @@
+# End-to-end benchmarks: drive the three Streamlit apps headlessly against the mock OpenAI server
+import argparse
+import io
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import wave
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+from shared.mock_openai import MockOpenAIServer
+from shared.mock_redis import MockRedisServer
+
+APPS = ("chatbot", "stt", "image_gen")
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def git_commit():
+    """Current commit and whether the working tree has uncommitted changes"""
+    try:
+        sha = subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain"], cwd=REPO_ROOT, capture_output=True, text=True).stdout.strip())
+        return sha, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown", True
+
+
+def make_wav(seconds=1.0, rate=16000):
+    """A silent mono WAV clip to upload to the STT app"""
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as clip:
+        clip.setnchannels(1)
+        clip.setsampwidth(2)
+        clip.setframerate(rate)
+        clip.writeframes(b"\x00\x00" * int(seconds * rate))
+    return buffer.getvalue()
+
+
+def allow_concurrent_sessions():
+    """Let several AppTests run at once in this process, like sessions in one Streamlit server
+
+    AppTest assumes one test at a time: it compiles the script afresh on every run (and
+    compiling from many threads at once trips CPython's AST recursion-depth check), it
+    installs a mock Runtime singleton that it clears when each run ends, it patches the
+    "global.appTest" option only for the duration of a run, and it resets the class-wide
+    "uses pages directory" flag before each run, pulling all of these out from under any other
+    session still running (widgets then lose their state between reruns). Share one bytecode
+    cache, keep a standing mock Runtime, set the option for the whole process and let
+    AppTest reset a throwaway subclass's copy of the flag instead.
+    """
+    from unittest.mock import MagicMock
+
+    from streamlit import config, logger
+    from streamlit.runtime import Runtime
+    from streamlit.runtime.pages_manager import PagesManager
+    from streamlit.runtime.caching.storage.dummy_cache_storage import MemoryCacheStorageManager
+    from streamlit.runtime.dataframe_source_manager import DataframeSourceManager
+    from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+    from streamlit.runtime.media_file_manager import MediaFileManager
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+    from streamlit.testing.v1 import app_test, local_script_runner
+
+    config.set_option("global.appTest", True)
+    # Deprecation and missing-context warnings from headless runs would drown the report
+    config.set_option("global.suppressDeprecationWarnings", True)
+    config.set_option("logger.level", "error")
+    logger.set_log_level("error")
+
+    shared_cache = ScriptCache()
+    app_test.ScriptCache = local_script_runner.ScriptCache = lambda: shared_cache
+    app_test.PagesManager = type("PagesManager", (PagesManager,), {})
+
+    standing_runtime = MagicMock(spec=Runtime)
+    standing_runtime.media_file_mgr = MediaFileManager(MemoryMediaFileStorage("/mock/media"))
+    standing_runtime.dataframe_source_mgr = DataframeSourceManager()
+    standing_runtime.cache_storage_manager = MemoryCacheStorageManager()
+    Runtime.instance = classmethod(lambda cls: cls._instance or standing_runtime)
+    Runtime.exists = classmethod(lambda cls: True)
+
+
+def current_rss_mb():
+    """Resident memory of this process right now (Linux), or None where /proc isn't available"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError):
+        return None
+
+
+class PeakMemory:
+    """Samples resident memory on a background thread and keeps the highest reading"""
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.peak = current_rss_mb()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, current_rss_mb())
+
+    def __enter__(self):
+        if self.peak is not None:
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+
+def _check(at, flow):
+    """Fail the flow if the script raised or rendered an error"""
+    if at.exception:
+        raise RuntimeError(f"{flow}: {at.exception[0].value}")
+    if at.error:
+        raise RuntimeError(f"{flow}: {at.error[0].value}")
+
+
+def chatbot_flow(n, timeout):
+    """Load the chatbot and send one message"""
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(str(REPO_ROOT / "Chatbot" / "main.py"), default_timeout=timeout).run()
+    at.text_input(key="input").input(f"My name is Bench{n} and I like benchmarks.").run()
+    _check(at, "chatbot")
+    if len(at.session_state["messages"]) != 3:
+        raise RuntimeError("chatbot: no reply in the conversation")
+
+
+def stt_flow(n, timeout, audio=make_wav()):
+    """Upload a clip, transcribe it, then translate the transcription"""
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(str(REPO_ROOT / "STT" / "STT.py"), default_timeout=timeout).run()
+    at.sidebar.selectbox[0].select("French")
+    # A distinct clip per session so requests aren't coalesced away
+    at.file_uploader[0].set_value((f"clip{n}.wav", audio + str(n).encode(), "audio/wav")).run()
+    at.button[0].click().run()
+    _check(at, "stt transcription")
+    [button for button in at.button if "Translate" in button.label][0].click().run()
+    _check(at, "stt translation")
+    if at.session_state["translation_count"] != 1:
+        raise RuntimeError("stt: translation did not complete")
+
+
+def image_gen_flow(n, timeout, images=1):
+    """Queue an image job and rerun until it lands in the gallery"""
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(str(REPO_ROOT / "Image_gen" / "main.py"), default_timeout=timeout).run()
+    at.sidebar.slider[0].set_value(images)
+    at.text_area[0].input(f"Benchmark landscape number {n}")
+    [button for button in at.button if "Generate" in button.label][0].click().run()
+    _check(at, "image_gen submit")
+    deadline = time.monotonic() + timeout
+    # The live app polls from a fragment; AppTest doesn't tick fragments, so rerun instead
+    while len(at.session_state["generated_images"]) < images:
+        if time.monotonic() > deadline:
+            raise RuntimeError("image_gen: timed out waiting for the gallery")
+        time.sleep(0.05)
+        at.run()
+        _check(at, "image_gen collect")
+
+
+FLOWS = {"chatbot": chatbot_flow, "stt": stt_flow, "image_gen": image_gen_flow}
+
+
+def run_level(app, concurrency, sessions, timeout):
+    """Run `sessions` flows of one app across `concurrency` threads and summarise them"""
+    flow = FLOWS[app]
+    latencies = []
+    errors = []
+
+    def timed(n):
+        started = time.perf_counter()
+        try:
+            flow(n, timeout)
+            latencies.append(time.perf_counter() - started)
+        except Exception as e:
+            errors.append(str(e))
+
+    if tracemalloc.is_tracing():
+        tracemalloc.reset_peak()
+    started = time.perf_counter()
+    with PeakMemory() as memory, ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(timed, range(sessions)))
+    elapsed = time.perf_counter() - started
+    traced_peak = tracemalloc.get_traced_memory()[1] / 2 ** 20 if tracemalloc.is_tracing() else None
+
+    return {
+        "app": app,
+        "concurrency": concurrency,
+        "sessions": sessions,
+        "ok": len(latencies),
+        "errors": len(errors),
+        "error_samples": errors[:3],
+        "p50_s": percentile(latencies, 0.5),
+        "p95_s": percentile(latencies, 0.95),
+        "mean_s": sum(latencies) / len(latencies) if latencies else None,
+        "throughput_per_s": len(latencies) / elapsed if elapsed else None,
+        "elapsed_s": elapsed,
+        "peak_rss_mb": memory.peak,
+        "peak_traced_mb": traced_peak,
+        # ru_maxrss is KiB on Linux and bytes on macOS; it only ever grows over the run
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (2 ** 20 if sys.platform == "darwin" else 2 ** 10)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Chatbot, STT and Image_gen apps against a mock OpenAI server")
+    parser.add_argument("--apps", default=",".join(APPS), help=f"Comma-separated apps to run (default: {','.join(APPS)})")
+    parser.add_argument("-c", "--concurrency", default="1,4,8", help="Comma-separated concurrency levels (default: 1,4,8)")
+    parser.add_argument("-n", "--sessions", type=int, default=16, help="Sessions per app and concurrency level (default: 16)")
+    parser.add_argument("--latency", type=float, default=0.2, help="Mock chat/transcription latency in seconds (default: 0.2)")
+    parser.add_argument("--image-latency", type=float, default=0.5, help="Mock image generation latency in seconds (default: 0.5)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of mock requests failing with 500 (default: 0)")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fraction of mock requests answered with 429 (default: 0)")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Per-flow timeout in seconds (default: 60)")
+    parser.add_argument("--session-store", choices=("sqlite", "redis", "none"), default="sqlite",
+                        help="Session state backend; redis uses the local stand-in (default: sqlite)")
+    parser.add_argument("--tracemalloc", action="store_true",
+                        help="Also record the Python heap peak (slows every flow down considerably)")
+    parser.add_argument("-o", "--output", help="Results file (default: benchmarks/results/<commit>.json)")
+    args = parser.parse_args()
+
+    apps = [app.strip() for app in args.apps.split(",") if app.strip()]
+    unknown = set(apps) - set(APPS)
+    if unknown:
+        parser.error(f"unknown apps: {', '.join(sorted(unknown))}")
+    levels = [int(level) for level in args.concurrency.split(",")]
+
+    server = MockOpenAIServer(
+        latency=args.latency,
+        audio_latency=args.latency,
+        image_latency=args.image_latency,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate
+    )
+    server.start()
+    workdir = tempfile.TemporaryDirectory(prefix="bench_apps_")
+    try:
+        session_stores = {
+            "sqlite": lambda: f"sqlite:///{os.path.join(workdir.name, 'session_state.db')}",
+            "redis": lambda: MockRedisServer().start().url,
+            "none": lambda: "none"
+        }
+        # Point every app at the mock and keep their on-disk state out of the repo
+        os.environ.update({
+            "OPENAI_API_KEY": "mock",
+            "OPENAI_BASE_URL": server.url,
+            "METRICS_PORT": "0",
+            "IMAGE_JOBS_DB": os.path.join(workdir.name, "image_jobs.db"),
+            "IMAGE_OUTPUT_DIR": os.path.join(workdir.name, "generated_images"),
+            "IMAGE_JOB_WORKERS": str(max(levels)),
+            "SESSION_STORE_URL": session_stores[args.session_store](),
+            "BATCH_RESULTS_DB": os.path.join(workdir.name, "batch_results.db")
+        })
+
+        allow_concurrent_sessions()
+
+        if args.tracemalloc:
+            tracemalloc.start()
+        results = []
+        try:
+            for app in apps:
+                # One untimed session warms imports and cached resources
+                FLOWS[app](-1, args.timeout)
+                for level in levels:
+                    result = run_level(app, level, args.sessions, args.timeout)
+                    results.append(result)
+                    print(
+                        f"{app:>10} c={level:<3} ok={result['ok']:<4} err={result['errors']:<3} "
+                        f"p50={result['p50_s'] or 0:.3f}s p95={result['p95_s'] or 0:.3f}s "
+                        f"{result['throughput_per_s'] or 0:.2f}/s rss={result['peak_rss_mb'] or 0:.0f}MB"
+                    )
+                    for error in result["error_samples"]:
+                        print(f"{'':>10} error: {error}")
+        finally:
+            tracemalloc.stop()
+            server.stop()
+
+        commit, dirty = git_commit()
+        report = {
+            "commit": commit,
+            "dirty": dirty,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "config": {key: value for key, value in vars(args).items() if key != "output"},
+            "mock": server.snapshot(),
+            "results": results
+        }
+        output = Path(args.output) if args.output else RESULTS_DIR / f"{commit[:12]}{'-dirty' if dirty else ''}.json"
+        output.parent.mkdir(parents=True, exist_ok=True)
+        output.write_text(json.dumps(report, indent=2))
+        print(f"Results written to {output}")
+    finally:
+        workdir.cleanup()
+    return 1 if any(result["errors"] for result in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,79 @@
+# Compare two benchmark result files, e.g. before and after a change
+import argparse
+import json
+import sys
+
+METRICS = (
+    # (result key, column title, True if bigger is better)
+    ("p50_s", "p50", False),
+    ("p95_s", "p95", False),
+    ("throughput_per_s", "req/s", True),
+    ("peak_rss_mb", "peak RSS MB", False)
+)
+
+
+def load(path):
+    with open(path) as f:
+        report = json.load(f)
+    return report, {(row["app"], row["concurrency"]): row for row in report["results"]}
+
+
+def change(before, after):
+    """Relative change in percent, or None when it can't be computed"""
+    if before in (None, 0) or after is None:
+        return None
+    return (after - before) / before * 100
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two bench_apps.py result files")
+    parser.add_argument("baseline", help="Results from the reference commit")
+    parser.add_argument("candidate", help="Results from the commit being evaluated")
+    parser.add_argument("--threshold", type=float, default=10.0,
+                        help="Flag changes that are this many percent worse (default: 10)")
+    args = parser.parse_args()
+
+    baseline, base_rows = load(args.baseline)
+    candidate, cand_rows = load(args.candidate)
+    print(f"baseline:  {baseline['commit'][:12]}{' (dirty)' if baseline['dirty'] else ''}")
+    print(f"candidate: {candidate['commit'][:12]}{' (dirty)' if candidate['dirty'] else ''}")
+    if baseline["config"] != candidate["config"]:
+        print("⚠️  The runs used different settings; numbers may not be comparable")
+    print()
+
+    # Each cell shows the candidate's value and its change from the baseline
+    header = f"{'app':>10} {'conc':>4}" + "".join(f" {title:>20}" for _, title, _ in METRICS)
+    print(header)
+    print("-" * len(header))
+    regressions = []
+    for key in sorted(set(base_rows) & set(cand_rows)):
+        before, after = base_rows[key], cand_rows[key]
+        cells = []
+        for name, title, higher_is_better in METRICS:
+            delta = change(before[name], after[name])
+            if delta is None:
+                cells.append(f"{'-':>20}")
+                continue
+            worse = -delta if higher_is_better else delta
+            flag = " !" if worse > args.threshold else "  "
+            if worse > args.threshold:
+                regressions.append(f"{key[0]} c={key[1]} {title} {delta:+.1f}%")
+            cells.append(f"{after[name]:.3f} ({delta:+.1f}%){flag}".rjust(20))
+        if after["errors"] > before["errors"]:
+            regressions.append(f"{key[0]} c={key[1]} errors {before['errors']} → {after['errors']}")
+        print(f"{key[0]:>10} {key[1]:>4}" + "".join(f" {cell}" for cell in cells))
+
+    missing = set(base_rows) ^ set(cand_rows)
+    if missing:
+        print(f"\nOnly in one run: {', '.join(f'{app} c={level}' for app, level in sorted(missing))}")
+    if regressions:
+        print(f"\n❌ {len(regressions)} regression(s) beyond {args.threshold:g}%:")
+        for regression in regressions:
+            print(f"  - {regression}")
+        return 1
+    print("\n✅ No regressions beyond the threshold")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
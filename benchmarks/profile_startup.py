@@ -0,0 +1,177 @@
+# Import-time and rerun-time profile of each app's cold start
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+SCRIPTS = {
+    "chatbot": REPO_ROOT / "Chatbot" / "main.py",
+    "stt": REPO_ROOT / "STT" / "STT.py",
+    "image_gen": REPO_ROOT / "Image_gen" / "main.py"
+}
+
+# Written to stderr between framework imports and the app's own, so the parent can split them
+MARKER = "### first run starts ###"
+IMPORT_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def child(app, reruns):
+    """Runs in a fresh interpreter: time the first run and the reruns after it"""
+    from streamlit.testing.v1 import AppTest
+
+    from bench_apps import allow_concurrent_sessions
+
+    # Reuse compiled bytecode across reruns as a real server does, so reruns time the app, not AppTest
+    allow_concurrent_sessions()
+
+    at = AppTest.from_file(str(SCRIPTS[app]), default_timeout=120)
+    modules_before = set(sys.modules)
+    print(MARKER, file=sys.stderr, flush=True)
+    started = time.perf_counter()
+    at.run()
+    first_run = time.perf_counter() - started
+    print(MARKER, file=sys.stderr, flush=True)
+    if at.exception:
+        raise SystemExit(f"{app}: {at.exception[0].value}")
+
+    # Let background warm-up (e.g. importing openai) finish first: it competes for the GIL, and
+    # a person takes longer than that to click anything after the first paint
+    for thread in threading.enumerate():
+        if thread.name.endswith("-prewarm"):
+            thread.join()
+    warmed_up = time.perf_counter() - started
+
+    timings = []
+    for _ in range(reruns):
+        started = time.perf_counter()
+        at.run()
+        timings.append(time.perf_counter() - started)
+
+    print(json.dumps({
+        "first_run_s": first_run,
+        "warmed_up_s": warmed_up,
+        "rerun_timings_s": timings,
+        "modules_loaded": len(set(sys.modules) - modules_before)
+    }))
+
+
+def parse_imports(stderr):
+    """Import cost during the first run, grouped by top-level package"""
+    sections = stderr.split(MARKER)
+    lines = sections[1] if len(sections) > 2 else ""
+    packages = defaultdict(float)
+    total = 0.0
+    entries = [(int(cumulative), len(indent), name) for _, cumulative, indent, name in IMPORT_LINE.findall(lines)]
+    if entries:
+        # Only the outermost imports: their cumulative time already includes everything nested
+        outer = min(depth for _, depth, _ in entries)
+        for cumulative, depth, name in entries:
+            if depth == outer:
+                packages[name.split(".")[0]] += cumulative / 1e6
+                total += cumulative / 1e6
+    top = sorted(packages.items(), key=lambda item: item[1], reverse=True)
+    return total, [{"package": name, "seconds": seconds} for name, seconds in top]
+
+
+def profile(app, reruns, env):
+    """Profile one app in a fresh interpreter so nothing is already imported or cached"""
+    started = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", __file__, "--child", app, "--reruns", str(reruns)],
+        cwd=SCRIPTS[app].parent, env=env, capture_output=True, text=True
+    )
+    wall = time.perf_counter() - started
+    if proc.returncode:
+        raise RuntimeError(f"{app} failed:\n{proc.stderr[-2000:]}")
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    import_total, packages = parse_imports(proc.stderr)
+    return {
+        "app": app,
+        "process_wall_s": wall,
+        **result,
+        "first_run_import_s": import_total,
+        "top_imports": packages[:10]
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure each app's first-run (first paint) and rerun cost")
+    parser.add_argument("--apps", default=",".join(SCRIPTS), help=f"Comma-separated apps (default: {','.join(SCRIPTS)})")
+    parser.add_argument("--reruns", type=int, default=50, help="Reruns timed after the first run (default: 50)")
+    parser.add_argument("--repeat", type=int, default=3, help="Fresh processes per app; the fastest is kept (default: 3)")
+    parser.add_argument("-o", "--output", help="Results file (default: benchmarks/results/startup-<commit>.json)")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    sys.path.insert(0, str(REPO_ROOT / "benchmarks"))
+    if args.child:
+        child(args.child, args.reruns)
+        return 0
+
+    from bench_apps import git_commit
+
+    workdir = tempfile.TemporaryDirectory(prefix="profile_startup_")
+    try:
+        env = {
+            **os.environ,
+            # First paint doesn't call the API, but the apps check that a key is configured
+            "OPENAI_API_KEY": os.getenv("OPENAI_API_KEY", "mock"),
+            "METRICS_PORT": "0",
+            "IMAGE_JOBS_DB": os.path.join(workdir.name, "image_jobs.db"),
+            "IMAGE_OUTPUT_DIR": os.path.join(workdir.name, "generated_images"),
+            "SESSION_STORE_URL": f"sqlite:///{os.path.join(workdir.name, 'session_state.db')}",
+            "BATCH_RESULTS_DB": os.path.join(workdir.name, "batch_results.db"),
+            "STREAMLIT_LOGGER_LEVEL": "error"
+        }
+
+        results = []
+        for app in [app.strip() for app in args.apps.split(",") if app.strip()]:
+            runs = [profile(app, args.reruns, env) for _ in range(args.repeat)]
+            # Fastest cold start, but rerun percentiles over every process's reruns
+            best = dict(min(runs, key=lambda run: run["first_run_s"]))
+            timings = sorted(timing for run in runs for timing in run["rerun_timings_s"])
+            del best["rerun_timings_s"]
+            best["rerun_p50_s"] = statistics.median(timings)
+            best["rerun_p95_s"] = timings[min(len(timings) - 1, int(0.95 * len(timings)))]
+            results.append(best)
+            print(
+                f"{app:>10}  first run {best['first_run_s'] * 1000:7.1f} ms "
+                f"(imports {best['first_run_import_s'] * 1000:6.1f} ms, {best['modules_loaded']} modules)  "
+                f"warm {best['warmed_up_s'] * 1000:7.1f} ms  "
+                f"rerun p50 {best['rerun_p50_s'] * 1000:6.1f} ms  p95 {best['rerun_p95_s'] * 1000:6.1f} ms"
+            )
+            for entry in best["top_imports"][:5]:
+                print(f"{'':>12}{entry['seconds'] * 1000:7.1f} ms  {entry['package']}")
+    finally:
+        workdir.cleanup()
+
+    commit, dirty = git_commit()
+    report = {
+        "commit": commit,
+        "dirty": dirty,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "python": sys.version.split()[0],
+        "config": {"reruns": args.reruns, "repeat": args.repeat},
+        "results": results
+    }
+    output = Path(args.output) if args.output else RESULTS_DIR / f"startup-{commit[:12]}{'-dirty' if dirty else ''}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(f"Results written to {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1 @@
+# Helpers shared by the Chatbot, STT and Image_gen apps
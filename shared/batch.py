@@ -0,0 +1,351 @@
+# Offline OpenAI Batch API pipeline: JSONL shards, submission, polling and results by custom_id
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+from shared import metrics
+from shared.singleflight import request_key
+
+ENDPOINT = "/v1/chat/completions"
+# Per-batch limits of the Batch API
+MAX_REQUESTS = 50000
+MAX_BYTES = 200 * 1024 * 1024
+TERMINAL = {"completed", "failed", "expired", "cancelled"}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS batch_results (
+    custom_id TEXT PRIMARY KEY,
+    namespace TEXT NOT NULL,
+    body TEXT,
+    error TEXT,
+    batch_id TEXT,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS batches (
+    id TEXT PRIMARY KEY,
+    shard TEXT NOT NULL,
+    requests INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    finished_at REAL
+);
+CREATE TABLE IF NOT EXISTS batch_requests (
+    batch_id TEXT NOT NULL,
+    custom_id TEXT NOT NULL,
+    PRIMARY KEY (batch_id, custom_id)
+);
+"""
+
+BATCH_RESULTS = metrics.REGISTRY.counter(
+    "openai_batch_results_total", "Batch API results stored, by outcome", ("app", "namespace", "status")
+)
+
+
+def custom_id(namespace, body):
+    """The request's canonical hash, as used for single-flight keys: identical requests share a result"""
+    return request_key(namespace, body)
+
+
+def batch_line(namespace, body):
+    """One line of a batch input file"""
+    line = {"custom_id": custom_id(namespace, body), "method": "POST", "url": ENDPOINT, "body": body}
+    return line["custom_id"], json.dumps(line, separators=(",", ":"), ensure_ascii=False).encode() + b"\n"
+
+
+def shard(lines, max_requests=MAX_REQUESTS, max_bytes=MAX_BYTES):
+    """Split encoded lines into groups within both the request count and the file size limit"""
+    current, size = [], 0
+    for line in lines:
+        if len(line) > max_bytes:
+            raise ValueError(f"A single request is {len(line)} bytes, over the {max_bytes} byte batch limit")
+        if current and (len(current) >= max_requests or size + len(line) > max_bytes):
+            yield current
+            current, size = [], 0
+        current.append(line)
+        size += len(line)
+    if current:
+        yield current
+
+
+def completion_text(body):
+    """Reply text of a chat completion response body"""
+    return body["choices"][0]["message"]["content"]
+
+
+class ResultStore:
+    """SQLite table of batch results by custom_id, plus the batches still being waited on"""
+
+    def __init__(self, db_path="batch_results.db"):
+        self.db_path = db_path
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        """Open a short-lived connection; SQLite connections can't be shared across threads"""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, key):
+        """Response body of a successful result, or None"""
+        with self._connect() as conn:
+            row = conn.execute("SELECT body FROM batch_results WHERE custom_id = ? AND body IS NOT NULL", (key,)).fetchone()
+        return json.loads(row["body"]) if row else None
+
+    def bodies(self, keys):
+        """{custom_id: response body} for the keys with a successful result"""
+        keys, found = list(keys), {}
+        # Stay under SQLite's bound parameter limit
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            with self._connect() as conn:
+                rows = conn.execute(
+                    f"SELECT custom_id, body FROM batch_results WHERE body IS NOT NULL AND custom_id IN ({','.join('?' * len(chunk))})",
+                    chunk
+                ).fetchall()
+            found.update((row["custom_id"], json.loads(row["body"])) for row in rows)
+        return found
+
+    def put(self, key, namespace, body=None, error=None, batch_id=None):
+        """Record a result; a later success replaces an earlier failure"""
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO batch_results (custom_id, namespace, body, error, batch_id, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, namespace, json.dumps(body) if body is not None else None, error, batch_id, time.time())
+            )
+
+    def add_batch(self, batch_id, shard_path, keys, status):
+        """Record a submitted batch and the custom_ids it carries"""
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO batches (id, shard, requests, status, created_at) VALUES (?, ?, ?, ?, ?)",
+                (batch_id, str(shard_path), len(keys), status, time.time())
+            )
+            conn.executemany(
+                "INSERT OR IGNORE INTO batch_requests (batch_id, custom_id) VALUES (?, ?)",
+                ((batch_id, key) for key in keys)
+            )
+
+    def update_batch(self, batch_id, status):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE batches SET status = ?, finished_at = ? WHERE id = ?",
+                (status, time.time() if status in TERMINAL else None, batch_id)
+            )
+
+    def open_batches(self):
+        """{batch id: shard path} for submitted batches whose results haven't been collected yet"""
+        with self._connect() as conn:
+            rows = conn.execute(
+                f"SELECT id, shard FROM batches WHERE status NOT IN ({','.join('?' * len(TERMINAL))}) ORDER BY created_at",
+                sorted(TERMINAL)
+            ).fetchall()
+        return {row["id"]: Path(row["shard"]) for row in rows}
+
+    def in_flight(self):
+        """custom_ids of the requests in submitted batches whose results haven't been collected yet"""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT DISTINCT r.custom_id FROM batch_requests r JOIN batches b ON b.id = r.batch_id "
+                f"WHERE b.status NOT IN ({','.join('?' * len(TERMINAL))})",
+                sorted(TERMINAL)
+            ).fetchall()
+        return {row["custom_id"] for row in rows}
+
+
+class BatchPipeline:
+    """Compile requests into JSONL shards, submit them, poll, and stream the results into the store"""
+
+    def __init__(self, store, client=None, work_dir="batch_work", poll_interval=10.0,
+                 max_requests=MAX_REQUESTS, max_bytes=MAX_BYTES, completion_window="24h"):
+        self.store = store
+        self._client = client
+        self.work_dir = Path(work_dir)
+        self.poll_interval = poll_interval
+        self.max_requests = max_requests
+        self.max_bytes = max_bytes
+        self.completion_window = completion_window
+
+    @property
+    def client(self):
+        if self._client is None:
+            from shared.openai_client import get_client
+
+            self._client = get_client()
+        return self._client
+
+    def compile(self, requests, prefix="batch", in_flight=()):
+        """Write shard files for the (namespace, body) requests without a stored result yet
+
+        Duplicates, and requests in the `in_flight` set of custom_ids, are sent once. Returns
+        (shard paths, number of requests already answered).
+        """
+        lines = {}
+        for namespace, body in requests:
+            key, line = batch_line(namespace, body)
+            lines.setdefault(key, line)
+        answered = self.store.bodies(lines)
+        pending = [line for key, line in lines.items() if key not in answered and key not in in_flight]
+
+        self.work_dir.mkdir(parents=True, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        paths = []
+        for index, group in enumerate(shard(pending, self.max_requests, self.max_bytes), 1):
+            path = self.work_dir / f"{prefix}_{stamp}_{index:03d}.jsonl"
+            with open(path, "wb") as f:
+                f.writelines(group)
+            paths.append(path)
+        return paths, len(answered)
+
+    def submit(self, path):
+        """Upload one shard and start its batch; returns the batch id"""
+        with metrics.span("batch_submit", shard=path.name), open(path, "rb") as f:
+            keys = [json.loads(line)["custom_id"] for line in f if line.strip()]
+            f.seek(0)
+            uploaded = self.client.files.create(file=(path.name, f), purpose="batch")
+            batch = self.client.batches.create(
+                input_file_id=uploaded.id,
+                endpoint=ENDPOINT,
+                completion_window=self.completion_window,
+                metadata={"shard": path.name}
+            )
+        self.store.add_batch(batch.id, path, keys, batch.status)
+        return batch.id
+
+    def _stream_file(self, file_id):
+        """Result lines of an output or error file, parsed as they arrive"""
+        with self.client.files.with_streaming_response.content(file_id) as response:
+            for line in response.iter_lines():
+                if line.strip():
+                    yield json.loads(line)
+
+    def _collect(self, batch):
+        """Store and yield every result of a finished batch"""
+        with metrics.span("batch_collect", batch=batch.id, status=batch.status):
+            for file_id in (batch.output_file_id, batch.error_file_id):
+                if not file_id:
+                    continue
+                for result in self._stream_file(file_id):
+                    key = result["custom_id"]
+                    namespace = key.split(":", 1)[0]
+                    response = result.get("response") or {}
+                    if response.get("status_code") == 200:
+                        body, error = response["body"], None
+                    else:
+                        body = None
+                        error = result.get("error") or (response.get("body") or {}).get("error") or response
+                        error = error.get("message", json.dumps(error)) if isinstance(error, dict) else str(error)
+                    self.store.put(key, namespace, body=body, error=error, batch_id=batch.id)
+                    BATCH_RESULTS.inc(app=metrics.get_app(), namespace=namespace, status="ok" if error is None else "failed")
+                    yield key, body, error
+
+    def poll(self, batch_ids):
+        """Wait for the batches, yielding (custom_id, body, error) as each one's results come in"""
+        waiting = list(batch_ids)
+        while waiting:
+            for batch_id in list(waiting):
+                batch = self.client.batches.retrieve(batch_id)
+                if batch.status not in TERMINAL:
+                    continue
+                if batch.status != "completed":
+                    errors = getattr(batch, "errors", None)
+                    details = "; ".join(e.message for e in (errors.data if errors and errors.data else []) if e.message)
+                    print(f"Batch {batch_id} {batch.status}{': ' + details if details else ''}", file=sys.stderr)
+                # Expired and cancelled batches still return whatever finished in time
+                yield from self._collect(batch)
+                self.store.update_batch(batch_id, batch.status)
+                waiting.remove(batch_id)
+            if waiting:
+                time.sleep(self.poll_interval)
+
+    def run(self, requests, prefix="batch", wait=True):
+        """Compile, submit and (with `wait`) collect; batches left by an earlier run are collected too"""
+        resumed = self.store.open_batches()
+        # Requests an earlier run already submitted aren't sent again, even if its shard files are gone
+        paths, answered = self.compile(requests, prefix, self.store.in_flight())
+        print(f"{answered} request(s) already answered, {len(paths)} new shard(s), {len(resumed)} batch(es) still open")
+        batch_ids = list(resumed) + [self.submit(path) for path in paths]
+        if wait:
+            yield from self.poll(batch_ids)
+
+
+_store_lock = threading.Lock()
+_store = None
+
+
+def get_result_store():
+    """Process-wide result store at $BATCH_RESULTS_DB, or None while it's unset and no batch_results.db exists"""
+    global _store
+    if _store is None:
+        path = os.getenv("BATCH_RESULTS_DB")
+        if path is None:
+            # Without a configured store, don't create one in the working directory just to look things up
+            path = "batch_results.db"
+            if not os.path.exists(path):
+                return None
+        with _store_lock:
+            if _store is None:
+                _store = ResultStore(path)
+    return _store
+
+
+def cached_result(namespace, body, models=()):
+    """Response body a batch already produced for exactly this request, or None
+
+    With `models` (e.g. a route's candidates), a result for the same request sent to one of them
+    counts too; the request's own model is still preferred.
+    """
+    store = get_result_store()
+    if store is None:
+        return None
+    keys = [custom_id(namespace, body)]
+    keys += [custom_id(namespace, {**body, "model": model}) for model in models if model != body.get("model")]
+    found = store.bodies(keys) if len(keys) > 1 else {}
+    found = next((found[key] for key in keys if key in found), None) if found else store.get(keys[0])
+    metrics.record_cache(f"batch:{namespace}", hit=found is not None)
+    return found
+
+
+def add_arguments(parser):
+    """Command-line options shared by the batch scripts"""
+    parser.add_argument("--work-dir", default="batch_work", help="Where shard files are written (default: batch_work)")
+    parser.add_argument("--results-db", default=os.getenv("BATCH_RESULTS_DB", "batch_results.db"),
+                        help="Result store the apps read from (default: $BATCH_RESULTS_DB or batch_results.db)")
+    parser.add_argument("--poll-interval", type=float, default=30.0, help="Seconds between status checks (default: 30)")
+    parser.add_argument("--max-requests", type=int, default=MAX_REQUESTS, help=f"Requests per shard (default: {MAX_REQUESTS})")
+    parser.add_argument("--max-bytes", type=int, default=MAX_BYTES, help=f"Bytes per shard file (default: {MAX_BYTES})")
+    parser.add_argument("--no-wait", action="store_true", help="Submit and exit; run again later to collect the results")
+    parser.add_argument("--base-url", default=os.getenv("OPENAI_BASE_URL"), help="API base URL, e.g. a local mock such as http://127.0.0.1:8765/v1")
+
+
+def pipeline_from_args(args):
+    """Configure the client from the parsed options and build the pipeline"""
+    from dotenv import load_dotenv
+
+    from shared.openai_client import configure
+
+    load_dotenv()
+    api_key = os.getenv("OPENAI_API_KEY") or ("mock" if args.base_url else None)
+    if not api_key:
+        raise SystemExit("OPENAI_API_KEY is not set")
+    configure(api_key=api_key, base_url=args.base_url)
+    return BatchPipeline(
+        ResultStore(args.results_db),
+        work_dir=args.work_dir,
+        poll_interval=args.poll_interval,
+        max_requests=args.max_requests,
+        max_bytes=args.max_bytes
+    )
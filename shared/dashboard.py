@@ -0,0 +1,120 @@
+# In-app metrics dashboard page, shared by the three apps
+from datetime import datetime
+
+import streamlit as st
+
+from shared import metrics
+from shared.singleflight import get_singleflight
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def _format_seconds(value):
+    return "-" if value is None else f"{value * 1000:.0f} ms" if value < 1 else f"{value:.2f} s"
+
+
+def metrics_page(app):
+    """The whole metrics page of an app's pages/ folder"""
+    metrics.set_app(app)
+    st.set_page_config(page_title="Performance Metrics", page_icon="📊", layout="wide")
+    render_metrics_dashboard()
+
+
+def render_metrics_dashboard():
+    """Render API latency, token, cost, cache and stage timings for this process"""
+    st.title("📊 Performance Metrics")
+    port = metrics.start_metrics_server()
+    st.caption(
+        f"App: {metrics.get_app()} · Prometheus endpoint: "
+        + (f"http://127.0.0.1:{port}/metrics" if port else "disabled (see METRICS_PORT)")
+    )
+    if st.button("🔄 Refresh"):
+        st.rerun()
+
+    # Per model/endpoint API summary
+    requests = metrics.REQUESTS.samples()
+    tokens = metrics.TOKENS.samples()
+    costs = metrics.COST.samples()
+    rows = []
+    for app, model, endpoint in sorted(metrics.DURATION.series()):
+        labels = {"app": app, "model": model, "endpoint": endpoint}
+        durations = metrics.DURATION.recent(**labels)
+        ttfbs = metrics.TTFB.recent(**labels)
+        calls = sum(v for k, v in requests.items() if k[:3] == (app, model, endpoint))
+        errors = sum(v for k, v in requests.items() if k[:3] == (app, model, endpoint) and k[3] != "ok")
+        rows.append({
+            "App": app,
+            "Model": model,
+            "Endpoint": endpoint,
+            "Calls": int(calls),
+            "Errors": int(errors),
+            "p50": _format_seconds(percentile(durations, 0.5)),
+            "p95": _format_seconds(percentile(durations, 0.95)),
+            "TTFB p50": _format_seconds(percentile(ttfbs, 0.5)),
+            "Prompt tokens": int(tokens.get((app, model, "prompt"), 0)),
+            "Completion tokens": int(tokens.get((app, model, "completion"), 0)),
+            "Est. cost ($)": round(costs.get((app, model), 0.0), 4)
+        })
+
+    st.header("🔌 API Calls")
+    if rows:
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Calls", sum(row["Calls"] for row in rows))
+        col2.metric("Errors", sum(row["Errors"] for row in rows))
+        col3.metric("Est. cost", f"${sum(costs.values()):.4f}")
+        st.dataframe(rows, use_container_width=True)
+    else:
+        st.info("No API calls recorded in this process yet.")
+
+    # Request coalescing and cache effectiveness
+    st.header("♻️ Caching & Coalescing")
+    flight_stats = get_singleflight().stats()
+    cache_rows = []
+    for (app, cache, result), value in sorted(metrics.CACHE.samples().items()):
+        cache_rows.append({"App": app, "Cache": cache, "Result": result, "Lookups": int(value)})
+    if cache_rows:
+        saved = sum(counts["coalesced"] for counts in flight_stats.values())
+        st.metric("Upstream calls saved by coalescing", saved)
+        st.dataframe(cache_rows, use_container_width=True)
+    else:
+        st.info("No cache lookups yet.")
+
+    # Pipeline stage timings
+    st.header("⏱️ Pipeline Stages")
+    stage_rows = []
+    for app, stage, status in sorted(metrics.STAGES.series()):
+        durations = metrics.STAGES.recent(app=app, stage=stage, status=status)
+        stage_rows.append({
+            "App": app,
+            "Stage": stage,
+            "Status": status,
+            "Count": len(durations),
+            "p50": _format_seconds(percentile(durations, 0.5)),
+            "p95": _format_seconds(percentile(durations, 0.95)),
+            "Max": _format_seconds(max(durations) if durations else None)
+        })
+    if stage_rows:
+        st.dataframe(stage_rows, use_container_width=True)
+
+        with st.expander("🧵 Recent Traces"):
+            spans = metrics.recent_spans(200)
+            st.dataframe([{
+                "Time": datetime.fromtimestamp(span["start"]).strftime("%H:%M:%S"),
+                "Trace": span["trace_id"],
+                "Parent": span["parent_id"] or "",
+                "Stage": span["stage"],
+                "Duration": _format_seconds(span["duration"]),
+                "Status": span["status"],
+                "Details": ", ".join(f"{k}={v}" for k, v in span["attributes"].items())
+            } for span in spans], use_container_width=True)
+    else:
+        st.info("No pipeline stages recorded yet.")
+
+    with st.expander("📄 Raw Prometheus Metrics"):
+        st.code(metrics.REGISTRY.render(), language="text")
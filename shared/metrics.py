@@ -0,0 +1,364 @@
+# Per-call latency, token and cost instrumentation with a Prometheus text endpoint
+import contextvars
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Latency buckets in seconds, from cached/mocked responses up to slow image generations
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+# USD per 1M tokens (input, output)
+TOKEN_PRICES = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-3.5-turbo": (0.50, 1.50),
+    "gpt-4": (30.00, 60.00),
+    "gpt-4-turbo": (10.00, 30.00)
+}
+
+# USD per image for (model, quality, size)
+IMAGE_PRICES = {
+    ("dall-e-3", "standard", "1024x1024"): 0.040,
+    ("dall-e-3", "standard", "1024x1792"): 0.080,
+    ("dall-e-3", "standard", "1792x1024"): 0.080,
+    ("dall-e-3", "hd", "1024x1024"): 0.080,
+    ("dall-e-3", "hd", "1024x1792"): 0.120,
+    ("dall-e-3", "hd", "1792x1024"): 0.120
+}
+
+# Whisper bills per audio minute, which the text response doesn't report, so audio cost isn't estimated
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labelnames, values, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """Monotonic counter with labels"""
+
+    kind = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1.0, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def samples(self):
+        """Return {label tuple: value}"""
+        with self._lock:
+            return dict(self._values)
+
+    def render(self):
+        lines = []
+        for key, value in sorted(self.samples().items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value:g}")
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram that also keeps recent raw values for percentiles"""
+
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS, recent=500):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self.recent_size = recent
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {
+                    "counts": [0] * len(self.buckets), "sum": 0.0, "count": 0,
+                    "recent": deque(maxlen=self.recent_size)
+                }
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["counts"][i] += 1
+            series["sum"] += value
+            series["count"] += 1
+            series["recent"].append((time.time(), value))
+
+    def recent(self, max_age=None, **labels):
+        """Recent observations (newest last) for series matching the given labels"""
+        cutoff = time.time() - max_age if max_age else 0
+        values = []
+        with self._lock:
+            for key, series in self._series.items():
+                if all(key[self.labelnames.index(k)] == str(v) for k, v in labels.items()):
+                    values.extend((t, v) for t, v in series["recent"] if t >= cutoff)
+        return [v for _, v in sorted(values)]
+
+    def series(self):
+        """Return {label tuple: (count, sum)}"""
+        with self._lock:
+            return {key: (s["count"], s["sum"]) for key, s in self._series.items()}
+
+    def render(self):
+        lines = []
+        with self._lock:
+            series = sorted((key, list(s["counts"]), s["sum"], s["count"]) for key, s in self._series.items())
+        for key, counts, total, count in series:
+            for bound, bucket_count in zip(self.buckets, counts):
+                le = 'le="%g"' % bound
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {bucket_count}")
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total:g}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """Holds every metric plus collectors that contribute computed samples at render time"""
+
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def counter(self, name, help, labelnames=()):
+        metric = Counter(name, help, labelnames)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        metric = Histogram(name, help, labelnames, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector):
+        """collector() returns an iterable of (name, kind, help, {label dict: value})"""
+        self.collectors.append(collector)
+
+    def render(self):
+        """Prometheus text exposition format"""
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        for collector in self.collectors:
+            for name, kind, help, samples in collector():
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples.items():
+                    lines.append(f"{name}{_format_labels([k for k, _ in labels], [v for _, v in labels])} {value:g}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+API_LABELS = ("app", "model", "endpoint")
+REQUESTS = REGISTRY.counter("openai_requests_total", "OpenAI API requests by outcome", API_LABELS + ("status",))
+DURATION = REGISTRY.histogram("openai_request_duration_seconds", "Wall time of OpenAI API requests", API_LABELS)
+TTFB = REGISTRY.histogram("openai_time_to_first_byte_seconds", "Time until response headers arrived", API_LABELS)
+TOKENS = REGISTRY.counter("openai_tokens_total", "Tokens reported by the API", ("app", "model", "kind"))
+REQUEST_BYTES = REGISTRY.counter("openai_request_bytes_total", "Request payload bytes sent", API_LABELS)
+RESPONSE_BYTES = REGISTRY.counter("openai_response_bytes_total", "Response payload bytes received", API_LABELS)
+COST = REGISTRY.counter("openai_estimated_cost_usd_total", "Estimated spend from the local price table", ("app", "model"))
+CACHE = REGISTRY.counter("cache_lookups_total", "Cache and request-coalescing lookups", ("app", "cache", "result"))
+STAGES = REGISTRY.histogram("pipeline_stage_duration_seconds", "Duration of instrumented pipeline stages", ("app", "stage", "status"))
+
+_app_name = "unknown"
+_current_call = contextvars.ContextVar("openai_current_call", default=None)
+_current_span = contextvars.ContextVar("metrics_current_span", default=None)
+_spans = deque(maxlen=int(os.getenv("METRICS_SPAN_BUFFER", "1000")))
+
+
+def set_app(name):
+    """Label everything this process records with the app's name"""
+    global _app_name
+    _app_name = name
+
+
+def get_app():
+    return _app_name
+
+
+def record_cache(cache, hit):
+    CACHE.inc(app=_app_name, cache=cache, result="hit" if hit else "miss")
+
+
+def estimate_cost(model, request, response):
+    """Rough USD cost of one successful call"""
+    usage = getattr(response, "usage", None)
+    if usage is not None and model in TOKEN_PRICES:
+        input_price, output_price = TOKEN_PRICES[model]
+        prompt = getattr(usage, "prompt_tokens", 0) or 0
+        completion = getattr(usage, "completion_tokens", 0) or 0
+        return (prompt * input_price + completion * output_price) / 1_000_000
+    if "prompt" in request and "size" in request:
+        price = IMAGE_PRICES.get((model, request.get("quality", "standard"), request.get("size")), 0.0)
+        return price * len(getattr(response, "data", None) or [None])
+    return 0.0
+
+
+@contextmanager
+def span(stage, **attributes):
+    """Time a pipeline stage; nested spans share the trace id of the outermost one"""
+    parent = _current_span.get()
+    record = {
+        "trace_id": parent["trace_id"] if parent else uuid.uuid4().hex[:16],
+        "span_id": uuid.uuid4().hex[:8],
+        "parent_id": parent["span_id"] if parent else None,
+        "app": _app_name,
+        "stage": stage,
+        "start": time.time(),
+        "status": "ok",
+        "attributes": attributes
+    }
+    token = _current_span.set(record)
+    started = time.perf_counter()
+    try:
+        yield record
+    except Exception:
+        record["status"] = "error"
+        raise
+    finally:
+        _current_span.reset(token)
+        record["duration"] = time.perf_counter() - started
+        STAGES.observe(record["duration"], app=_app_name, stage=stage, status=record["status"])
+        _spans.append(record)
+
+
+def recent_spans(limit=200):
+    """Most recent finished spans, newest first"""
+    return list(_spans)[-limit:][::-1]
+
+
+def observe_call(fn, *, model, **kwargs):
+    """Run one API call, recording latency, TTFB, payload sizes, tokens and cost"""
+    call = {"endpoint": "unknown", "ttfb": None, "request_bytes": 0, "response_bytes": 0}
+    call_token = _current_call.set(call)
+    status = "ok"
+    try:
+        with span("openai_call", model=model) as record:
+            try:
+                response = fn(model=model, **kwargs)
+            except Exception as e:
+                status = getattr(e, "status_code", None) or type(e).__name__
+                raise
+            finally:
+                record["attributes"]["endpoint"] = call["endpoint"]
+    finally:
+        _current_call.reset(call_token)
+        labels = {"app": _app_name, "model": model, "endpoint": call["endpoint"]}
+        REQUESTS.inc(status=status, **labels)
+        DURATION.observe(record["duration"], **labels)
+        if call["ttfb"] is not None:
+            TTFB.observe(call["ttfb"], **labels)
+        REQUEST_BYTES.inc(call["request_bytes"], **labels)
+        RESPONSE_BYTES.inc(call["response_bytes"], **labels)
+
+    usage = getattr(response, "usage", None)
+    if usage is not None:
+        TOKENS.inc(getattr(usage, "prompt_tokens", 0) or 0, app=_app_name, model=model, kind="prompt")
+        TOKENS.inc(getattr(usage, "completion_tokens", 0) or 0, app=_app_name, model=model, kind="completion")
+    COST.inc(estimate_cost(model, kwargs, response), app=_app_name, model=model)
+    return response
+
+
+def _on_request(request):
+    call = _current_call.get()
+    if call is not None:
+        call["endpoint"] = request.url.path.split("/v1/", 1)[-1].strip("/") or "unknown"
+        call["request_bytes"] += int(request.headers.get("content-length", 0) or 0)
+        call["sent_at"] = time.perf_counter()
+
+
+def _on_response(response):
+    call = _current_call.get()
+    if call is not None and "sent_at" in call:
+        # Hooks fire once headers arrive, before the body is read
+        call["ttfb"] = time.perf_counter() - call["sent_at"]
+        call["response_bytes"] += int(response.headers.get("content-length", 0) or 0)
+
+
+async def _on_request_async(request):
+    _on_request(request)
+
+
+async def _on_response_async(response):
+    _on_response(response)
+
+
+def httpx_event_hooks(asynchronous=False):
+    """Event hooks for the shared httpx clients; they fill in TTFB and payload sizes"""
+    if asynchronous:
+        return {"request": [_on_request_async], "response": [_on_response_async]}
+    return {"request": [_on_request], "response": [_on_response]}
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+# Each app has its own default port, so several can run on one host with METRICS_PORT unset
+DEFAULT_PORTS = {"chatbot": 9464, "stt": 9465, "image_gen": 9466, "default": 9464}
+
+_server = None
+_server_failed = False
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port=None, host=None):
+    """Serve /metrics once per process; METRICS_PORT=0 disables it. Returns the bound port or None"""
+    global _server, _server_failed
+    with _server_lock:
+        if _server is not None:
+            return _server.server_address[1]
+        if _server_failed:
+            return None
+        if port is None:
+            port = os.getenv("METRICS_PORT") or DEFAULT_PORTS.get(_app_name, DEFAULT_PORTS["default"])
+        port = int(port)
+        if not port:
+            return None
+        host = host or os.getenv("METRICS_HOST", "127.0.0.1")
+        try:
+            _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+        except OSError as e:
+            # Usually another app on this host already owns the port
+            print(f"Metrics endpoint disabled: can't bind {host}:{port} ({e})", file=sys.stderr)
+            _server, _server_failed = None, True
+            return None
+        _server.daemon_threads = True
+        threading.Thread(target=_server.serve_forever, name="metrics-server", daemon=True).start()
+        return _server.server_address[1]
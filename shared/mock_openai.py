@@ -0,0 +1,529 @@
+# Local stand-in for the OpenAI chat, audio transcription, image generation, files and batch endpoints
+import argparse
+import base64
+import hashlib
+import json
+import random
+import re
+import struct
+import threading
+import time
+import uuid
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+VALID_IMAGE_SIZES = {"1024x1024", "1024x1792", "1792x1024"}
+
+DEFAULT_CONFIG = {
+    "latency": 0.05,          # Base seconds before any response starts
+    "jitter": 0.0,            # Extra uniformly random latency, in seconds
+    "image_latency": None,    # Overrides `latency` for image generations (they're much slower upstream)
+    "audio_latency": None,    # Overrides `latency` for transcriptions
+    "token_delay": 0.01,      # Seconds between streamed chat chunks
+    "completion_words": 30,   # Length of generated chat replies
+    "error_rate": 0.0,        # Fraction of requests that fail with a 500
+    "rate_limit_rate": 0.0,   # Fraction of requests rejected with a 429
+    "rpm": 0,                 # Hard requests-per-minute limit enforced per endpoint (0 = none)
+    "retry_after": 1.0,       # Seconds advertised in Retry-After on 429s
+    "batch_latency": 2.0,     # Seconds a batch takes from creation to completion
+    "batch_max_requests": 50000,  # Batches with more input lines than this fail validation
+    "batch_error_rate": None  # Fraction of batch lines that fail; defaults to error_rate
+}
+
+BATCH_ENDPOINTS = {"/v1/chat/completions"}
+
+
+def make_png(width, height, seed):
+    """Build a solid-colour PNG whose colour is derived from the seed"""
+    color = hashlib.sha256(seed.encode()).digest()[:3]
+    raw = zlib.compress((b"\x00" + color * width) * height, 9)
+
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", raw) + chunk(b"IEND", b"")
+
+
+def parse_multipart(body, content_type):
+    """Minimal multipart/form-data parser returning {field: bytes} (files included, with their
+    names under "<field>.filename")"""
+    match = re.search(r'boundary="?([^";]+)"?', content_type or "")
+    if not match:
+        return {}
+    fields = {}
+    for part in body.split(b"--" + match.group(1).encode()):
+        if b"\r\n\r\n" not in part:
+            continue
+        headers, _, value = part.partition(b"\r\n\r\n")
+        name = re.search(rb'name="([^"]+)"', headers)
+        if name:
+            fields[name.group(1).decode()] = value.rsplit(b"\r\n", 1)[0]
+            filename = re.search(rb'filename="([^"]*)"', headers)
+            if filename:
+                fields[f"{name.group(1).decode()}.filename"] = filename.group(1)
+    return fields
+
+
+def fake_reply(messages, words):
+    """Deterministic reply text derived from the conversation"""
+    last = next((m.get("content", "") for m in reversed(messages) if m.get("role") == "user"), "")
+    seed = int(hashlib.sha256(str(last).encode()).hexdigest(), 16)
+    vocabulary = ["mock", "reply", "about", "your", "message", "with", "some", "extra", "words", "here"]
+    return " ".join(vocabulary[(seed >> i) % len(vocabulary)] for i in range(words))
+
+
+def count_tokens(text):
+    return max(1, len(str(text)) // 4)
+
+
+def chat_completion(request, config):
+    """Non-streamed chat completion body for a request"""
+    messages = request.get("messages") or []
+    words = config["completion_words"]
+    if request.get("max_tokens"):
+        words = min(words, max(1, int(request["max_tokens"])))
+    reply = fake_reply(messages, words)
+    prompt_tokens = sum(count_tokens(m.get("content", "")) + 4 for m in messages)
+    completion_tokens = count_tokens(reply)
+    return {
+        "id": f"chatcmpl-mock-{uuid.uuid4().hex[:12]}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": request.get("model", "gpt-3.5-turbo"),
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": reply}, "finish_reason": "stop"}],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens
+        }
+    }
+
+
+class MockOpenAIHandler(BaseHTTPRequestHandler):
+    """Routes the subset of the OpenAI API used by the apps"""
+
+    server_version = "MockOpenAI/1.0"
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+    # Response helpers
+    def _send(self, status, body, content_type="application/json", headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status, payload, headers=None):
+        self._send(status, json.dumps(payload).encode(), headers=headers)
+
+    def _send_error(self, status, message, error_type, headers=None):
+        self._send_json(status, {"error": {"message": message, "type": error_type, "code": None}}, headers)
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return self.rfile.read(length) if length else b""
+
+    # Fault injection and latency
+    def _should_reject(self, endpoint):
+        """Inject 429s/500s as configured; returns True when a response was already sent"""
+        config = self.server.config
+        retry_after = {"retry-after": f"{config['retry_after']:g}"}
+        if config["rpm"] and not self.server.admit(endpoint, config["rpm"]):
+            self.server.count(endpoint, "rate_limited")
+            self._send_error(429, "Rate limit reached (mock rpm limit)", "requests", retry_after)
+            return True
+        if random.random() < config["rate_limit_rate"]:
+            self.server.count(endpoint, "rate_limited")
+            self._send_error(429, "Rate limit reached (injected)", "requests", retry_after)
+            return True
+        if random.random() < config["error_rate"]:
+            self.server.count(endpoint, "errors")
+            self._send_error(500, "The server had an error (injected)", "server_error")
+            return True
+        return False
+
+    def _sleep(self, override=None):
+        config = self.server.config
+        base = config[override] if override and config.get(override) is not None else config["latency"]
+        time.sleep(base + random.uniform(0, config["jitter"]))
+
+    # Routing
+    def do_GET(self):
+        path = self.path.split("?")[0].rstrip("/")
+        if self.path.startswith("/images/"):
+            self._serve_image()
+        elif re.fullmatch(r"/v1/files/[\w-]+/content", path):
+            self._file_content(path.split("/")[3])
+        elif re.fullmatch(r"/v1/files/[\w-]+", path):
+            self._file_object(path.split("/")[3])
+        elif re.fullmatch(r"/v1/batches/[\w-]+", path):
+            self._batch_object(path.split("/")[3])
+        elif self.path == "/_mock/stats":
+            self._send_json(200, self.server.snapshot())
+        elif self.path == "/_mock/config":
+            self._send_json(200, self.server.config)
+        else:
+            self._send_error(404, f"Unknown path {self.path}", "invalid_request_error")
+
+    def do_POST(self):
+        routes = {
+            "/v1/chat/completions": self._chat_completions,
+            "/v1/audio/transcriptions": self._transcriptions,
+            "/v1/images/generations": self._image_generations,
+            "/v1/files": self._upload_file,
+            "/v1/batches": self._create_batch,
+            "/_mock/config": self._update_config
+        }
+        path = self.path.split("?")[0].rstrip("/")
+        handler = routes.get(path)
+        if handler is None and re.fullmatch(r"/v1/batches/[\w-]+/cancel", path):
+            handler = lambda: self._cancel_batch(path.split("/")[3])
+        if handler is None:
+            self._read_body()
+            self._send_error(404, f"Unknown path {self.path}", "invalid_request_error")
+            return
+        handler()
+
+    def _update_config(self):
+        updates = json.loads(self._read_body() or b"{}")
+        unknown = set(updates) - set(DEFAULT_CONFIG)
+        if unknown:
+            self._send_error(400, f"Unknown config keys: {sorted(unknown)}", "invalid_request_error")
+            return
+        self.server.config.update(updates)
+        self._send_json(200, self.server.config)
+
+    def _chat_completions(self):
+        request = json.loads(self._read_body() or b"{}")
+        if self._should_reject("chat"):
+            return
+        messages = request.get("messages") or []
+        if not messages:
+            self._send_error(400, "messages is required", "invalid_request_error")
+            return
+
+        self._sleep()
+        self.server.count("chat", "ok")
+        completion = chat_completion(request, self.server.config)
+        if not request.get("stream"):
+            self._send_json(200, completion)
+            return
+        reply = completion["choices"][0]["message"]["content"]
+        completion_id, created, model = completion["id"], completion["created"], completion["model"]
+
+        # Server-sent events, one word per chunk
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def emit(payload):
+            data = f"data: {payload}\n\n".encode()
+            self.wfile.write(f"{len(data):X}\r\n".encode() + data + b"\r\n")
+            self.wfile.flush()
+
+        def chunk(delta, finish_reason=None):
+            return json.dumps({
+                "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+            })
+
+        emit(chunk({"role": "assistant", "content": ""}))
+        for i, word in enumerate(reply.split(" ")):
+            time.sleep(self.server.config["token_delay"])
+            emit(chunk({"content": word if i == 0 else " " + word}))
+        emit(chunk({}, "stop"))
+        emit("[DONE]")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _transcriptions(self):
+        fields = parse_multipart(self._read_body(), self.headers.get("Content-Type"))
+        if self._should_reject("audio"):
+            return
+        audio = fields.get("file")
+        if not audio:
+            self._send_error(400, "file is required", "invalid_request_error")
+            return
+
+        self._sleep("audio_latency")
+        self.server.count("audio", "ok")
+        digest = hashlib.sha256(audio).hexdigest()[:8]
+        text = f"This is a mock transcription of {len(audio)} bytes of audio ({digest})."
+        response_format = fields.get("response_format", b"json").decode()
+        if response_format == "text":
+            self._send(200, (text + "\n").encode(), "text/plain; charset=utf-8")
+        else:
+            self._send_json(200, {"text": text})
+
+    def _image_generations(self):
+        request = json.loads(self._read_body() or b"{}")
+        if self._should_reject("images"):
+            return
+        prompt = request.get("prompt")
+        size = request.get("size", "1024x1024")
+        if not prompt:
+            self._send_error(400, "prompt is required", "invalid_request_error")
+            return
+        if size not in VALID_IMAGE_SIZES:
+            self._send_error(400, f"Invalid size {size}", "invalid_request_error")
+            return
+
+        self._sleep("image_latency")
+        self.server.count("images", "ok")
+        image_id = uuid.uuid4().hex
+        revised_prompt = f"{prompt} (mock revision, {request.get('style') or 'vivid'})"
+        if request.get("response_format") == "b64_json":
+            width, height = (int(x) // 16 for x in size.split("x"))
+            item = {"b64_json": base64.b64encode(make_png(width, height, prompt)).decode(), "revised_prompt": revised_prompt}
+        else:
+            with self.server.lock:
+                self.server.images[image_id] = (size, prompt)
+            host, port = self.server.server_address[:2]
+            item = {"url": f"http://{host}:{port}/images/{image_id}.png", "revised_prompt": revised_prompt}
+        self._send_json(200, {"created": int(time.time()), "data": [item]})
+
+    # Files and batches: a batch completes `batch_latency` seconds after it's created, and its
+    # state is worked out whenever it's looked at
+    def _upload_file(self):
+        fields = parse_multipart(self._read_body(), self.headers.get("Content-Type"))
+        content = fields.get("file")
+        if content is None or not fields.get("purpose"):
+            self._send_error(400, "file and purpose are required", "invalid_request_error")
+            return
+        file = self.server.add_file(content, fields["purpose"].decode(), fields.get("file.filename", b"upload.jsonl").decode())
+        self.server.count("files", "ok")
+        self._send_json(200, file)
+
+    def _file_object(self, file_id):
+        with self.server.lock:
+            entry = self.server.files.get(file_id)
+        if entry is None:
+            self._send_error(404, f"No such File object: {file_id}", "invalid_request_error")
+            return
+        self._send_json(200, entry["object"])
+
+    def _file_content(self, file_id):
+        with self.server.lock:
+            entry = self.server.files.get(file_id)
+        if entry is None:
+            self._send_error(404, f"No such File object: {file_id}", "invalid_request_error")
+            return
+        self._send(200, entry["content"], "application/octet-stream")
+
+    def _create_batch(self):
+        request = json.loads(self._read_body() or b"{}")
+        if self._should_reject("batches"):
+            return
+        with self.server.lock:
+            entry = self.server.files.get(request.get("input_file_id", ""))
+        if entry is None:
+            self._send_error(400, f"No such File object: {request.get('input_file_id')}", "invalid_request_error")
+            return
+        if request.get("endpoint") not in BATCH_ENDPOINTS:
+            self._send_error(400, f"Unsupported batch endpoint {request.get('endpoint')}", "invalid_request_error")
+            return
+        self.server.count("batches", "ok")
+        self._send_json(200, self.server.add_batch(request))
+
+    def _batch_object(self, batch_id):
+        batch = self.server.advance_batch(batch_id)
+        if batch is None:
+            self._send_error(404, f"No such Batch object: {batch_id}", "invalid_request_error")
+            return
+        self._send_json(200, batch)
+
+    def _cancel_batch(self, batch_id):
+        self._read_body()
+        batch = self.server.advance_batch(batch_id, cancel=True)
+        if batch is None:
+            self._send_error(404, f"No such Batch object: {batch_id}", "invalid_request_error")
+            return
+        self._send_json(200, batch)
+
+    def _serve_image(self):
+        image_id = self.path.rsplit("/", 1)[-1].removesuffix(".png")
+        with self.server.lock:
+            entry = self.server.images.get(image_id)
+        if entry is None:
+            self._send_error(404, "Image not found", "invalid_request_error")
+            return
+        size, prompt = entry
+        # Keep payloads small; the pixel dimensions don't matter for testing
+        width, height = (int(x) // 16 for x in size.split("x"))
+        self._send(200, make_png(width, height, prompt), "image/png")
+
+
+class MockOpenAIServer(ThreadingHTTPServer):
+    """Threaded mock server with runtime-adjustable config and per-endpoint counters"""
+
+    daemon_threads = True
+
+    def __init__(self, host="127.0.0.1", port=0, quiet=True, **config):
+        super().__init__((host, port), MockOpenAIHandler)
+        self.config = {**DEFAULT_CONFIG, **config}
+        self.quiet = quiet
+        self.lock = threading.Lock()
+        self.images = {}
+        self.files = {}
+        self.batches = {}
+        self.stats = {}
+        self._windows = {}
+        self._thread = None
+
+    @property
+    def url(self):
+        """Base URL to hand to the OpenAI client"""
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def admit(self, endpoint, rpm):
+        """Sliding one-minute window limiter for the hard rpm limit"""
+        now = time.monotonic()
+        with self.lock:
+            window = [t for t in self._windows.get(endpoint, []) if now - t < 60]
+            admitted = len(window) < rpm
+            if admitted:
+                window.append(now)
+            self._windows[endpoint] = window
+        return admitted
+
+    def add_file(self, content, purpose, filename):
+        file_id = f"file-mock{uuid.uuid4().hex[:20]}"
+        file = {
+            "id": file_id, "object": "file", "bytes": len(content), "created_at": int(time.time()),
+            "filename": filename, "purpose": purpose, "status": "processed"
+        }
+        with self.lock:
+            self.files[file_id] = {"object": file, "content": content}
+        return file
+
+    def add_batch(self, request):
+        batch_id = f"batch_mock{uuid.uuid4().hex[:20]}"
+        batch = {
+            "id": batch_id, "object": "batch", "endpoint": request["endpoint"], "errors": None,
+            "input_file_id": request["input_file_id"], "completion_window": request.get("completion_window", "24h"),
+            "status": "validating", "output_file_id": None, "error_file_id": None,
+            "created_at": int(time.time()), "in_progress_at": None, "finalizing_at": None, "completed_at": None,
+            "failed_at": None, "expired_at": None, "cancelling_at": None, "cancelled_at": None,
+            "request_counts": {"total": 0, "completed": 0, "failed": 0},
+            "metadata": request.get("metadata")
+        }
+        with self.lock:
+            self.batches[batch_id] = {"object": batch, "started": time.monotonic()}
+        return dict(batch)
+
+    def advance_batch(self, batch_id, cancel=False):
+        """Move a batch along according to how long ago it was created, and return it"""
+        with self.lock:
+            entry = self.batches.get(batch_id)
+            if entry is None:
+                return None
+            batch = entry["object"]
+            if batch["status"] in ("completed", "failed", "cancelled", "expired"):
+                return dict(batch)
+            now = int(time.time())
+            if cancel:
+                batch.update(status="cancelled", cancelling_at=now, cancelled_at=now)
+                return dict(batch)
+            lines = [line for line in self.files[batch["input_file_id"]]["content"].splitlines() if line.strip()]
+            if batch["status"] == "validating":
+                if len(lines) > self.config["batch_max_requests"]:
+                    batch.update(status="failed", failed_at=now, errors={"object": "list", "data": [{
+                        "code": "too_many_requests",
+                        "message": f"Batch has {len(lines)} requests; the limit is {self.config['batch_max_requests']}"
+                    }]})
+                    return dict(batch)
+                batch.update(status="in_progress", in_progress_at=now)
+                batch["request_counts"]["total"] = len(lines)
+            if time.monotonic() - entry["started"] < self.config["batch_latency"]:
+                return dict(batch)
+            self._complete_batch(batch, lines, now)
+            return dict(batch)
+
+    def _complete_batch(self, batch, lines, now):
+        """Answer every line: successes go to the output file, failures to the error file"""
+        error_rate = self.config["batch_error_rate"]
+        if error_rate is None:
+            error_rate = self.config["error_rate"]
+        outputs, errors = [], []
+        for line in lines:
+            request = json.loads(line)
+            result = {"id": f"batch_req_{uuid.uuid4().hex[:20]}", "custom_id": request.get("custom_id"), "error": None}
+            if request.get("url") not in BATCH_ENDPOINTS:
+                result["response"] = None
+                result["error"] = {"code": "invalid_url", "message": f"Unsupported url {request.get('url')}"}
+                errors.append(result)
+            elif random.random() < error_rate:
+                result["response"] = {"status_code": 500, "request_id": uuid.uuid4().hex, "body": {
+                    "error": {"message": "The server had an error (injected)", "type": "server_error", "code": None}
+                }}
+                errors.append(result)
+            else:
+                body = chat_completion(request.get("body") or {}, self.config)
+                result["response"] = {"status_code": 200, "request_id": uuid.uuid4().hex, "body": body}
+                outputs.append(result)
+        if outputs:
+            batch["output_file_id"] = self._store_results(batch["id"], "output", outputs)
+        if errors:
+            batch["error_file_id"] = self._store_results(batch["id"], "error", errors)
+        batch.update(status="completed", finalizing_at=now, completed_at=now)
+        batch["request_counts"] = {"total": len(lines), "completed": len(outputs), "failed": len(errors)}
+
+    def _store_results(self, batch_id, kind, results):
+        """Add a result file; called with the lock held"""
+        content = b"".join(json.dumps(result).encode() + b"\n" for result in results)
+        file_id = f"file-mock{uuid.uuid4().hex[:20]}"
+        self.files[file_id] = {"object": {
+            "id": file_id, "object": "file", "bytes": len(content), "created_at": int(time.time()),
+            "filename": f"{batch_id}_{kind}.jsonl", "purpose": "batch_output", "status": "processed"
+        }, "content": content}
+        return file_id
+
+    def count(self, endpoint, outcome):
+        with self.lock:
+            counts = self.stats.setdefault(endpoint, {})
+            counts[outcome] = counts.get(outcome, 0) + 1
+
+    def snapshot(self):
+        with self.lock:
+            return {endpoint: dict(counts) for endpoint, counts in self.stats.items()}
+
+    def start(self):
+        """Serve on a background thread and return self"""
+        self._thread = threading.Thread(target=self.serve_forever, name="mock-openai", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local mock of the OpenAI API (chat, audio transcription, images)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    for key, default in DEFAULT_CONFIG.items():
+        kind = int if key in ("completion_words", "rpm", "batch_max_requests") else float
+        parser.add_argument(f"--{key.replace('_', '-')}", type=kind, default=default, dest=key)
+    args = vars(parser.parse_args())
+
+    host, port = args.pop("host"), args.pop("port")
+    server = MockOpenAIServer(host, port, quiet=False, **args)
+    print(f"Mock OpenAI API listening on {server.url} (set OPENAI_BASE_URL to this)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+# Local stand-in for the subset of Redis the session store uses, speaking the real RESP protocol
+import argparse
+import fnmatch
+import socketserver
+import threading
+import time
+
+
+class CommandError(Exception):
+    """Sent back to the client as a RESP error reply"""
+
+
+def _int(value):
+    try:
+        return int(value)
+    except ValueError:
+        raise CommandError("ERR value is not an integer or out of range")
+
+
+class MockRedisHandler(socketserver.StreamRequestHandler):
+    def setup(self):
+        super().setup()
+        self.queued = None  # Commands buffered between MULTI and EXEC
+
+    def handle(self):
+        while True:
+            try:
+                command = self.read_command()
+            except (ConnectionError, ValueError):
+                return
+            if command is None:
+                return
+            self.wfile.write(self.server.dispatch(self, command))
+            self.wfile.flush()
+
+    def read_command(self):
+        """Parse one RESP array of bulk strings (or an inline command, as redis-cli sends)"""
+        line = self.rfile.readline()
+        if not line:
+            return None
+        if not line.startswith(b"*"):
+            return line.split()
+        args = []
+        for _ in range(int(line[1:])):
+            header = self.rfile.readline()
+            if not header.startswith(b"$"):
+                raise ValueError("expected a bulk string")
+            size = int(header[1:])
+            args.append(self.rfile.read(size + 2)[:-2])
+        return args
+
+
+def encode(reply):
+    """RESP2 encoding of a Python reply value"""
+    if reply is None:
+        return b"$-1\r\n"
+    if isinstance(reply, CommandError):
+        return b"-" + str(reply).encode() + b"\r\n"
+    if isinstance(reply, bool):
+        return b":1\r\n" if reply else b":0\r\n"
+    if isinstance(reply, int):
+        return b":%d\r\n" % reply
+    if isinstance(reply, str):
+        return b"+" + reply.encode() + b"\r\n"
+    if isinstance(reply, (list, tuple)):
+        return b"*%d\r\n" % len(reply) + b"".join(encode(item) for item in reply)
+    return b"$%d\r\n" % len(reply) + bytes(reply) + b"\r\n"
+
+
+class MockRedisServer(socketserver.ThreadingTCPServer):
+    """In-memory strings and hashes with lazy key expiry, MULTI/EXEC and a per-command counter"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host="127.0.0.1", port=0, password=None, quiet=True):
+        super().__init__((host, port), MockRedisHandler)
+        self.password = password
+        self.quiet = quiet
+        self.lock = threading.Lock()
+        self.data = {}
+        self.expires = {}
+        self.stats = {}
+        self._thread = None
+
+    @property
+    def url(self):
+        """Connection URL to hand to SESSION_STORE_URL"""
+        host, port = self.server_address[:2]
+        auth = f":{self.password}@" if self.password else ""
+        return f"redis://{auth}{host}:{port}/0"
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.stats)
+
+    def start(self):
+        """Serve on a background thread and return self"""
+        self._thread = threading.Thread(target=self.serve_forever, name="mock-redis", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def dispatch(self, handler, command):
+        if not command:
+            return encode(CommandError("ERR empty command"))
+        name, args = command[0].decode().upper(), command[1:]
+        if not self.quiet:
+            print(name, *[arg[:40] for arg in args])
+        if handler.queued is not None and name not in ("EXEC", "DISCARD", "MULTI"):
+            handler.queued.append((name, args))
+            return encode("QUEUED")
+        with self.lock:
+            self.stats[name] = self.stats.get(name, 0) + 1
+            if name == "MULTI":
+                if handler.queued is not None:
+                    return encode(CommandError("ERR MULTI calls can not be nested"))
+                handler.queued = []
+                return encode("OK")
+            if name in ("EXEC", "DISCARD"):
+                if handler.queued is None:
+                    return encode(CommandError(f"ERR {name} without MULTI"))
+                queued, handler.queued = handler.queued, None
+                if name == "DISCARD":
+                    return encode("OK")
+                # Runs under the server lock, so the whole transaction is atomic
+                return encode([self.run(handler, *entry) for entry in queued])
+            return encode(self.run(handler, name, args))
+
+    def run(self, handler, name, args):
+        """Execute one command with the lock held; errors become error replies"""
+        method = getattr(self, f"cmd_{name.lower()}", None)
+        if method is None:
+            return CommandError(f"ERR unknown command '{name}'")
+        if self.password and not getattr(handler, "authenticated", False) and name not in ("AUTH", "PING"):
+            return CommandError("NOAUTH Authentication required.")
+        try:
+            return method(handler, *args)
+        except CommandError as e:
+            return e
+        except TypeError:
+            return CommandError(f"ERR wrong number of arguments for '{name.lower()}' command")
+
+    def _get(self, key, kind=None):
+        """Value at key after lazy expiry; `kind` asserts str (bytes) or hash (dict)"""
+        deadline = self.expires.get(key)
+        if deadline is not None and deadline <= time.monotonic():
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+        value = self.data.get(key)
+        if value is not None and kind is not None and not isinstance(value, kind):
+            raise CommandError("WRONGTYPE Operation against a key holding the wrong kind of value")
+        return value
+
+    def _hash(self, key):
+        value = self._get(key, dict)
+        if value is None:
+            value = self.data[key] = {}
+        return value
+
+    def cmd_ping(self, handler, message=None):
+        return message if message is not None else "PONG"
+
+    def cmd_auth(self, handler, *credentials):
+        if not credentials or len(credentials) > 2:
+            raise TypeError
+        if self.password is None:
+            return CommandError("ERR AUTH <password> called without any password configured for the default user.")
+        if credentials[-1].decode() != self.password:
+            return CommandError("WRONGPASS invalid username-password pair or user is disabled.")
+        handler.authenticated = True
+        return "OK"
+
+    def cmd_select(self, handler, db):
+        # A single keyspace: the database number is accepted and ignored
+        _int(db)
+        return "OK"
+
+    def cmd_get(self, handler, key):
+        return self._get(key, bytes)
+
+    def cmd_set(self, handler, key, value):
+        self.data[key] = value
+        self.expires.pop(key, None)
+        return "OK"
+
+    def cmd_del(self, handler, *keys):
+        removed = 0
+        for key in keys:
+            if self._get(key) is not None:
+                del self.data[key]
+                self.expires.pop(key, None)
+                removed += 1
+        return removed
+
+    def cmd_exists(self, handler, *keys):
+        return sum(self._get(key) is not None for key in keys)
+
+    def cmd_keys(self, handler, pattern):
+        return [key for key in list(self.data) if self._get(key) is not None and fnmatch.fnmatchcase(key.decode(), pattern.decode())]
+
+    def cmd_expire(self, handler, key, seconds):
+        if self._get(key) is None:
+            return 0
+        self.expires[key] = time.monotonic() + _int(seconds)
+        return 1
+
+    def cmd_ttl(self, handler, key):
+        if self._get(key) is None:
+            return -2
+        deadline = self.expires.get(key)
+        return -1 if deadline is None else max(0, round(deadline - time.monotonic()))
+
+    def cmd_hget(self, handler, key, field):
+        return (self._get(key, dict) or {}).get(field)
+
+    def cmd_hmget(self, handler, key, *fields):
+        if not fields:
+            raise TypeError
+        value = self._get(key, dict) or {}
+        return [value.get(field) for field in fields]
+
+    def cmd_hgetall(self, handler, key):
+        value = self._get(key, dict) or {}
+        return [item for pair in value.items() for item in pair]
+
+    def cmd_hset(self, handler, key, *pairs):
+        if not pairs or len(pairs) % 2:
+            raise TypeError
+        value = self._hash(key)
+        added = 0
+        for field, item in zip(pairs[::2], pairs[1::2]):
+            added += field not in value
+            value[field] = item
+        return added
+
+    def cmd_hdel(self, handler, key, *fields):
+        value = self._get(key, dict) or {}
+        removed = sum(value.pop(field, None) is not None for field in fields)
+        if not value:
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+        return removed
+
+    def cmd_hincrby(self, handler, key, field, amount):
+        value = self._hash(key)
+        current = _int(value.get(field, b"0")) + _int(amount)
+        value[field] = str(current).encode()
+        return current
+
+    def cmd_flushdb(self, handler, *options):
+        self.data.clear()
+        self.expires.clear()
+        return "OK"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local Redis stand-in for SESSION_STORE_URL=redis://...")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6379)
+    parser.add_argument("--password", help="Require AUTH with this password")
+    parser.add_argument("--verbose", action="store_true", help="Print every command received")
+    args = parser.parse_args()
+
+    server = MockRedisServer(args.host, args.port, password=args.password, quiet=not args.verbose)
+    print(f"Mock Redis listening on {server.url} (set SESSION_STORE_URL to this)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
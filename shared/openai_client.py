@@ -0,0 +1,125 @@
+# Process-wide OpenAI clients with a tuned HTTP keep-alive pool
+import asyncio
+import os
+import threading
+import weakref
+
+from shared import metrics
+
+# openai and httpx take most of a second to import, so they're loaded on first use (or by
+# prewarm()) rather than when an app first paints
+
+_lock = threading.Lock()
+_overrides = {}
+_client = None
+# Async connections are bound to the event loop that opened them, so keep one client per loop
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def configure(**options):
+    """Override client options (api_key, base_url, timeout, max_retries) and close existing clients
+
+    Call it before requests are in flight: calls still using a replaced client lose their connections.
+    """
+    global _client
+    with _lock:
+        _overrides.update(options)
+        old_client, _client = _client, None
+        old_async = list(_async_clients.items())
+        _async_clients.clear()
+    if old_client is not None:
+        old_client.close()
+    for loop, client in old_async:
+        _close_async(loop, client)
+
+
+def _close_async(loop, client):
+    """Close an async client on the event loop its connections belong to"""
+    if loop.is_closed():
+        # Its connections went with the loop
+        return
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        loop.create_task(client.close())
+    elif loop.is_running():
+        asyncio.run_coroutine_threadsafe(client.close(), loop)
+    else:
+        loop.run_until_complete(client.close())
+
+
+def _pool_limits():
+    """Connection pool sizing; keep-alive connections are what save the TLS handshakes"""
+    import httpx
+
+    return httpx.Limits(
+        max_connections=int(os.getenv("OPENAI_MAX_CONNECTIONS", "100")),
+        max_keepalive_connections=int(os.getenv("OPENAI_MAX_KEEPALIVE", "20")),
+        keepalive_expiry=float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", "120"))
+    )
+
+
+def _client_options():
+    import httpx
+
+    options = {
+        "api_key": os.getenv("OPENAI_API_KEY"),
+        "base_url": os.getenv("OPENAI_BASE_URL") or None,
+        "timeout": httpx.Timeout(float(os.getenv("OPENAI_TIMEOUT", "60")), connect=10.0),
+        # Retries are handled by shared.scheduler, which knows about the rate limit budgets
+        "max_retries": int(os.getenv("OPENAI_MAX_RETRIES", "0"))
+    }
+    options.update(_overrides)
+    return options
+
+
+def get_client():
+    """Return the process-wide synchronous client, creating it on first use"""
+    global _client
+    if _client is None:
+        import openai
+
+        with _lock:
+            if _client is None:
+                _client = openai.OpenAI(
+                    http_client=openai.DefaultHttpxClient(
+                        limits=_pool_limits(),
+                        event_hooks=metrics.httpx_event_hooks()
+                    ),
+                    **_client_options()
+                )
+    return _client
+
+
+def get_async_client():
+    """Return the asyncio client for the running event loop, creating it on first use"""
+    import openai
+
+    loop = asyncio.get_running_loop()
+    with _lock:
+        client = _async_clients.get(loop)
+        if client is None:
+            client = openai.AsyncOpenAI(
+                http_client=openai.DefaultAsyncHttpxClient(
+                    limits=_pool_limits(),
+                    event_hooks=metrics.httpx_event_hooks(asynchronous=True)
+                ),
+                **_client_options()
+            )
+            _async_clients[loop] = client
+    return client
+
+
+def _warm_up():
+    try:
+        get_client()
+    except Exception:
+        # e.g. no API key yet; the app reports that itself when a call is made
+        pass
+
+
+def prewarm():
+    """Import openai and build the client on a background thread, off the first paint"""
+    threading.Thread(target=_warm_up, name="openai-prewarm", daemon=True).start()
@@ -0,0 +1,220 @@
+# Per-request model routing from prompt size, target language, latency/cost targets and live latency stats
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+
+from shared import metrics
+from shared.scheduler import INTERACTIVE, get_scheduler, retryable_errors
+
+# Context window, whether output in non-Latin scripts is good enough, and a latency prior
+# (seconds to the first token + seconds per output token), scaled up by live stats when a model runs slow
+MODEL_PROFILES = {
+    "gpt-4o-mini": {"context": 128000, "multilingual": True, "first_token_s": 0.4, "per_token_s": 0.008},
+    "gpt-3.5-turbo": {"context": 16385, "multilingual": False, "first_token_s": 0.35, "per_token_s": 0.007},
+    "gpt-4o": {"context": 128000, "multilingual": True, "first_token_s": 0.5, "per_token_s": 0.012},
+    "gpt-4-turbo": {"context": 128000, "multilingual": True, "first_token_s": 0.8, "per_token_s": 0.025},
+    "gpt-4": {"context": 8192, "multilingual": True, "first_token_s": 0.9, "per_token_s": 0.04}
+}
+
+# Target languages the models without the multilingual flag translate into poorly; matched on the
+# base name, so "Chinese (Simplified)" counts as Chinese
+NON_LATIN_LANGUAGES = {"Arabic", "Chinese", "Japanese", "Korean", "Russian", "Hindi", "Hebrew", "Greek", "Thai"}
+
+# Per route: candidates in order of preference, the p95 latency target in seconds and the budget
+# in USD per request. Requests up to `short_tokens` (prompt + reply) go to the fastest candidate
+# meeting both; longer ones to the most preferred one that does
+DEFAULT_ROUTES = {
+    "chat": {"models": ["gpt-4o-mini", "gpt-3.5-turbo", "gpt-4o"], "latency_slo": 5.0, "max_cost": 0.01, "short_tokens": 800},
+    "translation": {"models": ["gpt-4o-mini", "gpt-4o", "gpt-3.5-turbo"], "latency_slo": 10.0, "max_cost": 0.02, "short_tokens": 800}
+}
+
+DECISIONS = metrics.REGISTRY.counter("router_decisions_total", "Model routing decisions", ("app", "route", "model", "reason"))
+FALLBACKS = metrics.REGISTRY.counter("router_fallbacks_total", "Calls moved to the fallback model", ("app", "route", "model", "error"))
+
+
+def prompt_tokens(messages):
+    """Rough prompt size (~4 characters per token, plus per-message overhead)"""
+    return sum(len(str(message.get("content", ""))) // 4 + 4 for message in messages)
+
+
+def non_latin(language):
+    """Whether a target language such as "Chinese (Traditional)" is written in a non-Latin script"""
+    return bool(language) and language.split(" (")[0].strip() in NON_LATIN_LANGUAGES
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class ModelRouter:
+    """Picks a model per request and fails over to a second one when the first is slow or erroring"""
+
+    def __init__(self, routes=None, profiles=None, window=300, min_samples=5, error_window=60, timeout_factor=2.0):
+        self.routes = {name: dict(route) for name, route in (routes or DEFAULT_ROUTES).items()}
+        self.profiles = dict(profiles or MODEL_PROFILES)
+        self.window = window
+        self.min_samples = min_samples
+        self.error_window = error_window
+        self.timeout_factor = timeout_factor
+        self._outcomes = defaultdict(lambda: deque(maxlen=50))
+        self._slowdowns = defaultdict(lambda: deque(maxlen=200))
+        self._lock = threading.Lock()
+
+    def candidates(self, route):
+        return list(self.routes[route]["models"])
+
+    def record(self, model, ok):
+        with self._lock:
+            self._outcomes[model].append((time.monotonic(), ok))
+
+    def healthy(self, model):
+        """False while most recent calls failed, or the last three did"""
+        cutoff = time.monotonic() - self.error_window
+        with self._lock:
+            recent = [ok for t, ok in self._outcomes[model] if t >= cutoff]
+        if len(recent) >= 3 and not any(recent[-3:]):
+            return False
+        return not (len(recent) >= 4 and recent.count(False) / len(recent) >= 0.5)
+
+    def prior(self, model, reply_tokens):
+        """Profile latency for a reply of this many tokens"""
+        profile = self.profiles[model]
+        return profile["first_token_s"] + profile["per_token_s"] * reply_tokens
+
+    def observe(self, model, seconds, response):
+        """Record how much slower than its prior a call was, for the reply length it actually produced"""
+        usage = getattr(response, "usage", None)
+        reply_tokens = getattr(usage, "completion_tokens", None)
+        if model not in self.profiles or reply_tokens is None:
+            return
+        with self._lock:
+            self._slowdowns[model].append((time.monotonic(), seconds / self.prior(model, reply_tokens)))
+
+    def predicted_latency(self, model, reply_tokens, tokens):
+        """Prior for a reply this long, scaled by the model's recent p95 slowdown if it's running slow,
+        plus any rate limit wait
+
+        Slowdowns are per call relative to the prior for that call's reply length, so short and long
+        replies are comparable.
+        """
+        predicted = self.prior(model, reply_tokens)
+        cutoff = time.monotonic() - self.window
+        with self._lock:
+            recent = [ratio for t, ratio in self._slowdowns[model] if t >= cutoff]
+        if len(recent) >= self.min_samples:
+            predicted *= max(1.0, percentile(recent, 0.95))
+        return predicted + get_scheduler().wait_estimate(model, tokens)
+
+    def choose(self, route, messages, max_tokens=256, language=None):
+        """Decide the model for one request: {"model", "fallback", "reason", "predicted_s", "cost_usd", ...}"""
+        config = self.routes[route]
+        prompt = prompt_tokens(messages)
+        reply = max_tokens
+        tokens = prompt + reply
+
+        known = [model for model in config["models"] if model in self.profiles]
+        fitting = [model for model in known if tokens <= self.profiles[model]["context"]] or known
+        capable = [model for model in fitting if self.profiles[model]["multilingual"] or not non_latin(language)] or fitting
+        healthy = [model for model in capable if self.healthy(model)] or capable
+
+        predicted = {model: self.predicted_latency(model, reply, tokens) for model in healthy}
+        cost = {}
+        for model in healthy:
+            input_price, output_price = metrics.TOKEN_PRICES.get(model, (0.0, 0.0))
+            cost[model] = (prompt * input_price + reply * output_price) / 1_000_000
+        within = [model for model in healthy if predicted[model] <= config["latency_slo"] and cost[model] <= config["max_cost"]]
+
+        if within and tokens <= config["short_tokens"]:
+            model, reason = min(within, key=predicted.get), "short"
+        elif within:
+            model, reason = within[0], "preferred"
+        else:
+            model, reason = min(healthy, key=predicted.get), "fastest"
+        # The fallback: next best of those within the targets, else the fastest of the rest
+        others = [m for m in within if m != model]
+        others += sorted((m for m in healthy if m not in within and m != model), key=predicted.get)
+        others += [m for m in capable if m not in others and m != model]
+
+        DECISIONS.inc(app=metrics.get_app(), route=route, model=model, reason=reason)
+        return {
+            "route": route,
+            "model": model,
+            "fallback": others[0] if others else None,
+            "reason": reason,
+            "predicted_s": predicted[model],
+            "cost_usd": cost[model],
+            "tokens": tokens,
+            "timeout": config["latency_slo"] * self.timeout_factor
+        }
+
+    def call(self, fn, decision, *, priority=INTERACTIVE, **kwargs):
+        """Run fn(model=..., **kwargs) through the scheduler on the chosen model
+
+        With a fallback available, the first model gets no retries and a timeout of a few SLOs,
+        so a degraded model costs one attempt rather than a whole backoff sequence.
+        """
+        import openai
+
+        kwargs.pop("model", None)
+        scheduler = get_scheduler()
+        fallback = decision["fallback"]
+
+        def timed(**call_kwargs):
+            # Time the API call alone, not the rate limit wait before it
+            started = time.perf_counter()
+            response = fn(**call_kwargs)
+            self.observe(call_kwargs["model"], time.perf_counter() - started, response)
+            return response
+
+        if fallback:
+            try:
+                response = scheduler.call(
+                    timed, model=decision["model"], tokens=decision["tokens"], priority=priority,
+                    max_retries=0, timeout=decision["timeout"], **kwargs
+                )
+            except retryable_errors() + (openai.NotFoundError,) as e:
+                self.record(decision["model"], ok=False)
+                FALLBACKS.inc(app=metrics.get_app(), route=decision["route"], model=fallback, error=type(e).__name__)
+            else:
+                self.record(decision["model"], ok=True)
+                return response
+        model = fallback or decision["model"]
+        try:
+            response = scheduler.call(timed, model=model, tokens=decision["tokens"], priority=priority, **kwargs)
+        except Exception:
+            self.record(model, ok=False)
+            raise
+        self.record(model, ok=True)
+        return response
+
+
+def _config_from_env():
+    """Route and profile overrides from ROUTER_CONFIG: inline JSON or a path to a JSON file"""
+    raw = os.getenv("ROUTER_CONFIG")
+    if not raw:
+        return {}
+    if not raw.lstrip().startswith("{"):
+        with open(raw, encoding="utf-8") as f:
+            raw = f.read()
+    return json.loads(raw)
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_router():
+    """Return the process-wide router so every session shares its health tracking"""
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                config = _config_from_env()
+                routes = {name: dict(route) for name, route in DEFAULT_ROUTES.items()}
+                for name, route in config.get("routes", {}).items():
+                    routes[name] = {**routes.get(name, DEFAULT_ROUTES["chat"]), **route}
+                _router = ModelRouter(routes=routes, profiles={**MODEL_PROFILES, **config.get("profiles", {})})
+    return _router
@@ -0,0 +1,296 @@
+# Client-side rate limiting, prioritisation and retries for OpenAI calls
+import email.utils
+import heapq
+import itertools
+import json
+import os
+import random
+import threading
+import time
+from functools import lru_cache
+
+from shared import metrics
+
+# Lower numbers go first: people waiting on the UI beat background batch work
+INTERACTIVE = 0
+BATCH = 10
+
+QUEUE_WAIT = metrics.REGISTRY.histogram(
+    "openai_scheduler_wait_seconds", "Time calls spent waiting for rate limit budget", ("app", "model", "priority")
+)
+RETRIES = metrics.REGISTRY.counter("openai_retries_total", "Retried API calls by error type", ("app", "model", "error"))
+
+
+@lru_cache(maxsize=None)
+def retryable_errors():
+    """Transient API errors worth retrying (openai is imported on first use, not at startup)"""
+    import openai
+
+    return (
+        openai.RateLimitError,
+        openai.APIConnectionError,  # Includes APITimeoutError
+        openai.InternalServerError
+    )
+
+
+def is_rate_limit(error):
+    import openai
+
+    return isinstance(error, openai.RateLimitError)
+
+
+def is_timeout(error):
+    import openai
+
+    return isinstance(error, openai.APITimeoutError)
+
+
+class TokenBucket:
+    """Classic token bucket: `capacity` tokens, refilled continuously over a minute"""
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        """Seconds until `amount` tokens are available (requests larger than the bucket wait for a full bucket)"""
+        self._refill(now)
+        missing = min(amount, self.capacity) - self.tokens
+        return max(0.0, missing / self.rate)
+
+    def consume(self, amount, now):
+        self._refill(now)
+        self.tokens -= amount
+
+    def refund(self, amount):
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+    def drain(self, now):
+        """Empty the bucket, e.g. after the server reported we're over quota"""
+        self._refill(now)
+        self.tokens = min(self.tokens, 0.0)
+
+
+class _ModelState:
+    """Buckets and waiting callers for one model"""
+
+    def __init__(self, rpm, tpm):
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.waiters = []
+        self.blocked_until = 0.0
+
+    def wait_time(self, tokens, now):
+        waits = [self.blocked_until - now]
+        if self.requests:
+            waits.append(self.requests.wait_time(1, now))
+        if self.tokens and tokens:
+            waits.append(self.tokens.wait_time(tokens, now))
+        return max(0.0, *waits)
+
+
+def estimate_tokens(messages=None, max_tokens=None, text=""):
+    """Rough token estimate (~4 characters per token) for budgeting a chat request"""
+    chars = len(text)
+    for message in messages or []:
+        chars += len(str(message.get("content", ""))) + 4
+    return chars // 4 + (max_tokens or 256)
+
+
+def retry_after(error):
+    """Seconds the server asked us to wait, if it said so"""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    if headers.get("retry-after-ms"):
+        try:
+            return float(headers["retry-after-ms"]) / 1000.0
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        # Neither seconds nor an HTTP date: fall back to our own backoff
+        return None
+    return max(0.0, retry_at.timestamp() - time.time()) if retry_at else None
+
+
+class RequestScheduler:
+    """Admits calls within per-model RPM/TPM budgets, in priority order, retrying transient failures"""
+
+    def __init__(self, limits=None, default_rpm=0, default_tpm=0, max_retries=5, base_delay=0.5, max_delay=60.0):
+        self.limits = dict(limits or {})
+        self.default_rpm = default_rpm
+        self.default_tpm = default_tpm
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._models = {}
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+
+    def set_limits(self, model, rpm=None, tpm=None):
+        """Change a model's requests-per-minute and/or tokens-per-minute budget (0 = unlimited)
+
+        A budget left as None keeps its current value, e.g. one from OPENAI_RATE_LIMITS.
+        """
+        with self._condition:
+            limits = dict(self.limits.get(model, {}))
+            if rpm is not None:
+                limits["rpm"] = rpm
+            if tpm is not None:
+                limits["tpm"] = tpm
+            self.limits[model] = limits
+            self._models.pop(model, None)
+            self._condition.notify_all()
+
+    def _state(self, model):
+        state = self._models.get(model)
+        if state is None:
+            limits = self.limits.get(model, {})
+            state = _ModelState(limits.get("rpm", self.default_rpm), limits.get("tpm", self.default_tpm))
+            self._models[model] = state
+        return state
+
+    def _acquire(self, model, tokens, priority):
+        """Block until this caller is first in line for the model and its budgets allow it"""
+        with self._condition:
+            state = self._state(model)
+            entry = (priority, next(self._sequence))
+            heapq.heappush(state.waiters, entry)
+            try:
+                while True:
+                    now = time.monotonic()
+                    if state.waiters[0] == entry:
+                        wait = state.wait_time(tokens, now)
+                        if wait <= 0:
+                            if state.requests:
+                                state.requests.consume(1, now)
+                            if state.tokens and tokens:
+                                state.tokens.consume(tokens, now)
+                            return
+                        self._condition.wait(wait)
+                    else:
+                        self._condition.wait()
+            finally:
+                state.waiters.remove(entry)
+                heapq.heapify(state.waiters)
+                self._condition.notify_all()
+
+    def _settle(self, model, estimated, response):
+        """Give back budgeted tokens the call didn't actually use"""
+        usage = getattr(response, "usage", None)
+        used = getattr(usage, "total_tokens", None)
+        if used is None or not estimated:
+            return
+        with self._condition:
+            state = self._state(model)
+            if state.tokens and used < estimated:
+                state.tokens.refund(estimated - used)
+                self._condition.notify_all()
+
+    def _refund(self, model, tokens):
+        """Give back the whole token budget of an attempt that failed"""
+        if not tokens:
+            return
+        with self._condition:
+            state = self._state(model)
+            if state.tokens:
+                state.tokens.refund(tokens)
+                self._condition.notify_all()
+
+    def _back_off(self, model, delay):
+        """Hold every caller of a rate-limited model, not just the one that got the 429"""
+        with self._condition:
+            state = self._state(model)
+            now = time.monotonic()
+            state.blocked_until = max(state.blocked_until, now + delay)
+            if state.requests:
+                state.requests.drain(now)
+            self._condition.notify_all()
+
+    def wait_estimate(self, model, tokens=0):
+        """Seconds a new call for the model would wait for budget right now (ignoring the queue ahead of it)"""
+        with self._condition:
+            return self._state(model).wait_time(tokens, time.monotonic())
+
+    def backoff_delay(self, attempt):
+        """Full-jitter exponential backoff"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def call(self, fn, *, model, tokens=0, priority=INTERACTIVE, max_retries=None, idempotent=True, **kwargs):
+        """Run fn(model=model, **kwargs) once the model's budgets allow, retrying transient errors
+
+        `max_retries` overrides the scheduler's own limit for this call, e.g. 0 when the caller
+        would rather fail over to another model than wait out a backoff. Pass idempotent=False
+        for calls that create billable work, such as image generation: a timed-out attempt may
+        have finished on the server, so timeouts aren't retried.
+        """
+        max_retries = self.max_retries if max_retries is None else max_retries
+        for attempt in range(max_retries + 1):
+            queued = time.perf_counter()
+            self._acquire(model, tokens, priority)
+            QUEUE_WAIT.observe(time.perf_counter() - queued, app=metrics.get_app(), model=model, priority=priority)
+            try:
+                response = metrics.observe_call(fn, model=model, **kwargs)
+            except Exception as e:
+                # A failed attempt doesn't get to keep its token budget; the next one takes its own
+                self._refund(model, tokens)
+                if not isinstance(e, retryable_errors()):
+                    raise
+                delay = retry_after(e)
+                if delay is None:
+                    delay = self.backoff_delay(attempt)
+                else:
+                    # Add a little jitter so queued callers don't all retry in the same instant
+                    delay += random.uniform(0, self.base_delay)
+                if is_rate_limit(e):
+                    # Even when this call gives up (e.g. max_retries=0 before a fallback), every
+                    # other caller of the model waits out the server's Retry-After
+                    self._back_off(model, delay)
+                if attempt == max_retries or (not idempotent and is_timeout(e)):
+                    raise
+                RETRIES.inc(app=metrics.get_app(), model=model, error=type(e).__name__)
+                time.sleep(min(delay, self.max_delay))
+                continue
+            self._settle(model, tokens, response)
+            return response
+
+
+def _limits_from_env():
+    """Per-model budgets from OPENAI_RATE_LIMITS, e.g. {"gpt-4o-mini": {"rpm": 500, "tpm": 200000}}"""
+    raw = os.getenv("OPENAI_RATE_LIMITS")
+    return json.loads(raw) if raw else {}
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    """Return the process-wide scheduler so every session draws from the same budgets"""
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = RequestScheduler(
+                    limits=_limits_from_env(),
+                    default_rpm=float(os.getenv("OPENAI_DEFAULT_RPM", "0")),
+                    default_tpm=float(os.getenv("OPENAI_DEFAULT_TPM", "0")),
+                    max_retries=int(os.getenv("OPENAI_SCHEDULER_RETRIES", "5"))
+                )
+    return _scheduler
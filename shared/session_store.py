@@ -0,0 +1,648 @@
+# Externalized st.session_state: selected keys are kept in SQLite or Redis so any replica can serve any session
+import atexit
+import hashlib
+import json
+import os
+import re
+import socket
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+import zlib
+from contextlib import contextmanager
+from urllib.parse import unquote, urlparse
+
+from shared import metrics
+
+SYNC_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+SYNC_TIME = metrics.REGISTRY.histogram(
+    "session_store_sync_seconds", "Per-rerun session state sync (push + pull)", ("app",), buckets=SYNC_BUCKETS
+)
+FLUSH_TIME = metrics.REGISTRY.histogram(
+    "session_store_flush_seconds", "Write-behind flushes of one session", ("app",), buckets=SYNC_BUCKETS
+)
+STORE_BYTES = metrics.REGISTRY.counter(
+    "session_store_bytes_total", "Serialized session state moved to or from the backend", ("app", "direction")
+)
+
+# Values are compact JSON; anything bigger than this is zlib-compressed too
+COMPRESS_OVER = 512
+BLOB_REF = re.compile(rb'"\$blob":"([0-9a-f]{64})"')
+SESSION_ID = re.compile(r"^[0-9a-f]{32}$")
+# Marks which tracker a session state has been synced by
+VIEW_KEY = "_session_store_view"
+
+
+# --- Serialization --------------------------------------------------------------------------
+
+def pack(doc):
+    """Stored form of a JSON document: b"j" + JSON, or b"z" + zlib(JSON) once it's worth it"""
+    if len(doc) > COMPRESS_OVER:
+        return b"z" + zlib.compress(doc, 6)
+    return b"j" + doc
+
+
+def unpack(packed):
+    packed = bytes(packed)
+    if packed[:1] == b"z":
+        return zlib.decompress(packed[1:])
+    return packed[1:]
+
+
+def blob_refs(doc):
+    """Digests of the binary values a document refers to"""
+    return {match.decode() for match in BLOB_REF.findall(doc)}
+
+
+def decode(doc, blobs):
+    """Inverse of SessionStore._encode: JSON with {"$blob": digest} objects swapped back for bytes"""
+    def restore(obj):
+        if len(obj) == 1 and "$blob" in obj:
+            return blobs[obj["$blob"]]
+        return obj
+
+    return json.loads(doc, object_hook=restore)
+
+
+# --- Backends -------------------------------------------------------------------------------
+# A backend stores, per namespace, a version that changes on every write, a token per key naming
+# the write that last set it, the packed values and content-addressed blobs. Any object with
+# these methods can be passed to SessionStore.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    namespace TEXT PRIMARY KEY,
+    version INTEGER NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sessions_updated ON sessions (updated_at);
+CREATE TABLE IF NOT EXISTS session_values (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    token TEXT NOT NULL,
+    value BLOB NOT NULL,
+    PRIMARY KEY (namespace, key)
+);
+CREATE TABLE IF NOT EXISTS session_blobs (
+    namespace TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    data BLOB NOT NULL,
+    PRIMARY KEY (namespace, digest)
+);
+"""
+
+
+class SQLiteBackend:
+    """Single-host backend: every process pointed at the same file shares sessions"""
+
+    def __init__(self, path="session_state.db", pool_size=8):
+        self.path = path
+        self.pool_size = pool_size
+        self._pool = []
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        """Borrow a pooled connection: opening one per call would cost more than the query on every rerun.
+        Each connection is used by one thread at a time, which is all SQLite asks for"""
+        with self._lock:
+            conn = self._pool.pop() if self._pool else None
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA synchronous=NORMAL")
+        try:
+            with conn:
+                yield conn
+        except sqlite3.Error:
+            conn.close()
+            raise
+        with self._lock:
+            if len(self._pool) < self.pool_size:
+                self._pool.append(conn)
+                return
+        conn.close()
+
+    def snapshot(self, namespace):
+        """(version, {key: token}); version 0 for a namespace that was never written"""
+        with self._connect() as conn:
+            row = conn.execute("SELECT version FROM sessions WHERE namespace = ?", (namespace,)).fetchone()
+            if row is None:
+                return 0, {}
+            tokens = conn.execute("SELECT key, token FROM session_values WHERE namespace = ?", (namespace,))
+            return row[0], dict(tokens.fetchall())
+
+    def load(self, namespace, keys):
+        """{key: packed value} for the keys that exist"""
+        with self._connect() as conn:
+            rows = conn.execute(
+                f"SELECT key, value FROM session_values WHERE namespace = ? AND key IN ({','.join('?' * len(keys))})",
+                (namespace, *keys)
+            ).fetchall()
+        return {key: bytes(value) for key, value in rows}
+
+    def load_blobs(self, namespace, digests):
+        with self._connect() as conn:
+            rows = conn.execute(
+                f"SELECT digest, data FROM session_blobs WHERE namespace = ? AND digest IN ({','.join('?' * len(digests))})",
+                (namespace, *digests)
+            ).fetchall()
+        return {digest: bytes(data) for digest, data in rows}
+
+    def write(self, namespace, values, blobs, token):
+        """Apply {key: packed value or None to delete} and new blobs atomically; return the new version"""
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO sessions (namespace, version, updated_at) VALUES (?, 1, ?) "
+                "ON CONFLICT (namespace) DO UPDATE SET version = version + 1, updated_at = excluded.updated_at",
+                (namespace, time.time())
+            )
+            conn.executemany(
+                "INSERT OR IGNORE INTO session_blobs (namespace, digest, data) VALUES (?, ?, ?)",
+                [(namespace, digest, data) for digest, data in blobs.items()]
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO session_values (namespace, key, token, value) VALUES (?, ?, ?, ?)",
+                [(namespace, key, token, value) for key, value in values.items() if value is not None]
+            )
+            conn.executemany(
+                "DELETE FROM session_values WHERE namespace = ? AND key = ?",
+                [(namespace, key) for key, value in values.items() if value is None]
+            )
+            return conn.execute("SELECT version FROM sessions WHERE namespace = ?", (namespace,)).fetchone()[0]
+
+    def delete(self, namespace):
+        with self._connect() as conn:
+            for table in ("sessions", "session_values", "session_blobs"):
+                conn.execute(f"DELETE FROM {table} WHERE namespace = ?", (namespace,))
+
+    def purge(self, ttl):
+        """Drop sessions nobody has written to for `ttl` seconds; returns how many"""
+        with self._connect() as conn:
+            expired = [row[0] for row in conn.execute(
+                "SELECT namespace FROM sessions WHERE updated_at < ?", (time.time() - ttl,)
+            )]
+            for table in ("sessions", "session_values", "session_blobs"):
+                conn.executemany(f"DELETE FROM {table} WHERE namespace = ?", [(ns,) for ns in expired])
+        return len(expired)
+
+
+class RedisError(Exception):
+    """Error reply from the server"""
+
+
+class RedisConnection:
+    """Just enough of a RESP2 client for the session store: pipelined commands over one socket"""
+
+    def __init__(self, host, port, password=None, username=None, db=0, timeout=5.0):
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.reader = self.sock.makefile("rb")
+        setup = []
+        if password:
+            setup.append(("AUTH", username, password) if username else ("AUTH", password))
+        if db:
+            setup.append(("SELECT", db))
+        if setup:
+            self.pipeline(setup)
+
+    @staticmethod
+    def _encode(command):
+        parts = [b"*%d\r\n" % len(command)]
+        for arg in command:
+            if isinstance(arg, str):
+                arg = arg.encode()
+            elif isinstance(arg, int):
+                arg = str(arg).encode()
+            parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+        return b"".join(parts)
+
+    def _read(self):
+        line = self.reader.readline()
+        if not line:
+            raise ConnectionError("Redis closed the connection")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest.decode()
+        if kind == b"-":
+            return RedisError(rest.decode())
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            size = int(rest)
+            return None if size < 0 else self.reader.read(size + 2)[:-2]
+        if kind == b"*":
+            size = int(rest)
+            return None if size < 0 else [self._read() for _ in range(size)]
+        raise ConnectionError(f"Unexpected reply from Redis: {line[:40]!r}")
+
+    def pipeline(self, commands):
+        """Send every command in one write, then read the replies in order"""
+        self.sock.sendall(b"".join(self._encode(command) for command in commands))
+        replies = [self._read() for _ in commands]
+        for reply in replies:
+            if isinstance(reply, RedisError):
+                raise reply
+        return replies
+
+    def close(self):
+        self.reader.close()
+        self.sock.close()
+
+
+class RedisBackend:
+    """Multi-host backend for redis:// URLs; sessions expire through Redis's own key TTLs"""
+
+    def __init__(self, url, ttl=7 * 86400, prefix="st", pool_size=16):
+        parsed = urlparse(url)
+        self.options = {
+            "host": parsed.hostname or "127.0.0.1",
+            "port": parsed.port or 6379,
+            "username": unquote(parsed.username) if parsed.username else None,
+            "password": unquote(parsed.password) if parsed.password else None,
+            "db": int(parsed.path.lstrip("/") or 0)
+        }
+        self.ttl = int(ttl)
+        self.prefix = prefix
+        self.pool_size = pool_size
+        self._pool = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _connection(self):
+        """Borrow a pooled connection; one that failed mid-command is discarded, not reused"""
+        with self._lock:
+            conn = self._pool.pop() if self._pool else None
+        if conn is None:
+            conn = RedisConnection(**self.options)
+        try:
+            yield conn
+        except (OSError, ConnectionError):
+            conn.close()
+            raise
+        with self._lock:
+            if len(self._pool) < self.pool_size:
+                self._pool.append(conn)
+                return
+        conn.close()
+
+    def _execute(self, *commands):
+        with self._connection() as conn:
+            return conn.pipeline(commands)
+
+    def _keys(self, namespace):
+        base = f"{self.prefix}:{namespace}"
+        return f"{base}:meta", f"{base}:data", f"{base}:blobs"
+
+    def snapshot(self, namespace):
+        meta, _, _ = self._keys(namespace)
+        fields = self._execute(("HGETALL", meta))[0]
+        tokens = {fields[i].decode(): fields[i + 1].decode() for i in range(0, len(fields), 2)}
+        return int(tokens.pop("_version", 0)), tokens
+
+    def load(self, namespace, keys):
+        _, data, _ = self._keys(namespace)
+        values = self._execute(("HMGET", data, *keys))[0]
+        return {key: value for key, value in zip(keys, values) if value is not None}
+
+    def load_blobs(self, namespace, digests):
+        _, _, blobs = self._keys(namespace)
+        digests = list(digests)
+        values = self._execute(("HMGET", blobs, *digests))[0]
+        return {digest: value for digest, value in zip(digests, values) if value is not None}
+
+    def write(self, namespace, values, blobs, token):
+        """One MULTI/EXEC round trip, so readers never see a version without its values"""
+        meta, data, blob_key = self._keys(namespace)
+        updated = [item for key, value in values.items() if value is not None for item in (key, value)]
+        deleted = [key for key, value in values.items() if value is None]
+        commands = [("MULTI",), ("HINCRBY", meta, "_version", 1)]
+        if updated:
+            commands.append(("HSET", data, *updated))
+            commands.append(("HSET", meta, *[item for key in updated[::2] for item in (key, token)]))
+        if deleted:
+            commands.append(("HDEL", data, *deleted))
+            commands.append(("HDEL", meta, *deleted))
+        if blobs:
+            commands.append(("HSET", blob_key, *[item for pair in blobs.items() for item in pair]))
+        commands.extend(("EXPIRE", key, self.ttl) for key in (meta, data, blob_key))
+        commands.append(("EXEC",))
+        results = self._execute(*commands)[-1]
+        for result in results:
+            if isinstance(result, RedisError):
+                raise result
+        return results[0]
+
+    def delete(self, namespace):
+        self._execute(("DEL", *self._keys(namespace)))
+
+    def purge(self, ttl):
+        # Expiry is handled by the server
+        return 0
+
+
+# --- Store ----------------------------------------------------------------------------------
+
+class _Tracker:
+    """What one browser session last read from or wrote to the backend"""
+
+    def __init__(self, app, namespace):
+        self.app = app
+        self.namespace = namespace
+        self.lock = threading.Lock()
+        self.keys = ()
+        self.version = None      # Backend version this copy is known to be current with
+        self.tokens = {}         # key -> token of the write our copy came from
+        self.docs = {}           # key -> JSON as last loaded or queued, to spot changes
+        self.pending = {}        # key -> packed value (None = delete) awaiting the flusher
+        self.pending_blobs = {}  # digest -> bytes awaiting the flusher
+        self.known_blobs = set()
+        self.blob_ids = {}       # id(bytes) -> (bytes, digest), so large values are hashed once
+        self.seen_ids = set()
+        self.touched = time.monotonic()
+        self.view = uuid.uuid4().hex
+
+
+class SessionStore:
+    """Per-key sync of selected session state keys, with write-behind flushing on a background thread
+
+    At the top of each rerun, sync() queues whatever the previous run changed and then reloads
+    only the keys another process has written since; save() queues a run's changes at its end.
+    Both run on the script thread, so the state is never read while the script is changing it;
+    the flusher only writes what they queued, every `flush_interval` seconds.
+    """
+
+    def __init__(self, backend, flush_interval=0.5, ttl=7 * 86400, idle_timeout=900):
+        self.backend = backend
+        self.flush_interval = flush_interval
+        self.ttl = ttl
+        self.idle_timeout = idle_timeout
+        self._trackers = {}
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._warned = set()
+        self._flusher = threading.Thread(target=self._run, name="session-store-flusher", daemon=True)
+        self._flusher.start()
+        atexit.register(self.close)
+
+    def _warn(self, message):
+        """Print each distinct problem once rather than on every rerun"""
+        if message not in self._warned:
+            self._warned.add(message)
+            print(f"Session store: {message}", file=sys.stderr)
+
+    def _encode(self, tracker, value):
+        """Compact JSON, with bytes moved out to content-addressed blobs"""
+        def default(obj):
+            if isinstance(obj, (bytes, bytearray, memoryview)):
+                tracker.seen_ids.add(id(obj))
+                cached = tracker.blob_ids.get(id(obj))
+                if cached is not None and cached[0] is obj:
+                    digest = cached[1]
+                else:
+                    data = bytes(obj)
+                    digest = hashlib.sha256(data).hexdigest()
+                    tracker.blob_ids[id(obj)] = (obj, digest)
+                    if digest not in tracker.known_blobs:
+                        tracker.pending_blobs[digest] = data
+                return {"$blob": digest}
+            raise TypeError(f"{type(obj).__name__} values can't be stored")
+
+        return json.dumps(value, separators=(",", ":"), ensure_ascii=False, default=default).encode()
+
+    def _capture(self, tracker, values):
+        """Queue keys whose value differs from what we last loaded or queued"""
+        tracker.seen_ids = set()
+        complete = True
+        for key in tracker.keys:
+            if key not in values:
+                if key in tracker.docs:
+                    del tracker.docs[key]
+                    tracker.pending[key] = None
+                continue
+            try:
+                doc = self._encode(tracker, values[key])
+            except (TypeError, ValueError) as e:
+                self._warn(f"not persisting {tracker.app}.{key}: {e}")
+                complete = False
+                continue
+            if tracker.docs.get(key) != doc:
+                tracker.docs[key] = doc
+                tracker.pending[key] = pack(doc)
+        if complete:
+            # Forget bytes the state no longer holds, so they can be freed
+            tracker.blob_ids = {ident: entry for ident, entry in tracker.blob_ids.items() if ident in tracker.seen_ids}
+
+    def _pull(self, tracker, state):
+        """Reload the keys another process has changed since our copy was current"""
+        version, tokens = self.backend.snapshot(tracker.namespace)
+        if version == tracker.version:
+            return
+        stale = [
+            key for key in tracker.keys
+            if key not in tracker.pending and tokens.get(key) != tracker.tokens.get(key)
+        ]
+        loaded = self.backend.load(tracker.namespace, stale) if stale else {}
+        docs = {key: unpack(packed) for key, packed in loaded.items()}
+        # Only fetch the blobs we don't already hold, e.g. just the newest image of a gallery
+        blobs = {digest: obj for obj, digest in tracker.blob_ids.values()}
+        missing = set().union(*map(blob_refs, docs.values())) - set(blobs)
+        if missing:
+            fetched = self.backend.load_blobs(tracker.namespace, missing)
+            for digest, data in fetched.items():
+                tracker.blob_ids[id(data)] = (data, digest)
+            tracker.known_blobs.update(fetched)
+            blobs.update(fetched)
+
+        for key in stale:
+            if key in docs:
+                state[key] = decode(docs[key], blobs)
+                tracker.docs[key] = docs[key]
+                tracker.tokens[key] = tokens[key]
+                STORE_BYTES.inc(len(loaded[key]), app=tracker.app, direction="read")
+            elif key in tracker.tokens:
+                # Deleted elsewhere
+                tracker.tokens.pop(key)
+                tracker.docs.pop(key, None)
+                if key in state:
+                    del state[key]
+        tracker.version = version
+
+    def sync(self, app, namespace, keys, state, session=None):
+        """Call at the top of a rerun: queue the last run's changes, then pick up other replicas' writes
+
+        `state` is st.session_state (or any mapping); `session` tells apart browser tabs sharing a
+        namespace in one process, so each keeps its own view of what's current.
+        """
+        started = time.perf_counter()
+        tracker_key = (namespace, session)
+        with self._lock:
+            tracker = self._trackers.get(tracker_key)
+            if tracker is None:
+                tracker = self._trackers[tracker_key] = _Tracker(app, namespace)
+        with tracker.lock:
+            if VIEW_KEY not in state or state[VIEW_KEY] != tracker.view:
+                # State we haven't synced before under this session (e.g. a reconnect): it holds none of what we loaded
+                tracker.version, tracker.tokens, tracker.docs = None, {}, {}
+                state[VIEW_KEY] = tracker.view
+            tracker.keys = tuple(keys)
+            tracker.touched = time.monotonic()
+            if tracker.version is not None:
+                self._capture(tracker, {key: state[key] for key in tracker.keys if key in state})
+            self._pull(tracker, state)
+        SYNC_TIME.observe(time.perf_counter() - started, app=app)
+
+    def save(self, namespace, state, session=None):
+        """Call at the end of a run, from the script thread: queue what the run changed since sync()"""
+        with self._lock:
+            tracker = self._trackers.get((namespace, session))
+        if tracker is None:
+            return
+        with tracker.lock:
+            if tracker.version is not None and VIEW_KEY in state and state[VIEW_KEY] == tracker.view:
+                self._capture(tracker, {key: state[key] for key in tracker.keys if key in state})
+                tracker.touched = time.monotonic()
+
+    def _write(self, tracker):
+        """Write the tracker's queued changes; call with tracker.lock held"""
+        if not tracker.pending:
+            return
+        values, blobs = tracker.pending, tracker.pending_blobs
+        token = uuid.uuid4().hex[:16]
+        started = time.perf_counter()
+        version = self.backend.write(tracker.namespace, values, blobs, token)
+        FLUSH_TIME.observe(time.perf_counter() - started, app=tracker.app)
+        STORE_BYTES.inc(
+            sum(len(value) for value in values.values() if value) + sum(len(data) for data in blobs.values()),
+            app=tracker.app, direction="write"
+        )
+        tracker.pending, tracker.pending_blobs = {}, {}
+        tracker.known_blobs.update(blobs)
+        for key, value in values.items():
+            if value is None:
+                tracker.tokens.pop(key, None)
+            else:
+                tracker.tokens[key] = token
+        # Only skip the next reload if nobody else wrote between our last look and this write
+        if tracker.version is not None and version == tracker.version + 1:
+            tracker.version = version
+
+    def flush(self):
+        """Write every session's queued changes now"""
+        now = time.monotonic()
+        with self._lock:
+            trackers = list(self._trackers.items())
+        for tracker_key, tracker in trackers:
+            with tracker.lock:
+                if tracker.version is None:
+                    continue
+                try:
+                    self._write(tracker)
+                except Exception as e:
+                    # Keep the queue and retry on the next tick
+                    self._warn(f"flush failed, will retry: {e}")
+                    continue
+                if now - tracker.touched > self.idle_timeout:
+                    with self._lock:
+                        self._trackers.pop(tracker_key, None)
+
+    def _run(self):
+        last_purge = 0.0
+        while not self._stopping.wait(self.flush_interval):
+            self.flush()
+            if time.monotonic() - last_purge > 600:
+                last_purge = time.monotonic()
+                try:
+                    self.backend.purge(self.ttl)
+                except Exception as e:
+                    self._warn(f"purge failed: {e}")
+
+    def close(self):
+        """Stop the flusher after writing whatever is still queued"""
+        if not self._stopping.is_set():
+            self._stopping.set()
+            self.flush()
+
+
+def create_store(url, ttl=7 * 86400, flush_interval=0.5):
+    """SessionStore for a sqlite:///path or redis://[user:password@]host[:port][/db] URL"""
+    if url.startswith("sqlite:///"):
+        return SessionStore(SQLiteBackend(url[len("sqlite:///"):]), flush_interval=flush_interval, ttl=ttl)
+    if url.startswith(("redis://", "rediss://")):
+        if url.startswith("rediss://"):
+            raise ValueError("TLS (rediss://) isn't supported; use a local TLS tunnel and redis://")
+        return SessionStore(RedisBackend(url, ttl=ttl), flush_interval=flush_interval, ttl=ttl)
+    raise ValueError(f"Unsupported SESSION_STORE_URL: {url}")
+
+
+_store_lock = threading.Lock()
+_store = None
+_store_configured = False
+
+
+def get_session_store():
+    """Process-wide store from SESSION_STORE_URL, or None when it's set to "none" """
+    global _store, _store_configured
+    if not _store_configured:
+        with _store_lock:
+            if not _store_configured:
+                url = os.getenv("SESSION_STORE_URL", "sqlite:///session_state.db")
+                if url.lower() != "none":
+                    _store = create_store(
+                        url,
+                        ttl=float(os.getenv("SESSION_TTL", str(7 * 86400))),
+                        flush_interval=float(os.getenv("SESSION_FLUSH_INTERVAL", "0.5"))
+                    )
+                _store_configured = True
+    return _store
+
+
+def persist_session_state(app, keys):
+    """Keep these st.session_state keys in the shared store; call near the top of every rerun
+
+    The session is identified by a `sid` query parameter, so reloading the page, a restarted
+    server or a different replica behind the load balancer all pick up where the user left off.
+    The sid is the only credential: anyone with the URL gets the session, so don't share it.
+    Pair with save_session_state() at the end of the script. Returns the session id.
+    """
+    import streamlit as st
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+    sid = st.query_params.get("sid", "")
+    if not SESSION_ID.match(sid):
+        sid = uuid.uuid4().hex
+        st.query_params["sid"] = sid
+
+    store = get_session_store()
+    ctx = get_script_run_ctx()
+    if store is None or ctx is None:
+        return sid
+    try:
+        store.sync(app, f"{app}:{sid}", keys, ctx.session_state, session=ctx.session_id)
+    except Exception as e:
+        # An unreachable store mustn't take the app down; the session just isn't shared meanwhile
+        store._warn(f"sync failed, using local state: {e}")
+    return sid
+
+
+def save_session_state(app):
+    """Queue what this run changed in the persisted keys; call at the end of the script
+
+    A run that ends in st.rerun() or st.stop() skips this, and the next run's sync() catches it.
+    """
+    import streamlit as st
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+    sid = st.query_params.get("sid", "")
+    store = get_session_store()
+    ctx = get_script_run_ctx()
+    if store is None or ctx is None or not SESSION_ID.match(sid):
+        return
+    try:
+        store.save(f"{app}:{sid}", ctx.session_state, session=ctx.session_id)
+    except Exception as e:
+        store._warn(f"save failed, will retry on the next run: {e}")
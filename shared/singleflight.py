@@ -0,0 +1,102 @@
+# In-flight request coalescing: concurrent identical calls share one upstream request
+import hashlib
+import json
+import threading
+from collections import defaultdict
+
+from shared import metrics
+
+
+def _canonical_default(value):
+    """JSON fallback: hash raw bytes (e.g. audio) instead of embedding them"""
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return {"sha256": hashlib.sha256(value).hexdigest()}
+    return repr(value)
+
+
+def request_key(namespace, payload):
+    """Canonical hash of a request: same payload, same key, regardless of dict ordering"""
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=_canonical_default)
+    return f"{namespace}:{hashlib.sha256(canonical.encode()).hexdigest()}"
+
+
+def _fresh_error(error):
+    """A new exception of the same type and contents, so each waiting thread raises its own object"""
+    fresh = type(error).__new__(type(error))
+    fresh.__dict__.update(error.__dict__)
+    fresh.args = error.args
+    return fresh
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Runs at most one call per key at a time; callers arriving meanwhile wait for its result"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._stats = defaultdict(lambda: {"calls": 0, "upstream": 0, "coalesced": 0})
+
+    def do(self, namespace, payload, fn, *args, **kwargs):
+        """Return fn(*args, **kwargs), sharing the call with identical in-flight requests"""
+        key = request_key(namespace, payload)
+        with self._lock:
+            stats = self._stats[namespace]
+            stats["calls"] += 1
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                stats["upstream"] += 1
+            else:
+                stats["coalesced"] += 1
+        metrics.record_cache(f"singleflight:{namespace}", hit=not leader)
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                # Raising the leader's object in several threads at once would interleave its traceback
+                raise _fresh_error(call.error) from call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            # Later requests start a fresh call; this only merges requests that overlap in time
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stats(self):
+        """Per-namespace counters: calls made, upstream requests sent and calls coalesced"""
+        with self._lock:
+            return {namespace: dict(counts) for namespace, counts in self._stats.items()}
+
+
+_singleflight = SingleFlight()
+
+
+def _collect():
+    samples = {}
+    for namespace, counts in _singleflight.stats().items():
+        for kind, value in counts.items():
+            samples[(("app", metrics.get_app()), ("namespace", namespace), ("kind", kind))] = value
+    yield "singleflight_requests_total", "counter", "Single-flight calls by namespace: calls, upstream and coalesced", samples
+
+
+metrics.REGISTRY.add_collector(_collect)
+
+
+def get_singleflight():
+    """Return the process-wide group so requests coalesce across Streamlit sessions"""
+    return _singleflight
@@ -0,0 +1,41 @@
+# One-time process setup for the Streamlit apps, kept off the per-rerun path
+import threading
+from pathlib import Path
+
+from shared import metrics
+from shared.openai_client import prewarm
+
+_lock = threading.Lock()
+_started = set()
+
+
+def find_dotenv(script_path):
+    """Nearest .env in the app's folder or above it, as a plain load_dotenv() call would find"""
+    for directory in Path(script_path).resolve().parents:
+        candidate = directory / ".env"
+        if candidate.is_file():
+            return candidate
+    return None
+
+
+def _setup_process(script_path):
+    """Load .env, start the metrics endpoint and warm up the OpenAI client"""
+    from dotenv import load_dotenv
+
+    dotenv_path = find_dotenv(script_path)
+    if dotenv_path:
+        load_dotenv(dotenv_path)
+    metrics.start_metrics_server()
+    prewarm()
+
+
+def start_app(name, script_path):
+    """Call at the top of an app script on every rerun; everything but the labelling runs once per process"""
+    metrics.set_app(name)
+    # A plain set lookup: even an st.cache_resource hit costs more than the setup it would skip
+    if script_path in _started:
+        return
+    with _lock:
+        if script_path not in _started:
+            _setup_process(script_path)
+            _started.add(script_path)
@@ -0,0 +1,33 @@
+# Shared fixtures: the repo root and app folders on sys.path, and the local OpenAI/Redis stand-ins
+import sys
+from pathlib import Path
+
+import pytest
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+for path in (REPO_ROOT, REPO_ROOT / "STT", REPO_ROOT / "Image_gen"):
+    if str(path) not in sys.path:
+        sys.path.insert(0, str(path))
+
+from shared.mock_openai import MockOpenAIServer  # noqa: E402
+from shared.mock_redis import MockRedisServer  # noqa: E402
+
+
+@pytest.fixture
+def mock_openai():
+    """Mock OpenAI server with the shared client pointed at it; tests tweak `server.config` as needed"""
+    from shared.openai_client import configure
+
+    server = MockOpenAIServer(latency=0.0, token_delay=0.0, batch_latency=0.2)
+    server.start()
+    # Retries are the scheduler's job, not the SDK's
+    configure(api_key="mock", base_url=server.url, max_retries=0)
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def mock_redis():
+    server = MockRedisServer().start()
+    yield server
+    server.stop()
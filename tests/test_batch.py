@@ -0,0 +1,89 @@
+# Batch API pipeline in shared/batch.py against the mock server's files and batches endpoints
+import json
+
+import pytest
+
+from shared import batch
+from shared.batch import BatchPipeline, ResultStore, cached_result, custom_id, shard
+
+
+def chat(text, model="gpt-4o-mini"):
+    return ("chat", {"model": model, "messages": [{"role": "user", "content": text}]})
+
+
+@pytest.fixture
+def pipeline(mock_openai, tmp_path):
+    return BatchPipeline(ResultStore(str(tmp_path / "results.db")), work_dir=tmp_path / "work", poll_interval=0.05)
+
+
+def test_shards_respect_request_and_byte_limits():
+    lines = [b"x" * 10 + b"\n"] * 7
+    assert [len(group) for group in shard(lines, max_requests=3)] == [3, 3, 1]
+    assert [len(group) for group in shard(lines, max_bytes=25)] == [2, 2, 2, 1]
+
+
+def test_custom_id_is_stable_and_namespaced():
+    namespace, body = chat("hi")
+    assert custom_id(namespace, body) == custom_id(namespace, json.loads(json.dumps(body)))
+    assert custom_id(namespace, body).startswith("chat:")
+    assert custom_id(namespace, body) != custom_id("translation", body)
+
+
+def test_run_collects_every_result_and_sends_duplicates_once(pipeline, mock_openai):
+    requests = [chat("one"), chat("two"), chat("one")]
+    results = list(pipeline.run(requests))
+    assert sorted(key for key, body, error in results) == sorted({custom_id(*request) for request in requests})
+    assert all(error is None and body["choices"] for key, body, error in results)
+    assert all(pipeline.store.get(custom_id(*request)) for request in requests)
+    # A second run finds everything answered and submits nothing
+    assert list(pipeline.run(requests)) == []
+    assert pipeline.store.open_batches() == {}
+
+
+def test_failed_lines_are_stored_as_errors(pipeline, mock_openai):
+    mock_openai.config["batch_error_rate"] = 1.0
+    ((key, body, error),) = list(pipeline.run([chat("doomed")]))
+    assert body is None and error
+    assert pipeline.store.get(key) is None
+    # Failures are retried by the next run
+    mock_openai.config["batch_error_rate"] = 0.0
+    ((key, body, error),) = list(pipeline.run([chat("doomed")]))
+    assert error is None and pipeline.store.get(key) == body
+
+
+def test_resume_skips_submitted_requests_even_without_shard_files(pipeline, mock_openai):
+    requests = [chat("one"), chat("two")]
+    assert list(pipeline.run(requests, wait=False)) == []
+    assert len(pipeline.store.in_flight()) == 2
+    for path in pipeline.work_dir.iterdir():
+        path.unlink()
+
+    results = list(pipeline.run(requests + [chat("three")]))
+    assert len(results) == 3
+    # Two batches in all: the resumed one and one for the new request only
+    assert len(mock_openai.batches) == 2
+    assert pipeline.store.in_flight() == set()
+
+
+def test_cached_result_prefers_the_requests_own_model(tmp_path, monkeypatch):
+    monkeypatch.setattr(batch, "_store", ResultStore(str(tmp_path / "results.db")))
+    namespace, body = chat("hi", model="gpt-4o")
+    other = {**body, "model": "gpt-4o-mini"}
+    batch._store.put(custom_id(namespace, other), namespace, body={"model": "gpt-4o-mini"})
+    assert cached_result(namespace, body) is None
+    assert cached_result(namespace, body, models=["gpt-4o-mini"]) == {"model": "gpt-4o-mini"}
+    batch._store.put(custom_id(namespace, body), namespace, body={"model": "gpt-4o"})
+    assert cached_result(namespace, body, models=["gpt-4o-mini"]) == {"model": "gpt-4o"}
+
+
+def test_cached_result_doesnt_create_a_store(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delenv("BATCH_RESULTS_DB", raising=False)
+    monkeypatch.setattr(batch, "_store", None)
+    assert cached_result(*chat("hi")) is None
+    assert not (tmp_path / "batch_results.db").exists()
+
+    # Once a batch script has written one, the apps use it
+    namespace, body = chat("hi")
+    ResultStore("batch_results.db").put(custom_id(namespace, body), namespace, body={"ok": True})
+    assert cached_result(namespace, body) == {"ok": True}
@@ -0,0 +1,143 @@
+# Leases and failure handling of the image job queue in Image_gen/job_queue.py
+import threading
+import time
+
+import pytest
+
+from job_queue import DONE, FAILED, RUNNING, JobQueue
+
+
+def image(n=1):
+    return [{"prompt": f"image {i}", "image_data": bytes([i]) * 10} for i in range(n)]
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+def status(queue, job_id):
+    with queue._connect() as conn:
+        return dict(conn.execute("SELECT status, owner, error FROM jobs WHERE id = ?", (job_id,)).fetchone())
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "image_jobs.db")
+
+
+@pytest.fixture
+def queues():
+    started = []
+    yield started
+    for queue in started:
+        queue.stop(timeout=2)
+
+
+def start(queues, db_path, handler, **options):
+    queue = JobQueue(db_path=db_path, handler=handler, poll_interval=0.05, **options)
+    queues.append(queue)
+    return queue
+
+
+def test_a_second_process_doesnt_rerun_a_running_job(queues, db_path):
+    calls = []
+    release = threading.Event()
+
+    def handler(prompt, **params):
+        calls.append(prompt)
+        release.wait(5)
+        return image()
+
+    first = start(queues, db_path, handler)
+    job_id = first.submit("session", "a cat")
+    assert wait_for(lambda: calls)
+    # Another app process starting up on the same job table
+    second = start(queues, db_path, handler)
+    time.sleep(0.3)
+    release.set()
+    assert wait_for(lambda: status(first, job_id)["status"] == DONE)
+    assert calls == ["a cat"]
+    assert all(worker.is_alive() for queue in queues for worker in queue._workers)
+    images, failures = second.collect("session")
+    assert [entry["prompt"] for entry in images] == ["image 0"] and failures == []
+
+
+def test_stale_leases_are_taken_over(queues, db_path):
+    dead = start(queues, db_path, lambda prompt, **params: image(), workers=0, lease=0.3)
+    job_id = dead.submit("session", "a dog")
+    # A worker of a process that died mid-job: claimed, then never renewed
+    assert dead._claim_next()["id"] == job_id
+    dead.stop()
+
+    survivor = start(queues, db_path, lambda prompt, **params: image(2), lease=0.3)
+    assert wait_for(lambda: status(survivor, job_id)["status"] == DONE)
+    assert status(survivor, job_id)["owner"] == survivor.owner
+    assert len(survivor.collect("session")[0]) == 2
+
+
+def test_live_leases_are_renewed(queues, db_path):
+    release = threading.Event()
+
+    def slow(prompt, **params):
+        release.wait(5)
+        return image()
+
+    owner = start(queues, db_path, slow, lease=0.3)
+    job_id = owner.submit("session", "slow")
+    assert wait_for(lambda: status(owner, job_id)["status"] == RUNNING)
+    other = start(queues, db_path, slow, lease=0.3)
+    time.sleep(1.0)  # several lease periods
+    assert status(other, job_id)["owner"] == owner.owner
+    release.set()
+    assert wait_for(lambda: status(owner, job_id)["status"] == DONE)
+
+
+def test_a_worker_that_lost_its_lease_drops_its_result(queues, db_path):
+    queue = start(queues, db_path, lambda prompt, **params: image(), workers=0)
+    job_id = queue.submit("session", "taken")
+    queue._claim_next()
+    with queue._connect() as conn:
+        conn.execute("UPDATE jobs SET owner = 'someone-else' WHERE id = ?", (job_id,))
+    assert queue._finish(job_id, image()) is False
+    assert status(queue, job_id)["status"] == RUNNING
+    assert queue.collect("session") == ([], [])
+
+
+def test_handler_and_storage_errors_dont_kill_workers(queues, db_path):
+    def handler(prompt, **params):
+        if prompt == "raise":
+            raise RuntimeError("content policy")
+        if prompt == "unstorable":
+            return [{"prompt": "x", "image_data": object()}]
+        return image()
+
+    queue = start(queues, db_path, handler, workers=1)
+    failing = queue.submit("session", "raise")
+    unstorable = queue.submit("session", "unstorable")
+    fine = queue.submit("session", "fine")
+    assert wait_for(lambda: status(queue, fine)["status"] == DONE)
+    assert status(queue, failing) == {"status": FAILED, "owner": queue.owner, "error": "RuntimeError: content policy"}
+    assert status(queue, unstorable)["status"] == FAILED
+    assert status(queue, unstorable)["error"].startswith("Storing the result failed")
+    assert queue._workers[0].is_alive()
+    images, failures = queue.collect("session")
+    assert len(images) == 1 and len(failures) == 2
+
+
+def test_outstanding_keeps_jobs_another_host_queued(queues, db_path, tmp_path):
+    queue = start(queues, db_path, lambda prompt, **params: image())
+    mine = queue.submit("session", "here")
+    # A replica on another host, with its own job table, queued this one for the same session
+    other_host = start(queues, str(tmp_path / "other_host.db"), lambda prompt, **params: image(), workers=0)
+    theirs = other_host.submit("session", "there")
+
+    assert queue.outstanding([mine, theirs]) == ([mine, theirs], [theirs])
+    assert wait_for(lambda: status(queue, mine)["status"] == DONE)
+    queue.collect("session")
+    assert queue.outstanding([mine, theirs]) == ([theirs], [theirs])
+    assert queue.outstanding([]) == ([], [])
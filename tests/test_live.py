@@ -0,0 +1,138 @@
+# Voice-activity segmentation and the live transcriber in STT/live.py
+import io
+import threading
+
+import numpy as np
+import pytest
+
+import live
+from live import SAMPLE_RATE, LiveTranscriber, VoiceActivitySegmenter, read_wav, replay, resample, to_mono_float, wav_bytes
+
+
+def tone(seconds, freq=300, level=0.3, rate=SAMPLE_RATE):
+    return (level * np.sin(2 * np.pi * freq * np.arange(int(seconds * rate)) / rate)).astype(np.float32)
+
+
+def silence(seconds, rate=SAMPLE_RATE):
+    return np.zeros(int(seconds * rate), np.float32)
+
+
+def utterances(*spans):
+    """Alternating silence and voice-band tone, e.g. utterances(0.5, 1.0, 1.0, 0.8, 1.0)"""
+    parts = [tone(seconds) if index % 2 else silence(seconds) for index, seconds in enumerate(spans)]
+    return np.concatenate(parts)
+
+
+def segment(samples, chunk=320, **options):
+    segmenter = VoiceActivitySegmenter(**options)
+    found = []
+    for offset in range(0, len(samples), chunk):
+        found += segmenter.feed(samples[offset:offset + chunk])
+    return found + segmenter.flush()
+
+
+def test_two_utterances_are_cut_at_the_pause():
+    found = segment(utterances(0.5, 1.0, 1.0, 0.8, 1.0))
+    assert len(found) == 2
+    first, second = found
+    # Pre-roll and trailing silence pad each utterance a little
+    assert first["start"] == pytest.approx(0.3, abs=0.1)
+    assert first["end"] == pytest.approx(1.7, abs=0.15)
+    assert second["start"] == pytest.approx(2.3, abs=0.1)
+    assert len(second["audio"]) == pytest.approx((second["end"] - second["start"]) * SAMPLE_RATE, abs=1)
+
+
+def test_chunk_size_doesnt_change_the_segments():
+    samples = utterances(0.5, 1.0, 1.0, 0.8, 1.0)
+    by_chunk = [[(s["start"], s["end"]) for s in segment(samples, chunk)] for chunk in (160, 480, 4000)]
+    assert by_chunk[0] == by_chunk[1] == by_chunk[2]
+
+
+def test_hum_and_short_clicks_are_not_speech():
+    hum = tone(2.0, freq=50, level=0.5)
+    assert segment(hum) == []
+    click = np.concatenate([silence(0.5), tone(0.06), silence(1.0)])
+    assert segment(click) == []
+
+
+def test_speech_at_the_end_of_the_stream_is_flushed():
+    found = segment(np.concatenate([silence(0.3), tone(0.8)]))
+    assert len(found) == 1
+
+
+def test_long_speech_is_split_at_the_maximum_length():
+    found = segment(tone(5.0), max_segment_s=2.0)
+    assert len(found) >= 2
+    assert all(s["end"] - s["start"] <= 2.0 + 1e-6 for s in found)
+
+
+def test_pcm_conversions():
+    assert to_mono_float(np.array([-32768, 0, 16384], "<i2")).tolist() == [-1.0, 0.0, 0.5]
+    assert to_mono_float(np.array([0, 128, 255], np.uint8))[1] == 0.0
+    assert to_mono_float(np.array([0.2, 0.4, 0.6, 0.8], np.float32), channels=2).tolist() == pytest.approx([0.3, 0.7])
+    assert len(resample(np.zeros(48000, np.float32), 48000)) == SAMPLE_RATE
+
+
+def test_wav_round_trip():
+    samples, rate, channels = read_wav(io.BytesIO(wav_bytes(tone(0.5))))
+    assert (rate, channels, len(samples)) == (SAMPLE_RATE, 1, SAMPLE_RATE // 2)
+    assert np.allclose(to_mono_float(samples), tone(0.5), atol=1e-3)
+
+
+def test_transcriber_drains_in_stream_order():
+    release_first = threading.Event()
+    second_done = threading.Event()
+
+    def transcribe(wav, prompt=None):
+        # The first (longer) utterance finishes after the second
+        if len(wav) > 1.2 * SAMPLE_RATE * 2:
+            release_first.wait(5)
+            return "first"
+        second_done.set()
+        return "second"
+
+    transcriber = LiveTranscriber(transcribe=transcribe, workers=2)
+    replay(transcriber, utterances(0.5, 1.2, 1.0, 0.6, 1.0), SAMPLE_RATE)
+    assert second_done.wait(5)
+    # The second is done, but it isn't handed out ahead of the first
+    assert transcriber.drain() == []
+    assert transcriber.pending() == 1
+    release_first.set()
+    transcriber.wait(5)
+    assert [entry["text"] for entry in transcriber.drain()] == ["first", "second"]
+    assert transcriber.drain() == []
+    assert transcriber.pending() == 0
+    transcriber.close()
+
+
+def test_errors_are_kept_on_the_entry():
+    def failing(wav, prompt=None):
+        raise RuntimeError("whisper down")
+
+    transcriber = LiveTranscriber(transcribe=failing)
+    replay(transcriber, utterances(0.5, 1.0, 1.0), SAMPLE_RATE)
+    transcriber.wait(5)
+    (entry,) = transcriber.drain()
+    assert entry["error"] == "whisper down" and entry["text"] is None
+    transcriber.close()
+
+
+def test_replayed_clips_are_not_recorded_as_live_latency():
+    before = len(live.SEGMENT_LATENCY.recent())
+    transcriber = LiveTranscriber(transcribe=lambda wav, prompt=None: "x", live=False)
+    replay(transcriber, utterances(0.5, 1.0, 1.0), SAMPLE_RATE)
+    transcriber.wait(5)
+    assert len(transcriber.drain()) == 1
+    assert len(live.SEGMENT_LATENCY.recent()) == before
+    transcriber.close()
+
+
+def test_transcribes_against_the_mock(mock_openai):
+    transcriber = LiveTranscriber()
+    replay(transcriber, utterances(0.5, 1.0, 1.0, 0.8, 1.0), SAMPLE_RATE)
+    transcriber.wait(10)
+    entries = transcriber.drain()
+    assert len(entries) == 2
+    assert all(entry["error"] is None and entry["text"] for entry in entries)
+    assert mock_openai.snapshot()["audio"]["ok"] == 2
+    transcriber.close()
@@ -0,0 +1,75 @@
+# Model choice and failover in shared/router.py
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from shared.openai_client import get_client
+from shared.router import ModelRouter, non_latin
+from shared.scheduler import get_scheduler
+from translation import LANGUAGES, translation_messages
+
+NON_LATIN_OPTIONS = {"Arabic", "Chinese (Simplified)", "Chinese (Traditional)", "Japanese", "Korean", "Russian", "Hindi"}
+
+
+@pytest.mark.parametrize("language", LANGUAGES)
+def test_every_stt_language_is_classified(language):
+    assert non_latin(language) == (language in NON_LATIN_OPTIONS)
+
+
+@pytest.mark.parametrize("language", sorted(NON_LATIN_OPTIONS))
+def test_non_latin_translations_avoid_models_without_the_multilingual_flag(language):
+    router = ModelRouter()
+    decision = router.choose("translation", translation_messages("Hello there", language), 20, language)
+    assert router.profiles[decision["model"]]["multilingual"]
+    assert decision["fallback"] is None or router.profiles[decision["fallback"]]["multilingual"]
+
+
+def test_short_latin_translations_can_use_any_model():
+    router = ModelRouter(routes={"translation": {
+        "models": ["gpt-4o", "gpt-3.5-turbo"], "latency_slo": 10.0, "max_cost": 1.0, "short_tokens": 800
+    }})
+    assert router.choose("translation", translation_messages("Hello", "French"), 20, "French")["model"] == "gpt-3.5-turbo"
+
+
+def test_slow_models_are_predicted_slower_for_every_reply_length():
+    router = ModelRouter(min_samples=3)
+    reply = SimpleNamespace(usage=SimpleNamespace(completion_tokens=10))
+    prior = router.prior("gpt-4o-mini", 10)
+    for _ in range(3):
+        router.observe("gpt-4o-mini", prior * 4, reply)
+    # Four times slower on short replies means four times slower on long ones too, not a flat p95
+    assert router.predicted_latency("gpt-4o-mini", 500, 0) == pytest.approx(router.prior("gpt-4o-mini", 500) * 4, rel=0.01)
+    # Faster than the prior never predicts less than the prior
+    router.observe("gpt-4o", 0.01, reply)
+    assert router.predicted_latency("gpt-4o", 500, 0) == pytest.approx(router.prior("gpt-4o", 500))
+
+
+def test_rate_limited_primary_pauses_the_model_and_falls_back(mock_openai):
+    profiles = {name: {"context": 8000, "multilingual": True, "first_token_s": 0.1, "per_token_s": 0.001}
+                for name in ("mock-primary", "mock-fallback")}
+    router = ModelRouter(
+        routes={"chat": {"models": ["mock-primary", "mock-fallback"], "latency_slo": 5.0, "max_cost": 1.0, "short_tokens": 10}},
+        profiles=profiles
+    )
+    messages = [{"role": "user", "content": "hi " * 20}]
+    decision = router.choose("chat", messages, 50)
+    assert (decision["model"], decision["fallback"]) == ("mock-primary", "mock-fallback")
+
+    mock_openai.config.update(rate_limit_rate=1.0, retry_after=30)
+    calls = []
+
+    def create(**kwargs):
+        calls.append(kwargs["model"])
+        if kwargs["model"] == "mock-fallback":
+            mock_openai.config["rate_limit_rate"] = 0.0
+        return get_client().chat.completions.create(**kwargs)
+
+    started = time.monotonic()
+    response = router.call(create, decision, messages=messages)
+    assert response.choices[0].message.content
+    assert calls == ["mock-primary", "mock-fallback"]
+    assert time.monotonic() - started < 5
+    # The primary got no retry, but its Retry-After still holds every other caller of it
+    assert get_scheduler().wait_estimate("mock-primary") > 20
+    assert get_scheduler().wait_estimate("mock-fallback") == 0
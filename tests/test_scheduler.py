@@ -0,0 +1,142 @@
+# Token buckets, priority ordering, Retry-After parsing and retries in shared/scheduler.py
+import threading
+import time
+from types import SimpleNamespace
+
+import openai
+import pytest
+
+from shared.openai_client import get_client
+from shared.scheduler import BATCH, INTERACTIVE, RequestScheduler, TokenBucket, retry_after
+
+
+def error_with_headers(**headers):
+    return SimpleNamespace(response=SimpleNamespace(headers=headers))
+
+
+def test_token_bucket_waits_for_refill():
+    bucket = TokenBucket(60)  # one token a second
+    now = bucket.updated
+    bucket.consume(60, now)
+    assert bucket.wait_time(1, now) == pytest.approx(1.0)
+    assert bucket.wait_time(1, now + 0.5) == pytest.approx(0.5)
+    bucket.refund(10)
+    assert bucket.wait_time(1, now + 0.5) == 0.0
+
+
+def test_token_bucket_caps_oversized_requests_at_capacity():
+    bucket = TokenBucket(60)
+    now = bucket.updated
+    bucket.drain(now)
+    # More than the bucket holds waits for a full bucket rather than forever
+    assert bucket.wait_time(1000, now) == pytest.approx(60.0)
+
+
+@pytest.mark.parametrize("headers, expected", [
+    ({"retry-after-ms": "1500"}, 1.5),
+    ({"retry-after": "2"}, 2.0),
+    ({"retry-after": "not a date"}, None),
+    ({"retry-after": "Mon, 32 Foo 2024 99:99:99 GMT"}, None),
+    ({"retry-after-ms": "soon", "retry-after": "3"}, 3.0),
+    ({}, None)
+])
+def test_retry_after(headers, expected):
+    assert retry_after(error_with_headers(**headers)) == expected
+
+
+def test_retry_after_http_date():
+    from email.utils import formatdate
+
+    delay = retry_after(error_with_headers(**{"retry-after": formatdate(time.time() + 30, usegmt=True)}))
+    assert 28 <= delay <= 31
+    assert retry_after(error_with_headers(**{"retry-after": formatdate(time.time() - 30, usegmt=True)})) == 0.0
+
+
+def test_interactive_calls_go_before_queued_batch_calls():
+    scheduler = RequestScheduler(limits={"m": {"rpm": 60}})
+    scheduler._back_off("m", 0.3)  # hold the model while the queue builds up
+    order = []
+
+    def call(name, priority):
+        scheduler.call(lambda model: order.append(name), model="m", priority=priority)
+
+    threads = [threading.Thread(target=call, args=(f"batch-{i}", BATCH)) for i in range(3)]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.02)
+    interactive = threading.Thread(target=call, args=("interactive", INTERACTIVE))
+    interactive.start()
+    threads.append(interactive)
+    for thread in threads:
+        thread.join(10)
+    assert order[0] == "interactive"
+    assert order[1:] == ["batch-0", "batch-1", "batch-2"]
+
+
+def test_set_limits_keeps_the_other_budget():
+    scheduler = RequestScheduler(limits={"m": {"rpm": 100, "tpm": 1000}})
+    scheduler.set_limits("m", tpm=5000)
+    assert scheduler.limits["m"] == {"rpm": 100, "tpm": 5000}
+
+
+def test_failed_attempt_refunds_its_tokens():
+    scheduler = RequestScheduler(limits={"m": {"tpm": 600}})
+
+    def fail(model):
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError):
+        scheduler.call(fail, model="m", tokens=500)
+    assert scheduler.wait_estimate("m", 600) == 0.0
+
+
+def test_retries_server_errors_against_the_mock(mock_openai):
+    mock_openai.config["error_rate"] = 1.0
+    scheduler = RequestScheduler(max_retries=2, base_delay=0.01)
+    create = get_client().chat.completions.create
+    with pytest.raises(openai.InternalServerError):
+        scheduler.call(create, model="gpt-4o-mini", messages=[{"role": "user", "content": "hi"}])
+    assert mock_openai.snapshot()["chat"]["errors"] == 3
+
+    mock_openai.config["error_rate"] = 0.0
+    response = scheduler.call(create, model="gpt-4o-mini", messages=[{"role": "user", "content": "hi"}])
+    assert response.choices[0].message.content
+
+
+def test_rate_limit_pauses_the_whole_model(mock_openai):
+    mock_openai.config.update(rate_limit_rate=1.0, retry_after=0.5)
+    scheduler = RequestScheduler(max_retries=1, base_delay=0.01, max_delay=0.05)
+    create = get_client().chat.completions.create
+    waited = []
+
+    def other_caller():
+        # Arrives while the first call is backing off: it's held by the Retry-After too
+        time.sleep(0.1)
+        started = time.monotonic()
+        scheduler.call(lambda model: None, model="gpt-4o-mini")
+        waited.append(time.monotonic() - started)
+
+    thread = threading.Thread(target=other_caller)
+    thread.start()
+    with pytest.raises(openai.RateLimitError):
+        scheduler.call(create, model="gpt-4o-mini", messages=[{"role": "user", "content": "hi"}])
+    thread.join(10)
+    assert waited[0] >= 0.3
+
+
+def test_non_idempotent_timeouts_are_not_retried(mock_openai):
+    import httpx
+
+    calls = []
+
+    def timing_out(model):
+        calls.append(model)
+        raise openai.APITimeoutError(request=httpx.Request("POST", mock_openai.url))
+
+    scheduler = RequestScheduler(max_retries=3, base_delay=0.01)
+    with pytest.raises(openai.APITimeoutError):
+        scheduler.call(timing_out, model="dall-e-3", idempotent=False)
+    assert len(calls) == 1
+    with pytest.raises(openai.APITimeoutError):
+        scheduler.call(timing_out, model="dall-e-3")
+    assert len(calls) == 5
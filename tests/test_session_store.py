@@ -0,0 +1,126 @@
+# Sync and write-behind flushing between replicas in shared/session_store.py, on SQLite and Redis
+import pytest
+
+from shared.session_store import VIEW_KEY, RedisBackend, SessionStore, SQLiteBackend
+
+KEYS = ("messages", "count", "images")
+
+
+@pytest.fixture(params=["sqlite", "redis"])
+def backend_factory(request, tmp_path):
+    """Builds backends that all point at the same storage, one per simulated replica"""
+    if request.param == "sqlite":
+        return lambda: SQLiteBackend(str(tmp_path / "session_state.db"))
+    redis = request.getfixturevalue("mock_redis")
+    return lambda: RedisBackend(redis.url)
+
+
+@pytest.fixture
+def replicas(backend_factory):
+    """Two stores as two app processes would have them; the flushers only run when a test flushes"""
+    stores = [SessionStore(backend_factory(), flush_interval=3600) for _ in range(2)]
+    yield stores
+    for store in stores:
+        store.close()
+
+
+def run(store, state, session="tab", namespace="app:sid"):
+    store.sync("app", namespace, KEYS, state, session=session)
+    return state
+
+
+def finish(store, state, namespace="app:sid", **values):
+    """End a run that set `values`, the way the apps do, and flush"""
+    state.update(values)
+    store.save(namespace, state, session="tab")
+    store.flush()
+    return state
+
+
+def user_state(state):
+    return {key: value for key, value in state.items() if key != VIEW_KEY}
+
+
+def test_saved_changes_reach_another_replica(replicas):
+    a, b = replicas
+    state = run(a, {})
+    state["messages"] = [{"role": "user", "content": "hi"}]
+    state["count"] = 1
+    a.save("app:sid", state, session="tab")
+    a.flush()
+    assert user_state(run(b, {})) == {"messages": [{"role": "user", "content": "hi"}], "count": 1}
+
+
+def test_next_sync_catches_changes_without_save(replicas):
+    a, b = replicas
+    state = run(a, {})
+    state["count"] = 5
+    # A run that ended in st.rerun() never called save(); the next run's sync queues it
+    run(a, state)
+    a.flush()
+    assert run(b, {})["count"] == 5
+
+
+def test_flush_never_reads_the_live_state(replicas):
+    a, b = replicas
+    state = run(a, {})
+    state["count"] = 1
+    a.flush()
+    assert "count" not in run(b, {})
+
+
+def test_only_keys_written_elsewhere_are_reloaded(replicas):
+    a, b = replicas
+    state_a = finish(a, run(a, {}), messages=["one"], count=1)
+    state_b = finish(b, run(b, {}), count=2)
+
+    state_a["messages"] = ["one", "two"]  # changed locally, not yet flushed
+    run(a, state_a)
+    assert state_a["count"] == 2
+    # The local change isn't clobbered by the reload, and is written on the next flush
+    assert state_a["messages"] == ["one", "two"]
+    a.flush()
+    assert run(b, state_b)["messages"] == ["one", "two"]
+
+
+def test_deletes_propagate(replicas):
+    a, b = replicas
+    state_a = finish(a, run(a, {}), count=1)
+    state_b = run(b, {})
+    assert state_b["count"] == 1
+    del state_a["count"]
+    a.save("app:sid", state_a, session="tab")
+    a.flush()
+    assert "count" not in run(b, state_b)
+
+
+def test_bytes_round_trip_as_shared_blobs(replicas):
+    a, b = replicas
+    image = bytes(range(256)) * 100
+    state = run(a, {})
+    state["images"] = [{"prompt": "cat", "image_data": image}, {"prompt": "same cat", "image_data": image}]
+    a.save("app:sid", state, session="tab")
+    a.flush()
+    tracker = a._trackers[("app:sid", "tab")]
+    assert len(tracker.known_blobs) == 1
+    loaded = run(b, {})["images"]
+    assert [entry["image_data"] for entry in loaded] == [image, image]
+    assert [entry["prompt"] for entry in loaded] == ["cat", "same cat"]
+
+
+def test_unserialisable_values_are_skipped(replicas, capsys):
+    a, b = replicas
+    state = run(a, {})
+    state["count"] = 3
+    state["messages"] = object()
+    a.save("app:sid", state, session="tab")
+    a.flush()
+    assert user_state(run(b, {})) == {"count": 3}
+    assert "not persisting app.messages" in capsys.readouterr().err
+
+
+def test_sessions_and_namespaces_are_separate(replicas):
+    a, b = replicas
+    finish(a, run(a, {}, namespace="app:one"), namespace="app:one", count=1)
+    assert "count" not in run(b, {}, namespace="app:two")
+    assert run(b, {}, namespace="app:one")["count"] == 1
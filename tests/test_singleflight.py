@@ -0,0 +1,88 @@
+# In-flight coalescing and error fan-out in shared/singleflight.py
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import openai
+
+from shared.openai_client import get_client
+from shared.singleflight import SingleFlight, request_key
+
+
+def test_request_key_ignores_dict_order_and_hashes_bytes():
+    assert request_key("ns", {"a": 1, "b": [1, 2]}) == request_key("ns", {"b": [1, 2], "a": 1})
+    assert request_key("ns", {"a": 1}) != request_key("other", {"a": 1})
+    assert request_key("ns", {"audio": b"x" * 10}) != request_key("ns", {"audio": b"y" * 10})
+
+
+def run_concurrently(group, payload, fn, callers=5):
+    """Start `callers` identical calls and let them all join before fn returns"""
+    with ThreadPoolExecutor(callers) as pool:
+        futures = [pool.submit(group.do, "ns", payload, fn) for _ in range(callers)]
+        return [future.exception() or future.result() for future in futures]
+
+
+def test_concurrent_identical_calls_share_one_upstream_call():
+    group = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        release.wait(5)
+        return "reply"
+
+    timer = threading.Timer(0.2, release.set)
+    timer.start()
+    results = run_concurrently(group, {"q": 1}, slow)
+    assert results == ["reply"] * 5
+    assert len(calls) == 1
+    assert group.stats()["ns"] == {"calls": 5, "upstream": 1, "coalesced": 4}
+
+
+def test_later_calls_start_a_fresh_upstream_call():
+    group = SingleFlight()
+    calls = []
+    for _ in range(3):
+        group.do("ns", {"q": 1}, lambda: calls.append(1))
+    assert len(calls) == 3
+
+
+def test_every_caller_raises_its_own_exception():
+    group = SingleFlight()
+    release = threading.Event()
+
+    def failing():
+        release.wait(5)
+        raise ValueError("upstream failed")
+
+    timer = threading.Timer(0.2, release.set)
+    timer.start()
+    errors = run_concurrently(group, {"q": 1}, failing)
+    assert all(isinstance(error, ValueError) and str(error) == "upstream failed" for error in errors)
+    assert len({id(error) for error in errors}) == len(errors)
+    # Followers chain the leader's error as the cause
+    assert sum(error.__cause__ is not None for error in errors) == len(errors) - 1
+
+
+def test_api_errors_fan_out_against_the_mock(mock_openai):
+    mock_openai.config.update(error_rate=1.0, latency=0.2)
+    group = SingleFlight()
+    request = {"model": "gpt-4o-mini", "messages": [{"role": "user", "content": "hi"}]}
+    errors = run_concurrently(group, request, lambda: get_client().chat.completions.create(**request), callers=4)
+    assert all(isinstance(error, openai.InternalServerError) for error in errors)
+    assert mock_openai.snapshot()["chat"]["errors"] < 4
+
+
+def test_base_exceptions_reach_followers():
+    group = SingleFlight()
+    release = threading.Event()
+
+    def interrupted():
+        release.wait(5)
+        raise KeyboardInterrupt
+
+    timer = threading.Timer(0.2, release.set)
+    timer.start()
+    errors = run_concurrently(group, {"q": 1}, interrupted, callers=3)
+    assert all(isinstance(error, KeyboardInterrupt) for error in errors)
+